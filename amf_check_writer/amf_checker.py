@@ -4,59 +4,55 @@ relevant YAML checks for AMF datasets.
 """
 from __future__ import print_function
 import os
-import subprocess
 import sys
-import re
 import argparse
+from collections import deque, OrderedDict
+from contextlib import redirect_stdout, nullcontext
+from concurrent.futures.process import BrokenProcessPool
 
-from netCDF4 import Dataset
+from amf_check_writer.deployment_modes import DeploymentModes
+from amf_check_writer.filenames import (FILENAME_REGEX,
+                                        FILENAME_FORMAT_HUMAN_READABLE,
+                                        get_product_from_filename,
+                                        NameVocabularies, triage_names)
+from amf_check_writer.check_runner import (SuiteLoader, FileResult, run_file,
+                                           write_report, file_result_to_dict,
+                                           CHECK_FAMILIES)
+from amf_check_writer.config import get_default_checks_dir
+from amf_check_writer.header_reader import (read_global_attributes, read_headers,
+                                            prefetch_headers,
+                                            DEFAULT_HEADER_THREADS,
+                                            DEFAULT_PREFETCH_DEPTH)
+from amf_check_writer.result_cache import ResultCache
+from amf_check_writer.discovery import (add_discovery_arguments,
+                                        iter_datasets_from_args,
+                                        read_file_list)
+from amf_check_writer.sharding import add_shard_argument, get_shard
+from amf_check_writer.watcher import (get_watcher, watch_directories,
+                                      DEFAULT_SETTLE_SECONDS,
+                                      DEFAULT_POLL_INTERVAL)
+from amf_check_writer.result_sinks import JsonLinesSink
+from amf_check_writer.timings import TimingsSink
+from amf_check_writer.results_db import ResultsDatabase
+from amf_check_writer.worker_pool import WorkerPool, DEFAULT_MAX_FILES_PER_WORKER
+from amf_check_writer.archives import STDIN, get_size, read_members
 
-import cchecker
-from amf_check_writer.spreadsheet_handler import DeploymentModes
-from amf_check_writer.config import DEFAULT_AMF_CHECKS_DIR
 
+# Maximum number of files to check in a single compliance-checker run
+DEFAULT_BATCH_SIZE = 50
 
-# Regex to match filenames and extract product name
-FILENAME_REGEX = re.compile(
-    r"^([^\s_]+_){2}"                 # <instrument>_<platform>_
-    r"(\d{4}(\d{2})?(\d{2})?|\d{8}(-\d{2})?(\d{2})?(\d{2})?)_"
-                                      # Valid options:
-                                      # <YYYY>
-                                      # <YYYY><MM>
-                                      # <YYYY><MM><DD>
-                                      # <YYYY><MM><DD>-<HH>
-                                      # <YYYY><MM><DD>-<HH><mm>
-                                      # <YYYY><MM><DD>-<HH><mm><ss>
-    r"(?P<product>[a-zA-Z0-9][^\s_]+)_"  # data product
-    r"([a-zA-Z0-9][^\s_]*_)*"            # optional: <option1>_<option2>_...<optionN>_
-    r"v\d+(\.\d+)?"                   # version: vN[.M]
-    r"\.nc$"                          # .nc extension
-)
 
-
-# The above regex in a human readable form, used in error messages. MAKE SURE
-# IT MATCHES THE REGEX!
-FILENAME_FORMAT_HUMAN_READABLE = (
-    "<instrument_name>_<platform_name>_<YYYY><MM><DD>-<HH><mm><SS>_<data_product>_[<option1>_<option2>_...<optionN>_]v<version>.nc"
-)
-
-
-def get_product_from_filename(path):
+def get_shard_group(path):
     """
-    Calculate the product name from a dataset filename
-    :param path: path to dataset
-    :return:     product name as a string
-
-    :raises ValueError: if filename does not match the expected regex
+    Return the key used to keep related files in the same shard when
+    splitting files between nodes (see `sharding`). This is the product name,
+    which is known without opening the file. Files with invalid names are
+    grouped together
     """
-    fname = os.path.basename(path)
-    match = FILENAME_REGEX.match(fname)
-    if not match:
-        raise ValueError(
-            "Filename '{}' does not match expected format '{}'"
-            .format(fname, FILENAME_FORMAT_HUMAN_READABLE)
-        )
-    return match.group("product")
+    try:
+        return get_product_from_filename(path)
+    except ValueError:
+        return ""
 
 
 def get_deployment_mode(path):
@@ -65,12 +61,24 @@ def get_deployment_mode(path):
     :param path: path to dataset
     :return:     Mode as a value from `DeploymentModes` enumeration
     :raises ValueError: if mode cannot be determined or is invalid
+    :raises OSError:    if the file cannot be read
+    """
+    return get_deployment_mode_from_attrs(path, read_global_attributes(path))
+
+
+def get_deployment_mode_from_attrs(path, attrs):
+    """
+    Work out the 'deployment mode' from global attributes already read from a
+    NetCDF file (see `header_reader`)
+    :param path:  path to dataset (used in error messages)
+    :param attrs: dict of global attributes
+    :return:      Mode as a value from `DeploymentModes` enumeration
+    :raises ValueError: if mode cannot be determined or is invalid
     """
     fname = os.path.basename(path)
-    d = Dataset(path)
     try:
-        mode_str = d.deployment_mode
-    except AttributeError:
+        mode_str = attrs["deployment_mode"]
+    except KeyError:
         raise ValueError(f"Attribute 'deployment_mode' not found in '{fname}'")
 
     for mode in DeploymentModes:
@@ -84,18 +92,496 @@ def _get_extension(fmt="text"):
     return fmt.split("_")[0].replace("text", "txt")
 
 
+def identify_datasets(paths, header_threads=DEFAULT_HEADER_THREADS,
+                      products=None):
+    """
+    Work out the data product and deployment mode for each dataset. Files with
+    invalid names or unknown products are reported as soon as they are seen,
+    without being opened
+    :param paths:          iterable of paths to datasets
+    :param header_threads: number of files to read global attributes from at
+                           once
+    :param products:       if given, the set of data products that have
+                           checks (see `SuiteLoader.get_products`)
+    :return:               iterator of (path, product, mode, error) tuples.
+                           If the product or mode could not be determined,
+                           error is a message explaining why and product/mode
+                           may be None
+    """
+    invalid = deque()
+
+    def named_paths():
+        for path in paths:
+            try:
+                product = get_product_from_filename(path)
+            except ValueError as ex:
+                invalid.append((path, None, str(ex)))
+                continue
+            if products is not None and product not in products:
+                invalid.append((path, product, f"Unknown data product "
+                                               f"'{product}' in "
+                                               f"'{os.path.basename(path)}': "
+                                               f"no checks found for it"))
+                continue
+            yield path
+
+    for path, attrs in read_headers(named_paths(), threads=header_threads):
+        while invalid:
+            path_, product, error = invalid.popleft()
+            yield path_, product, None, error
+
+        product = get_product_from_filename(path)
+        try:
+            if isinstance(attrs, OSError):
+                raise ValueError(f"Cannot read '{path}': {attrs}")
+            mode = get_deployment_mode_from_attrs(path, attrs)
+        except ValueError as ex:
+            yield path, product, None, str(ex)
+            continue
+
+        yield path, product, mode, None
+
+    while invalid:
+        path, product, error = invalid.popleft()
+        yield path, product, None, error
+
+
+def _iter_grouped(paths, header_threads=DEFAULT_HEADER_THREADS, products=None):
+    """
+    As `identify_datasets`, but skip files whose product or mode cannot be
+    determined with a warning
+    :return: iterator of (product, mode, path) tuples
+    """
+    for path, product, mode, error in identify_datasets(paths, header_threads,
+                                                        products):
+        if error:
+            print(f"[WARNING] {error}", file=sys.stderr)
+            continue
+        yield product, mode, path
+
+
+def _make_tasks(grouped, batch_size):
+    """
+    Collect files into tasks to be run by compliance-checker. Each task
+    contains up to `batch_size` files with the same data product and
+    deployment mode, so the check suite is only loaded once per task. Full
+    tasks are yielded as soon as they are ready, so checking can start before
+    all files have been found; the remaining partial tasks are yielded at the
+    end in the order their group was first seen
+    :param grouped:    iterator of (product, mode, path) tuples
+    :param batch_size: maximum number of files in each task
+    :return:           iterator of (product, mode, fnames) tuples
+    """
+    pending = {}
+
+    for product, mode, fname in grouped:
+        key = (product, mode)
+        batch = pending.setdefault(key, [])
+        batch.append(fname)
+
+        if len(batch) >= batch_size:
+            yield product, mode, batch
+            pending[key] = []
+
+    for (product, mode), batch in pending.items():
+        if batch:
+            yield product, mode, batch
+
+
+_SUITE_LOADERS = {}
+
+
+def get_suite_loader(yaml_dir, version, cvs_dir=None, scan_data=False):
+    """
+    Return a `SuiteLoader` for a directory of YAML checks. Loaders are shared
+    between calls, so each suite is only loaded once per process
+    :param cvs_dir:   if given, run the checks with the native engine using
+                      the JSON CVs in this directory (see `native_checks`)
+                      instead of compliance-check-lib
+    :param scan_data: if True, also check data values against the valid range
+                      of each variable. Requires `cvs_dir`
+    """
+    key = (os.path.abspath(yaml_dir), version,
+           cvs_dir and os.path.abspath(cvs_dir), scan_data)
+    if key not in _SUITE_LOADERS:
+        if cvs_dir:
+            # The native engine needs numpy, so is only imported if used
+            from amf_check_writer.native_checks import NativeSuiteLoader
+            _SUITE_LOADERS[key] = NativeSuiteLoader(yaml_dir, version, cvs_dir,
+                                                    scan_data=scan_data)
+        else:
+            _SUITE_LOADERS[key] = SuiteLoader(yaml_dir, version)
+    return _SUITE_LOADERS[key]
+
+
+def check_files(paths, version, yaml_dir=None,
+                criteria="normal", header_threads=DEFAULT_HEADER_THREADS,
+                timings=False, min_level=None, fail_fast=False, select=None,
+                cvs_dir=None, scan_data=False):
+    """
+    Run the AMF checks against datasets in this process. Check suites are
+    loaded once and reused between calls. Results are not printed (problems
+    loading the check suites, such as an invalid suite manifest or rule
+    pack, are reported as warnings on stderr), and `sys.argv`/`sys.exit` are
+    not used, so this can be used as a library
+    :param paths:          iterable of paths to datasets (directories and
+                           archives are not searched: see
+                           `discovery.iter_datasets`)
+    :param version:        version of the checks, e.g. 'v2.0'
+    :param yaml_dir:       directory containing the YAML checks. Default:
+                           installed in the 'site-packages' directory
+    :param criteria:       'strict', 'normal' or 'lenient' (as for
+                           compliance-checker)
+    :param header_threads: number of files to read global attributes from at
+                           once
+    :param timings:        if True, record the time taken by each check in the
+                           results' `timings`
+    :param min_level:      if given, only run checks at this level ('HIGH',
+                           'MEDIUM' or 'LOW') or above
+    :param fail_fast:      if True, stop checking each file at its first HIGH
+                           level failure
+    :param select:         if given, only run checks in these families or
+                           matching these check ID glob patterns (see
+                           `check_runner.CHECK_FAMILIES`)
+    :param cvs_dir:        if given, run the metadata checks natively using
+                           the JSON CVs in this directory instead of
+                           compliance-check-lib (see `native_checks`)
+    :param scan_data:      if True, also check the data in each variable
+                           against its valid range. Requires `cvs_dir`
+    :return:               iterator of `FileResult` tuples. Files that cannot
+                           be checked have `error` set
+    """
+    loader = get_suite_loader(yaml_dir or get_default_checks_dir(), version,
+                              cvs_dir, scan_data)
+
+    for path, product, mode, error in identify_datasets(paths, header_threads,
+                                                        loader.get_products()):
+        if error:
+            yield FileResult(path, product, mode, None, False, [], {}, error)
+            continue
+
+        try:
+            yield run_file(loader, path, product, mode, criteria=criteria,
+                           timings=timings, min_level=min_level,
+                           fail_fast=fail_fast, select=select)
+        except (ValueError, OSError) as ex:
+            yield FileResult(path, product, mode, None, False, [], {}, str(ex))
+
+
+def _get_output_paths(args, fnames):
+    if not args.output_dir or not args.report_format:
+        return []
+
+    ext = _get_extension(args.report_format)
+    return [os.path.join(args.output_dir, f"{os.path.basename(fname)}.cc-output.{ext}")
+            for fname in fnames]
+
+
+def _run_task(yaml_dir, version, loader_options, product, mode, fnames,
+              output_format, output_paths, run_options, prefetch_depth=0):
+    """
+    Check a batch of files for the same product and deployment mode, and
+    produce the compliance-checker report for them
+    :param loader_options: dict of keyword arguments for `get_suite_loader`
+                           (see `_get_loader_options`)
+    :param output_format:  compliance-checker report format, or None to skip
+                           producing reports
+    :param output_paths:   list of paths to write a report to for each file,
+                           or an empty list to return a combined report
+                           instead
+    :param run_options:    dict of keyword arguments for `run_file` (see
+                           `_get_run_options`)
+    :param prefetch_depth: number of files ahead of the one being checked to
+                           prefetch the headers of (see
+                           `header_reader.prefetch_headers`)
+    :return:               tuple (results, report), where results is a list
+                           of `FileResult` tuples and report is the combined
+                           report (an empty string if written to
+                           `output_paths`)
+    """
+    loader = get_suite_loader(yaml_dir, version, **loader_options)
+    results = []
+    raw_results = OrderedDict()
+
+    for fname, prefetch in prefetch_headers(fnames, prefetch_depth):
+        raw = []
+        try:
+            result = run_file(loader, fname, product, mode, raw_results=raw,
+                              **run_options)
+        except (ValueError, OSError) as ex:
+            result = FileResult(str(fname), product, mode, None, False, [], {},
+                                str(ex))
+        else:
+            raw_results[fname] = raw
+            if result.timings is not None and prefetch is not None:
+                timings = dict(result.timings, prefetch=prefetch._asdict())
+                result = result._replace(timings=timings)
+        results.append(result)
+
+    suite = loader.get_suite_name(product, mode)
+    if not output_format:
+        return results, ""
+    if output_paths:
+        for fname, output_path in zip(fnames, output_paths):
+            if fname in raw_results:
+                write_report(suite, {fname: raw_results[fname]}, output_format,
+                             output_path)
+        return results, ""
+
+    report = write_report(suite, raw_results, output_format) if raw_results else ""
+    return results, report
+
+
+def _get_run_options(args):
+    """
+    Return the options for running the checks on each file from the command
+    line arguments, as keyword arguments for `run_file`
+    """
+    return {"timings": bool(args.timings), "min_level": args.min_level,
+            "fail_fast": args.fail_fast, "select": args.checks}
+
+
+def _get_loader_options(args):
+    """
+    Return the options for loading the checks from the command line
+    arguments, as keyword arguments for `get_suite_loader`
+    """
+    if args.engine != "native":
+        return {}
+    return {"cvs_dir": args.cvs_dir, "scan_data": args.scan_data}
+
+
+def _get_products(args):
+    """
+    Return the set of data products with checks, from the suite manifest, or
+    None if there is no manifest
+    """
+    return get_suite_loader(args.yaml_dir, args.checks_version_number,
+                            **_get_loader_options(args)).get_products()
+
+
+def _get_check_selection(args):
+    """
+    Return the options that change which checks are run, which must be part
+    of the cache key. Options left at their defaults are omitted
+    """
+    options = {name: value for name, value in _get_run_options(args).items()
+               if value and name != "timings"}
+    if args.engine == "native":
+        options["engine"] = args.engine
+        if args.scan_data:
+            options["scan_data"] = True
+    return options
+
+
+def _get_exit_code(results):
+    """
+    Return an exit code for a list of `FileResult` tuples, as for
+    compliance-checker: 0 if all passed, 1 if any failed and 2 if there were
+    errors running the checks
+    """
+    if any(r.error or r.errors for r in results):
+        return 2
+    if not all(r.passed for r in results):
+        return 1
+    return 0
+
+
+def _print_errors(results):
+    for result in results:
+        if result.error:
+            print(f"[WARNING] {result.error}", file=sys.stderr)
+        for check_id, msg in result.errors.items():
+            print(f"[WARNING] Error running '{check_id}' on "
+                  f"'{result.path}': {msg}", file=sys.stderr)
+
+
+def _run_tasks(args, tasks, pool=None):
+    """
+    Run the checks for each task, in worker processes if `pool` is given
+    :param args:  parsed command line arguments
+    :param tasks: iterable of tasks as returned by `_make_tasks`
+    :param pool:  `WorkerPool` to run the tasks in, or None to run them in
+                  this process
+    :return:      iterator of (fnames, output_paths, results, report) tuples,
+                  in the same order as `tasks` (see `_run_task`)
+    """
+    if pool is None:
+        for product, mode, fnames in tasks:
+            output_paths = _get_output_paths(args, fnames)
+            print(f"[INFO] Checking {len(fnames)} files for product "
+                  f"'{product}' ({mode.value})")
+
+            results, report = _run_task(args.yaml_dir, args.checks_version_number,
+                                        _get_loader_options(args), product,
+                                        mode, fnames, args.report_format,
+                                        output_paths, _get_run_options(args),
+                                        args.prefetch_depth)
+            yield fnames, output_paths, results, report
+        return
+
+    # Keep enough tasks queued for the workers to stay busy, without reading
+    # ahead through the whole list of files
+    max_pending = pool.jobs * 4
+    pending = deque()
+
+    for product, mode, fnames in tasks:
+        output_paths = _get_output_paths(args, fnames)
+        task = pool.submit(_run_task, args.yaml_dir, args.checks_version_number,
+                           _get_loader_options(args), product, mode, fnames,
+                           args.report_format, output_paths,
+                           _get_run_options(args), args.prefetch_depth,
+                           files=len(fnames), size=_get_total_size(fnames))
+        pending.append((product, mode, fnames, output_paths, task))
+
+        if len(pending) >= max_pending:
+            yield _get_task_result(*pending.popleft())
+
+    while pending:
+        yield _get_task_result(*pending.popleft())
+
+
+def _get_task_result(product, mode, fnames, output_paths, task):
+    # Results are reported in submission order so that output is
+    # deterministic regardless of which worker finishes first
+    try:
+        results, report = task.result()
+    except (BrokenProcessPool, MemoryError) as ex:
+        if isinstance(ex, MemoryError):
+            error = f"{ex} while checking this file"
+        else:
+            error = "Worker process stopped unexpectedly while checking this file"
+        results = [FileResult(fname, product, mode, None, False, [], {}, error)
+                   for fname in fnames]
+        report = ""
+    print(f"[INFO] Checked {len(fnames)} files for product '{product}' ({mode.value})")
+    return fnames, output_paths, results, report
+
+
+def _get_total_size(fnames):
+    total = 0
+    for fname in fnames:
+        try:
+            total += get_size(fname)
+        except OSError:
+            pass
+    return total
+
+
+def _get_worker_pool(args):
+    """
+    Return a `WorkerPool` for the command line arguments, or None if the
+    checks should run in this process
+    """
+    limits = (args.max_files_per_worker, args.max_bytes_per_worker,
+              args.max_worker_memory)
+    # Use a worker process even with --jobs 1 if worker limits were asked for
+    if args.jobs == 1 and not any(limit is not None for limit in limits):
+        return None
+
+    max_files = args.max_files_per_worker
+    if max_files is None:
+        max_files = DEFAULT_MAX_FILES_PER_WORKER
+
+    print(f"[INFO] Running checks in {args.jobs} worker processes")
+    return WorkerPool(args.jobs, max_files=max_files or None,
+                      max_bytes=_mib_to_bytes(args.max_bytes_per_worker),
+                      max_memory=_mib_to_bytes(args.max_worker_memory))
+
+
+def _mib_to_bytes(value):
+    return int(value * 2 ** 20) if value else None
+
+
+class _CacheFilter(object):
+    """
+    Skip files whose cached result can be reused, printing the cached output
+    for them instead
+    """
+    def __init__(self, args, cache, sinks=()):
+        """
+        :param args:  parsed command line arguments
+        :param cache: `ResultCache` instance
+        :param sinks: `ResultSink` instances to pass reused results to
+        """
+        self.args = args
+        self.cache = cache
+        self.sinks = sinks
+        # Cache keys for the files that still need to be checked
+        self.keys = {}
+        # Highest exit code of the cached results that were reused
+        self.exit_code = 0
+        self.reused = 0
+        self.skipped = 0
+
+    def filter(self, grouped):
+        """
+        :param grouped: iterator of (product, mode, path) tuples
+        :return:        iterator of the (product, mode, path) tuples for files
+                        that need to be checked
+        """
+        args = self.args
+
+        for product, mode, fname in grouped:
+            entry = self.cache.get(fname)
+
+            if args.only_failed and (entry is None or entry.exit_code == 0):
+                self.skipped += 1
+                continue
+
+            try:
+                loader = get_suite_loader(args.yaml_dir,
+                                          args.checks_version_number,
+                                          **_get_loader_options(args))
+                key = self.cache.get_key(fname, loader.get_suite_path(product, mode),
+                                         args.checks_version_number,
+                                         str(args.report_format),
+                                         options=_get_check_selection(args),
+                                         suite_hash=loader.get_suite_hash(product, mode))
+            except (OSError, ValueError) as ex:
+                print(f"[WARNING] Cannot compute cache key: {ex}", file=sys.stderr)
+                key = None
+
+            if not args.only_failed and entry and entry.key == key:
+                print(f"[INFO] Using cached result for unchanged file '{fname}'")
+                self.exit_code = max(self.exit_code, entry.exit_code)
+                self.reused += 1
+                _write_output(args, fname, entry.output)
+                if entry.result:
+                    for sink in self.sinks:
+                        sink.write(entry.result, cached=True)
+                continue
+
+            self.keys[fname] = key
+            yield product, mode, fname
+
+
+def _write_output(args, fname, output):
+    """
+    Write compliance-checker output for a single file to the output directory,
+    or to stdout if no output directory is being used
+    """
+    if args.output_dir:
+        output_path, = _get_output_paths(args, [fname])
+        with open(output_path, "w") as f:
+            f.write(output)
+        _print_output_paths([output_path])
+    else:
+        sys.stdout.write(output)
+
+
 def main():
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument(
         "files",
-        nargs="+",
-        help="Dataset(s) to run checks against, or a directory to find "
-             "datasets in"
+        nargs="*",
+        help="Dataset(s) to run checks against, a directory to find "
+             "datasets in, or a tar or zip archive to check the datasets in "
+             "without extracting it. Use '-' to read an archive from stdin."
     )
     # Options
     parser.add_argument(
         "--yaml-dir",
-        default=DEFAULT_AMF_CHECKS_DIR,
         help="Directory containing YAML checks for AMF. "
              "Default: installed in 'site-packages' directory."
     )
@@ -109,10 +595,10 @@ def main():
         "-f", "--format",
         dest="output_format",
         default="text",
-        help="Output format. This is forwarded to compliance-checker. See "
+        help="Output format for the compliance-checker reports. See "
              "'compliance-checker --help' for the available formats. Note "
-             "you must use 'json_new' instead of 'json' if checking multiple "
-             "files",
+             "'json' produces a separate report for each file: use "
+             "'json_new' to combine several files in one report",
         choices=["text", "html", "json", "json_new"]
     )
     parser.add_argument(
@@ -121,9 +607,225 @@ def main():
         help="This should be the version number of the checks you want to "
              "use. For example, \"2.0\" for v2.0."
     )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes to run compliance-checker in. "
+             "Files are distributed across the workers and the results are "
+             "printed in the same order as a serial run. Default: 1 (run in "
+             "this process)."
+    )
+    parser.add_argument(
+        "--max-files-per-worker",
+        type=int,
+        help="Replace each worker process after it has checked this many "
+             "files, to stop memory use growing over long runs. 0 means no "
+             f"limit. Default: {DEFAULT_MAX_FILES_PER_WORKER}."
+    )
+    parser.add_argument(
+        "--max-bytes-per-worker",
+        type=float,
+        metavar="MIB",
+        help="Replace each worker process after it has checked this many "
+             "MiB of data. Default: no limit."
+    )
+    parser.add_argument(
+        "--max-worker-memory",
+        type=float,
+        metavar="MIB",
+        help="Limit the memory (address space) of each worker process to "
+             "this many MiB. Files that need more are retried once in a new "
+             "worker, then reported as errors. Default: no limit."
+    )
+    parser.add_argument(
+        "--header-threads",
+        type=int,
+        default=DEFAULT_HEADER_THREADS,
+        help="Number of files to read global attributes from at once when "
+             "grouping files by deployment mode. Default: "
+             f"{DEFAULT_HEADER_THREADS}."
+    )
+    parser.add_argument(
+        "--prefetch-depth",
+        type=int,
+        default=DEFAULT_PREFETCH_DEPTH,
+        help="Number of files ahead of the one being checked to read the "
+             "headers of in the background, so that opening files on network "
+             "filesystems overlaps with checking. This only helps when "
+             "reading a file again is slow; check the prefetch overlap in "
+             "the --timings report before using it. 0 disables prefetching. "
+             f"Default: {DEFAULT_PREFETCH_DEPTH}."
+    )
+    parser.add_argument(
+        "--cache",
+        help="Path to a results cache. Files whose contents, checks and "
+             "version have not changed since they were last checked are not "
+             "checked again: their previous output is reused. The cache is "
+             "created if it does not exist."
+    )
+    parser.add_argument(
+        "--cache-fast",
+        action="store_true",
+        help="Detect changed files using their size, modification time and "
+             "inode instead of hashing their contents."
+    )
+    parser.add_argument(
+        "--only-failed",
+        action="store_true",
+        help="Only check files that failed the last time they were checked. "
+             "Requires --cache."
+    )
+    add_discovery_arguments(parser)
+    add_shard_argument(parser)
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and check new files as they are written to the "
+             "given directories (including sub-directories). Only files "
+             "matching the AMF filename format are checked. Files already "
+             "in the directories are not checked. Stop with Ctrl-C."
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=DEFAULT_SETTLE_SECONDS,
+        help="With --watch, wait until a file has not been written to for "
+             "this many seconds before checking it. Default: "
+             f"{DEFAULT_SETTLE_SECONDS}."
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="With --watch, scan the directories periodically instead of "
+             "using inotify. Use this for network filesystems, where inotify "
+             "does not see changes made on other machines."
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Time between scans in seconds when not using inotify. Default: "
+             f"{DEFAULT_POLL_INTERVAL}."
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Maximum number of files to check in a single compliance-checker "
+             f"run. Default: {DEFAULT_BATCH_SIZE}."
+    )
+    parser.add_argument(
+        "--jsonl",
+        metavar="PATH",
+        help="Write results as JSON lines to PATH ('-' for stdout), with one "
+             "record per file and a summary record at the end. The output is "
+             "compressed if PATH ends in '.gz'. compliance-checker reports "
+             "are not produced unless --output-dir is also given."
+    )
+    parser.add_argument(
+        "--jsonl-checks",
+        action="store_true",
+        help="Also write a JSON lines record for every check."
+    )
+    parser.add_argument(
+        "--results-db",
+        metavar="PATH",
+        help="Record this run and the result of every check for each file "
+             "in an SQLite database at PATH, which is created if it does not "
+             "exist. Use 'amf-checker-history' to query it."
+    )
+    parser.add_argument(
+        "--triage-names",
+        action="store_true",
+        help="Instead of running the checks, only check that the filenames "
+             "match the AMF format and use known products, instruments and "
+             "platforms. Only the names given as arguments or in "
+             "--files-from are checked: directories are not searched and "
+             "files are never looked up or opened, so this is fast enough "
+             "for whole archives. Requires --cvs-dir with all the product, "
+             "instrument and platform CVs."
+    )
+    parser.add_argument(
+        "--cvs-dir",
+        help="Directory containing the JSON controlled vocabularies written "
+             "by 'create-cvs', for --triage-names and '--engine native'."
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["compliance-checker", "native"],
+        default="compliance-checker",
+        help="How to run the checks. 'native' runs the global attribute, "
+             "dimension, variable and file checks directly from the JSON "
+             "CVs, which is much faster. Vocabulary checks need the rule "
+             "pack written by 'create-yaml-checks', and are reported as "
+             "errors without it. Requires --cvs-dir. Default: "
+             "compliance-checker."
+    )
+    parser.add_argument(
+        "--scan-data",
+        action="store_true",
+        help="With '--engine native', also read the data in each variable "
+             "with a valid_min or valid_max in the CVs and check the values "
+             "are in range (the 'data_values' checks). Data is read in "
+             "chunks, so memory use does not depend on file size."
+    )
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="Stop checking each file at its first HIGH level failure, "
+             "running the HIGH level checks first. Use this to quickly "
+             "reject bad files: the reports do not include the checks that "
+             "were skipped."
+    )
+    parser.add_argument(
+        "--min-level",
+        choices=["HIGH", "MEDIUM", "LOW"],
+        help="Only run checks at this level or above, using the "
+             "'check_level' of each check in the YAML checks. Default: run "
+             "all checks."
+    )
+    parser.add_argument(
+        "--checks",
+        action="append",
+        metavar="FAMILY_OR_PATTERN",
+        help="Only run some of the checks: either a family of checks ("
+             f"{', '.join(CHECK_FAMILIES)}) or a glob pattern for check IDs, "
+             "e.g. 'check_*_file_size_limit'. Can be given several times to "
+             "run the checks matching any of them. Other checks are not run "
+             "at all."
+    )
+    parser.add_argument(
+        "--timings",
+        metavar="PATH",
+        help="Record the wall and CPU time taken by each file, suite and "
+             "check, and write them to PATH as JSON. Use "
+             "'amf-checker-timings' to list the slowest checks from one or "
+             "more reports."
+    )
     args = parser.parse_args(sys.argv[1:])
 
+    if not args.files and not args.files_from:
+        parser.error("No files to check: give datasets or directories, or "
+                     "use --files-from")
+    if args.files_from == STDIN and STDIN in args.files:
+        parser.error("Cannot read both the file list and an archive from stdin")
+    if args.files_from and args.files_from != "-" and not os.path.isfile(args.files_from):
+        parser.error(f"[ERROR] Cannot read file list '{args.files_from}'")
+
+    if args.triage_names:
+        if not args.cvs_dir or not os.path.isdir(args.cvs_dir):
+            parser.error("--triage-names requires the directory of JSON "
+                         "controlled vocabularies: '--cvs-dir'")
+        if args.watch or args.shard:
+            parser.error("--triage-names cannot be used with --watch or --shard")
+        if STDIN in args.files:
+            parser.error("--triage-names cannot read an archive from stdin: "
+                         "list the names with '--files-from -' instead")
+        sys.exit(_triage_names(parser, args))
+
     # Check yaml_dir exists
+    args.yaml_dir = args.yaml_dir or get_default_checks_dir()
     if not args.yaml_dir or not os.path.isdir(args.yaml_dir):
         raise ValueError("Please include directory of YAML checks as argument: '--yaml-dir'.") 
 
@@ -132,72 +834,213 @@ def main():
         raise ValueError("Please include the version number of the checks "
                          "you\'d like to use, eg. \'--version 2.0\'")
 
-    files = []
+    if args.engine == "native" and (not args.cvs_dir or not os.path.isdir(args.cvs_dir)):
+        parser.error("'--engine native' requires the directory of JSON "
+                     "controlled vocabularies: '--cvs-dir'")
+    if args.scan_data and args.engine != "native":
+        parser.error("--scan-data requires '--engine native'")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    for name in ("max_files_per_worker", "max_bytes_per_worker", "max_worker_memory"):
+        if (getattr(args, name) or 0) < 0:
+            parser.error(f"--{name.replace('_', '-')} cannot be negative")
+    if args.prefetch_depth < 0:
+        parser.error("--prefetch-depth cannot be negative")
+    if args.header_threads < 1:
+        parser.error("--header-threads must be at least 1")
+    if args.only_failed and not args.cache:
+        parser.error("--only-failed requires --cache")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    if args.watch:
+        if args.shard or args.files_from:
+            parser.error("--watch cannot be used with --shard or --files-from")
+        if not any(os.path.isdir(path) for path in args.files):
+            parser.error("--watch requires at least one directory to watch")
     for fname in args.files:
-        if os.path.isfile(fname):
-            files.append(fname)
-        elif os.path.isdir(fname):
-            # If fname is a directory, check all files within it
-            dir_contents = [os.path.join(fname, p) for p in os.listdir(fname)]
-            files += filter(os.path.isfile, dir_contents)
-        else:
+        if fname != STDIN and not os.path.exists(fname):
             parser.error(f"[ERROR] Cannot check '{fname}': no such file or directory")
 
     if args.output_dir and not os.path.isdir(args.output_dir):
         os.mkdir(args.output_dir)
 
-    # Group files by data product and deployment mode
-    groups = {}
-    for fname in files:
-        try:
-            product = get_product_from_filename(fname)
-            mode = get_deployment_mode(fname)
-        except ValueError as ex:
-            print(f"[WARNING] {ex}", file=sys.stderr)
-            continue
+    # JSON lines output replaces the compliance-checker reports unless they
+    # are being saved to an output directory
+    args.report_format = None if args.jsonl and not args.output_dir else args.output_format
 
-        key = (product, mode)
-        if key not in groups:
-            groups[key] = []
+    # Files are found, grouped and checked as a stream, so that checking can
+    # start before a large directory tree has been fully searched
+    if args.watch:
+        streams = _watch(args)
+    else:
+        # Splitting files between shards needs the whole list of files.
+        # Archive members are sized from the archive headers, and only those
+        # in this shard are read
+        paths = iter_datasets_from_args(args, read_archives=not args.shard)
+        if args.shard:
+            paths = read_members(get_shard(list(paths), *args.shard,
+                                           key=get_shard_group, get_size=get_size))
+        streams = [_iter_grouped(paths, header_threads=args.header_threads,
+                                 products=_get_products(args))]
+
+    sinks = []
+    if args.jsonl:
+        sinks.append(JsonLinesSink(args.jsonl, per_check=args.jsonl_checks))
+    if args.timings:
+        sinks.append(TimingsSink(args.timings))
+    if args.results_db:
+        results_db = ResultsDatabase(args.results_db)
+        results_db.start_run(args.checks_version_number,
+                             options=_get_check_selection(args))
+        sinks.append(results_db)
+
+    # Keep stdout clean for the JSON lines output
+    log_to_stderr = redirect_stdout(sys.stderr) if args.jsonl == "-" else nullcontext()
+    with log_to_stderr:
+        exit_code = _check(args, streams, sinks)
+
+    sys.exit(exit_code)
+
+
+def _check(args, streams, sinks):
+    """
+    Run the checks for streams of files, writing reports and passing results
+    to each sink in `sinks`
+    :param args:    parsed command line arguments
+    :param streams: iterable of iterators of (product, mode, path) tuples.
+                    Each stream is checked completely before the next one is
+                    started, and the cache and sinks are flushed in between
+    :param sinks:   list of `ResultSink` instances. They are closed once all
+                    files have been checked
+    :return:        exit code for the whole run
+    """
+    exit_code = 0
+    checked = 0
+    cache = None
+    pool = _get_worker_pool(args)
+
+    if args.cache:
+        cache = ResultCache(args.cache, fast=args.cache_fast)
+        cache_filter = _CacheFilter(args, cache, sinks)
+
+    try:
+        for grouped in streams:
+            if cache:
+                # Check each file in its own task so that each has its own
+                # exit code and output to cache
+                tasks = _make_tasks(cache_filter.filter(grouped), batch_size=1)
+            else:
+                # compliance-checker's 'json' format only supports one file per
+                # report
+                batch_size = 1 if args.report_format == "json" else args.batch_size
+                tasks = _make_tasks(grouped, batch_size=batch_size)
 
-        groups[key].append(fname)
+            for fnames, output_paths, results, report in _run_tasks(args, tasks, pool):
+                code = _get_exit_code(results)
+                exit_code = max(exit_code, code)
+                checked += len(fnames)
+                _print_errors(results)
 
-    if not groups:
+                # Reports are only written for files that could be checked
+                output_paths = [path for path, result in zip(output_paths, results)
+                                if not result.error]
+                if cache and output_paths:
+                    with open(output_paths[0]) as f:
+                        report = f.read()
+                else:
+                    sys.stdout.write(report)
+                _print_output_paths(output_paths)
+
+                result_dicts = [file_result_to_dict(r) for r in results]
+                for sink in sinks:
+                    for result in result_dicts:
+                        sink.write(result)
+
+                key = cache_filter.keys.pop(fnames[0], None) if cache else None
+                # Don't cache errors running the checks, which may be transient
+                if key and code in (0, 1):
+                    cache.put(fnames[0], key, code, report, result_dicts[0])
+
+            if cache:
+                cache.commit()
+            for sink in sinks:
+                sink.flush()
+            sys.stdout.flush()
+    finally:
+        if pool:
+            pool.shutdown()
+        if cache:
+            cache.close()
+        for sink in sinks:
+            sink.close()
+
+    if cache:
+        exit_code = max(exit_code, cache_filter.exit_code)
+        print(f"[INFO] Reused {cache_filter.reused} cached results")
+        if args.only_failed:
+            print(f"[INFO] Skipped {cache_filter.skipped} files with no failed "
+                  f"result in the cache")
+
+    if not checked and not (cache and cache_filter.reused) and not args.watch:
         print("[WARNING] Nothing to do")
-        sys.exit(0)
 
-    output_paths = []
+    return exit_code
+
 
-    for (product, mode), fnames in groups.items():
-        dep_mode = mode.value.lower()
-        yaml_check = f"product_{product}_{dep_mode}"
+def _watch(args):
+    """
+    Watch the directories given on the command line for new datasets
+    :return: iterator of streams of (product, mode, path) tuples for
+             `_check`, one for each batch of new files. Stops when
+             interrupted
+    """
+    dirs = [path for path in args.files if os.path.isdir(path)]
+    watcher = get_watcher(dirs, poll_interval=args.poll_interval,
+                          polling=args.poll)
+    print(f"[INFO] Watching {len(dirs)} directories for new files with "
+          f"{type(watcher).__name__}")
 
-        cc_args = [
-            "compliance-checker",
-            "--yaml", os.path.join(args.yaml_dir, f"AMF_{yaml_check}.yml"),
-            "--test", f"{yaml_check}_checks:{args.checks_version_number}"
-        ]
+    def accept(path):
+        return bool(FILENAME_REGEX.match(os.path.basename(path)))
 
-        cc_args += ["--format", args.output_format]
+    try:
+        for batch in watch_directories(watcher, accept=accept, settle=args.settle):
+            print(f"[INFO] Found {len(batch)} new files")
+            yield _iter_grouped(batch, header_threads=args.header_threads,
+                                products=_get_products(args))
+    except KeyboardInterrupt:
+        print("[INFO] Stopped watching")
+    finally:
+        watcher.close()
 
-        if args.output_dir:
-            ext = _get_extension(args.output_format)
 
-            for fname in fnames:
-                result_fname = f"{os.path.basename(fname)}.cc-output"
-                output_path = os.path.join(args.output_dir, f"{result_fname}.{ext}")
-                cc_args += ["--output", output_path]
-                output_paths.append(output_path)
+def _triage_names(parser, args):
+    """
+    Check the names given on the command line and in --files-from against the
+    filename format and the controlled vocabularies, and print a summary. The
+    names are used as they are: directories are not searched, and no dataset
+    or archive is looked up on disk or opened
+    :return: exit code: 0 if all names are valid, 1 otherwise
+    """
+    try:
+        vocabs = NameVocabularies.from_cvs_dir(args.cvs_dir)
+    except ValueError as ex:
+        parser.error(f"--triage-names cannot check every part of the "
+                     f"filenames: {ex}")
 
-        cc_args += fnames
-        print(f"[INFO] Running compliance-checker with arguments: \n\t{' '.join(cc_args)}")
+    names = list(args.files)
+    if args.files_from:
+        names.extend(read_file_list(args.files_from))
+    triage = triage_names(names, vocabs)
+    sys.stdout.write(triage.format_summary())
+    return 0 if triage.valid == triage.total else 1
 
-        sys.argv = cc_args
-        cchecker.main()
 
-        if output_paths:
-            op = "\n\t".join(output_paths)
-            print(f"[INFO] Output written to: \n\t{op}")
+def _print_output_paths(output_paths):
+    if output_paths:
+        op = "\n\t".join(output_paths)
+        print(f"[INFO] Output written to: \n\t{op}")
 
 
 if __name__ == "__main__":
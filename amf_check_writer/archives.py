@@ -0,0 +1,190 @@
+"""
+Read datasets from tar and zip archives, and from archives piped to stdin,
+without extracting them to disk.
+
+Each member is read into memory as it is found and represented by an
+`ArchiveMember`: a path of the form '<archive>/<member name>' that carries
+the member's contents. Members are opened as in-memory NetCDF datasets with
+`open_member`, so the rest of amf-checker can treat them like any other
+path, and the product is worked out from the member's file name as usual.
+
+Members can also be listed without reading them (`iter_archive` with
+`read=False`), taking their sizes from the archive headers, e.g. to split the
+members between shards before reading only those in one shard with
+`read_members`.
+"""
+from __future__ import print_function
+import io
+import os
+import sys
+import tarfile
+import zipfile
+import weakref
+
+
+# Extensions of files that are read as archives. tar archives may be
+# uncompressed or compressed with gzip, bzip2 or xz
+ARCHIVE_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".zip")
+
+# Path used to read an archive from stdin, and the name used for it in the
+# paths of its members
+STDIN = "-"
+STDIN_NAME = "<stdin>"
+
+_ZIP_MAGIC = b"PK\x03\x04"
+
+# Archive members in this process that are still in use, by path, so that
+# they can be found from the path of a dataset opened from memory
+_MEMBERS = weakref.WeakValueDictionary()
+
+
+class ArchiveMember(str):
+    """
+    Path to a file in an archive, holding the contents of the file. This is a
+    string so that it can be used wherever a path to a dataset is expected
+    """
+    def __new__(cls, archive, name, data, size=None):
+        """
+        :param archive: path to the archive, or `STDIN_NAME`
+        :param name:    name of the member within the archive
+        :param data:    contents of the member as bytes, or None if the member
+                        has not been read (see `read_members`)
+        :param size:    size of the member in bytes, if `data` is None
+        """
+        self = super(ArchiveMember, cls).__new__(cls, f"{archive}/{name}")
+        self.archive = archive
+        self.name = name
+        self.data = data
+        self.size = len(data) if data is not None else size
+        # Only members that have been read can be opened
+        if data is not None:
+            _MEMBERS[str(self)] = self
+        return self
+
+    def __reduce__(self):
+        # Keep the contents when members are sent to worker processes. Results
+        # are sent back with plain string paths (see `check_runner.run_file`)
+        return ArchiveMember, (self.archive, self.name, self.data, self.size)
+
+
+def is_archive(path):
+    """
+    Return True if a path given on the command line should be read as an
+    archive
+    """
+    return path == STDIN or path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def iter_archive(path, accept=None, read=True):
+    """
+    Read the files in a tar or zip archive into memory, one at a time. tar
+    archives are read as a stream, so compressed archives are only
+    decompressed once. Archives that cannot be read are reported with a
+    warning, after yielding any members read before the error
+    :param path:   path to the archive, or `STDIN` to read it from stdin
+    :param accept: if given, a function that takes the name of a member and
+                   returns whether to read it. Members that are not accepted
+                   are skipped without reading their contents
+    :param read:   if False, only list the members, with their sizes from the
+                   archive headers. Their contents are left unread (see
+                   `read_members`). Archives read from stdin cannot be read
+                   twice, so their members are always read
+    :return:       iterator of `ArchiveMember` instances
+    """
+    name = STDIN_NAME if path == STDIN else path
+    try:
+        if path == STDIN:
+            stream = sys.stdin.buffer
+            if stream.peek(len(_ZIP_MAGIC))[:len(_ZIP_MAGIC)] == _ZIP_MAGIC:
+                # Reading a zip file needs random access
+                yield from _iter_zip(name, io.BytesIO(stream.read()), accept, True)
+            else:
+                yield from _iter_tar(name, stream, accept, True)
+        elif path.lower().endswith(".zip"):
+            yield from _iter_zip(name, path, accept, read)
+        else:
+            with open(path, "rb") as f:
+                yield from _iter_tar(name, f, accept, read)
+    except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile) as ex:
+        print(f"[WARNING] Cannot read archive '{name}': {ex}", file=sys.stderr)
+
+
+def _iter_tar(name, f, accept, read):
+    with tarfile.open(fileobj=f, mode="r|*") as tar:
+        for info in tar:
+            member_name = os.path.normpath(info.name)
+            if not info.isfile() or (accept and not accept(member_name)):
+                continue
+            if read:
+                yield ArchiveMember(name, member_name, tar.extractfile(info).read())
+            else:
+                yield ArchiveMember(name, member_name, None, size=info.size)
+
+
+def _iter_zip(name, f, accept, read):
+    with zipfile.ZipFile(f) as zf:
+        for info in zf.infolist():
+            member_name = os.path.normpath(info.filename)
+            if info.is_dir() or (accept and not accept(member_name)):
+                continue
+            if read:
+                yield ArchiveMember(name, member_name, zf.read(info))
+            else:
+                yield ArchiveMember(name, member_name, None, size=info.file_size)
+
+
+def read_members(paths):
+    """
+    Read the contents of archive members listed with `iter_archive(...,
+    read=False)`. Each archive is read once, when the first of its members is
+    reached, and only the members in `paths` are read from it
+    :param paths: iterable of paths to datasets, which may include unread
+                  `ArchiveMember` instances
+    :return:      iterator of the same paths, with unread members replaced by
+                  members that have been read. The members of each archive
+                  are yielded together, in the order they are stored in the
+                  archive
+    """
+    paths = list(paths)
+    wanted = {}
+    for path in paths:
+        if isinstance(path, ArchiveMember) and path.data is None:
+            wanted.setdefault(path.archive, set()).add(path.name)
+
+    for path in paths:
+        if not isinstance(path, ArchiveMember) or path.data is not None:
+            yield path
+        elif path.archive in wanted:
+            names = wanted.pop(path.archive)
+            yield from iter_archive(path.archive, accept=names.__contains__)
+
+
+def find_member(path):
+    """
+    Return the `ArchiveMember` for a path, or None if it is not the path of
+    an archive member in use in this process
+    """
+    return _MEMBERS.get(str(path))
+
+
+def open_member(member):
+    """
+    Open an archive member as an in-memory NetCDF dataset
+    :param member: `ArchiveMember` instance
+    :return:       netCDF4 `Dataset`
+
+    :raises OSError: if the member is not a NetCDF dataset
+    """
+    from netCDF4 import Dataset
+    return Dataset(member, memory=member.data)
+
+
+def get_size(path):
+    """
+    Return the size in bytes of a dataset, which may be an archive member
+    :raises OSError: if the file does not exist
+    """
+    member = path if isinstance(path, ArchiveMember) else find_member(path)
+    if member is not None:
+        return member.size
+    return os.path.getsize(path)
@@ -0,0 +1,554 @@
+"""
+Load the YAML check suites for AMF products into compliance-checker and run
+them in-process, returning structured results instead of printed reports.
+
+compliance-checker and PyYAML are only imported when checks are loaded or
+run, so that the command line tools start quickly.
+"""
+import os
+import re
+import io
+import sys
+import glob
+import inspect
+from fnmatch import fnmatch
+from argparse import Namespace
+from collections import namedtuple, OrderedDict
+from contextlib import redirect_stdout
+
+from amf_check_writer.deployment_modes import DeploymentModes
+from amf_check_writer.timings import CheckTimer
+from amf_check_writer.archives import find_member, open_member
+from amf_check_writer.header_reader import NETCDF_LOCK
+
+
+CheckResult = namedtuple("CheckResult", ["check_id", "name", "level", "passed",
+                                         "score", "out_of", "msgs"])
+"""
+Result of a single check against a single file
+:param check_id: name of the check method (the `check_id` in the YAML check)
+:param name:     name of the result as reported by compliance-check-lib
+:param level:    check level: 'HIGH', 'MEDIUM' or 'LOW'
+:param passed:   boolean indicating whether the check passed
+:param score:    points scored
+:param out_of:   points available
+:param msgs:     list of messages explaining any failures
+"""
+
+FileResult = namedtuple("FileResult", ["path", "product", "mode", "suite",
+                                       "passed", "checks", "errors", "error",
+                                       "timings"],
+                        defaults=(None, None))
+"""
+Results of running a check suite against a single file
+:param path:    path to the dataset
+:param product: data product name
+:param mode:    deployment mode as a value from `DeploymentModes`
+:param suite:   name of the compliance-checker suite that was run
+:param passed:  boolean indicating whether the file passed overall
+:param checks:  list of `CheckResult` tuples
+:param errors:  dict mapping check_id to an error message for checks that
+                could not be run
+:param error:   message explaining why the file could not be checked at all
+                (e.g. an invalid filename), or None
+:param timings: dict of wall and CPU times for the file and each check (see
+                `timings.CheckTimer.to_dict`), or None if not recorded
+"""
+
+# Names used for compliance-checker's check levels
+LEVEL_NAMES = {3: "HIGH", 2: "MEDIUM", 1: "LOW"}
+LEVEL_WEIGHTS = {name: weight for weight, name in LEVEL_NAMES.items()}
+
+# Minimum check level at which a failure fails the file, as used by
+# compliance-checker's '--criteria' option
+CRITERIA_LIMITS = {"strict": 1, "normal": 2, "lenient": 3}
+
+SuiteCheck = namedtuple("SuiteCheck", ["check_id", "level", "family"])
+"""
+A check as defined in a YAML suite
+:param check_id: ID of the check
+:param level:    check level: 'HIGH', 'MEDIUM' or 'LOW'
+:param family:   family of the check (see `CHECK_FAMILIES`), or None
+"""
+
+# Families of checks, and regexes for the names of the YAML files containing
+# them. Families with no regex are only run by the native engine (see
+# `native_checks`)
+CHECK_FAMILIES = OrderedDict([
+    ("file_info", re.compile(r"^AMF_file_info\.yml$")),
+    ("file_structure", re.compile(r"^AMF_file_structure\.yml$")),
+    ("global_attrs", re.compile(r"^AMF_(global_attrs|product_.+_global-attributes(_.+)?)\.yml$")),
+    ("dimension", re.compile(r"^AMF_product_.+_dimension(_.+)?\.yml$")),
+    ("variable", re.compile(r"^AMF_product_.+_variable(_.+)?\.yml$")),
+    ("data_values", None),
+])
+
+SUITE_FILENAME_REGEX = re.compile(
+    r"^AMF_product_(?P<product>.+)_(?P<mode>{})\.yml$"
+    .format("|".join(mode.value.lower() for mode in DeploymentModes))
+)
+
+
+class SuiteLoader(object):
+    """
+    Load compliance-checker suites from the YAML checks generated by
+    `create-yaml-checks`, and cache them so that each suite is only parsed once.
+    If the directory has a suite manifest (see `suite_manifest`), suites are
+    found using the manifest instead of looking for files
+    """
+    def __init__(self, yaml_dir, version):
+        """
+        :param yaml_dir: directory containing the YAML checks
+        :param version:  version of the checks, e.g. 'v2.0'
+        """
+        # Imported here since `suite_manifest` uses this module
+        from amf_check_writer.suite_manifest import SuiteManifest
+
+        self.yaml_dir = yaml_dir
+        self.version = version
+        self._checkers = {}
+        self._suite_checks = {}
+        self._suite_hashes = {}
+
+        try:
+            manifest = SuiteManifest.load(yaml_dir)
+        except ValueError as ex:
+            print(f"[WARNING] {ex}", file=sys.stderr)
+            manifest = None
+        if manifest and manifest.version != version:
+            print(f"[WARNING] Ignoring the suite manifest in '{yaml_dir}', "
+                  f"which is for version '{manifest.version}' of the checks",
+                  file=sys.stderr)
+            manifest = None
+        self.manifest = manifest
+
+    def get_suite_path(self, product, mode):
+        if self.manifest:
+            entry = self.manifest.get_suite(product, mode.value.lower(), self.version)
+            if entry:
+                return entry.path
+        return os.path.join(self.yaml_dir,
+                            f"AMF_product_{product}_{mode.value.lower()}.yml")
+
+    def find_suite(self, product, mode):
+        """
+        Return the path to the suite for a product and deployment mode,
+        checking that it exists
+        :raises ValueError: if there is no suite
+        """
+        path = self.get_suite_path(product, mode)
+        if self.manifest:
+            if not self.manifest.get_suite(product, mode.value.lower(), self.version):
+                raise ValueError(f"No checks found for product '{product}' and "
+                                 f"deployment mode '{mode.value}' in the suite "
+                                 f"manifest in '{self.yaml_dir}'")
+        elif not os.path.isfile(path):
+            raise ValueError(f"No checks found for product '{product}' and "
+                             f"deployment mode '{mode.value}': '{path}' "
+                             f"does not exist")
+        return path
+
+    def get_suite_hash(self, product, mode):
+        """
+        Return a hash of the suite for a product and deployment mode and every
+        file it includes, which changes whenever the checks change. This is
+        read from the suite manifest if there is one
+        """
+        from amf_check_writer.suite_manifest import hash_suite
+
+        if self.manifest:
+            entry = self.manifest.get_suite(product, mode.value.lower(), self.version)
+            if entry:
+                return entry.hash
+
+        key = (product, mode)
+        if key not in self._suite_hashes:
+            path = self.get_suite_path(product, mode)
+            self._suite_hashes[key] = hash_suite(get_suite_files(path))
+        return self._suite_hashes[key]
+
+    def get_products(self):
+        """
+        Return the set of data products that have suites, or None if this is
+        not known without searching the YAML directory (there is no manifest)
+        """
+        if self.manifest:
+            return self.manifest.get_products(self.version)
+        return None
+
+    def get_suite_name(self, product, mode):
+        return f"product_{product}_{mode.value.lower()}_checks:{self.version}"
+
+    def get_checker(self, product, mode):
+        """
+        Return the compliance-checker checker class for a product and
+        deployment mode, loading it from the YAML check if necessary
+        :param product: data product name
+        :param mode:    value from `DeploymentModes`
+        :return:        tuple (suite name, checker class)
+
+        :raises ValueError: if the suite cannot be found
+        """
+        key = (product, mode)
+
+        if key not in self._checkers:
+            path = self.find_suite(product, mode)
+
+            from compliance_checker.suite import CheckSuite
+
+            # cc-yaml reads the YAML files to load from the parsed
+            # compliance-checker command line arguments
+            CheckSuite.load_generated_checkers(Namespace(yaml=[path]))
+
+            name = self.get_suite_name(product, mode)
+            try:
+                self._checkers[key] = (name, CheckSuite.checkers[name])
+            except KeyError:
+                raise ValueError(f"Suite '{name}' not found in '{path}'")
+
+        return self._checkers[key]
+
+    def get_suite_checks(self, product, mode):
+        """
+        Return the checks in the suite for a product and deployment mode (see
+        `get_suite_checks`)
+        """
+        key = (product, mode)
+        if key not in self._suite_checks:
+            path = self.get_suite_path(product, mode)
+            self._suite_checks[key] = get_suite_checks(path)
+        return self._suite_checks[key]
+
+    def get_check_ids(self, product, mode, min_level=None, fail_fast=False,
+                      select=None):
+        """
+        Return the checks to run for a product and deployment mode
+        :param min_level: if given, only include checks at this level
+                          ('HIGH', 'MEDIUM' or 'LOW') or above
+        :param fail_fast: if True, put HIGH checks first so that files with a
+                          HIGH failure are rejected as early as possible
+        :param select:    if given, a list of check families (see
+                          `CHECK_FAMILIES`) and glob patterns for check IDs.
+                          Only checks matching at least one are included
+        :return:          list of check IDs, in the order they should be run
+        """
+        limit = LEVEL_WEIGHTS[min_level] if min_level else 0
+        checks = [check for check in self.get_suite_checks(product, mode)
+                  if LEVEL_WEIGHTS.get(check.level, 0) >= limit
+                  and (not select or _is_selected(check, select))]
+        if fail_fast:
+            checks.sort(key=lambda check: -LEVEL_WEIGHTS.get(check.level, 0))
+        return [check.check_id for check in checks]
+
+    def load_all(self):
+        """
+        Load the suites for every product and deployment mode in the YAML
+        directory
+        :return: list of (product, mode) tuples that were loaded
+        """
+        loaded = []
+        if self.manifest:
+            suites = sorted((product, mode) for product, mode, version
+                            in self.manifest.suites if version == self.version)
+        else:
+            suites = []
+            pattern = os.path.join(self.yaml_dir, "AMF_product_*.yml")
+            for path in sorted(glob.glob(pattern)):
+                match = SUITE_FILENAME_REGEX.match(os.path.basename(path))
+                # Other matches are product variable/dimension checks that are
+                # included by the top-level suites
+                if match:
+                    suites.append((match.group("product"), match.group("mode")))
+
+        for product, mode in suites:
+            mode = DeploymentModes(mode)
+            try:
+                self.get_checker(product, mode)
+            except ValueError as ex:
+                print(f"[WARNING] {ex}", file=sys.stderr)
+                continue
+            loaded.append((product, mode))
+
+        return loaded
+
+
+def run_checks(checker_cls, path, criteria="normal", raw_results=None,
+               timer=None, check_ids=None, fail_fast=False):
+    """
+    Run all checks in a compliance-checker checker against a dataset
+    :param checker_cls: checker class, as returned by `SuiteLoader.get_checker`
+    :param path:        path to the dataset. Archive members (see `archives`)
+                        are opened from memory
+    :param criteria:    'strict', 'normal' or 'lenient' (as for
+                        compliance-checker)
+    :param raw_results: if given, a list to append the compliance-checker
+                        `Result` objects to (e.g. for use with `write_report`)
+    :param timer:       if given, a `timings.CheckTimer` to record the time
+                        taken by the whole file and by each check
+    :param check_ids:   if given, only run these checks, in this order
+    :param fail_fast:   if True, stop at the first HIGH level failure
+    :return:            tuple (passed, checks, errors) as for `FileResult`
+    """
+    from compliance_checker.suite import CheckSuite, fix_return_value
+
+    limit = CRITERIA_LIMITS[criteria]
+    timer = timer or CheckTimer()
+    checks = []
+    errors = {}
+
+    # Time spent waiting for other threads to finish with netCDF is not
+    # counted as time checking the file
+    with NETCDF_LOCK, timer.measure_file(path):
+        member = find_member(path)
+        ds = open_member(member) if member else CheckSuite().load_dataset(path)
+
+        try:
+            checker = checker_cls()
+            checker.setup(ds)
+
+            methods = _get_check_methods(checker)
+            if check_ids is not None:
+                methods = dict(methods)
+                methods = [(check_id, methods[check_id]) for check_id in check_ids
+                           if check_id in methods]
+
+            for check_id, method in methods:
+                try:
+                    with timer.measure(check_id):
+                        value = method(ds)
+                except Exception as ex:
+                    errors[check_id] = f"{type(ex).__name__}: {ex}"
+                    continue
+
+                if isinstance(value, dict):
+                    value = value.values()
+                elif not hasattr(value, "__iter__"):
+                    value = [value]
+
+                high_failure = False
+                for v in value:
+                    result = fix_return_value(v, check_id, method, checker)
+                    check = _to_check_result(check_id, result)
+                    checks.append(check)
+                    high_failure |= check.level == "HIGH" and not check.passed
+                    if raw_results is not None:
+                        raw_results.append(result)
+
+                if fail_fast and high_failure:
+                    break
+        finally:
+            if hasattr(ds, "close"):
+                ds.close()
+
+    passed = not errors and all(
+        c.passed for c in checks if LEVEL_WEIGHTS.get(c.level, limit) >= limit
+    )
+    return passed, checks, errors
+
+
+def run_file(loader, path, product, mode, criteria="normal", raw_results=None,
+             timings=False, min_level=None, fail_fast=False, select=None):
+    """
+    Run the appropriate suite for a product and deployment mode against a
+    dataset
+    :param loader:      `SuiteLoader` instance
+    :param path:        path to the dataset
+    :param product:     data product name
+    :param mode:        value from `DeploymentModes`
+    :param criteria:    see `run_checks`
+    :param raw_results: see `run_checks`
+    :param timings:     if True, record the time taken by each check in the
+                        result's `timings`
+    :param min_level:   if given, only run checks at this level or above (see
+                        `SuiteLoader.get_check_ids`)
+    :param fail_fast:   if True, run HIGH checks first and stop at the first
+                        HIGH failure
+    :param select:      if given, only run checks in these families or
+                        matching these check ID patterns (see
+                        `SuiteLoader.get_check_ids`)
+    :return:            `FileResult` tuple
+    """
+    suite, checker_cls = loader.get_checker(product, mode)
+    timer = CheckTimer() if timings else None
+
+    check_ids = None
+    if min_level or fail_fast or select:
+        check_ids = loader.get_check_ids(product, mode, min_level=min_level,
+                                         fail_fast=fail_fast, select=select)
+
+    passed, checks, errors = run_checks(checker_cls, path, criteria=criteria,
+                                        raw_results=raw_results, timer=timer,
+                                        check_ids=check_ids, fail_fast=fail_fast)
+    # A plain string, so that results sent back from worker processes do not
+    # carry the contents of archive members
+    return FileResult(str(path), product, mode, suite, passed, checks, errors,
+                      timings=timer.to_dict() if timer else None)
+
+
+def get_suite_files(suite_path, includes=None):
+    """
+    Return the paths of a YAML suite and every file it includes (recursively)
+    via '__INCLUDE__' checks. Included files are resolved relative to the
+    directory containing the suite
+    :param suite_path: path to the top-level YAML suite
+    :param includes:   if given, a dict used to remember the files included
+                       by each file read. Pass the same dict when finding the
+                       files of several suites so that files included by more
+                       than one suite are only read once
+    :return:           list of paths, starting with `suite_path`
+    """
+    import yaml
+
+    includes = {} if includes is None else includes
+    yaml_dir = os.path.dirname(suite_path)
+    paths = []
+    to_visit = [suite_path]
+
+    while to_visit:
+        path = to_visit.pop(0)
+        if path in paths:
+            continue
+        paths.append(path)
+
+        if path not in includes:
+            with open(path) as f:
+                suite = yaml.load(f, Loader=yaml.SafeLoader) or {}
+            includes[path] = [os.path.join(yaml_dir, check["__INCLUDE__"])
+                              for check in suite.get("checks") or []
+                              if "__INCLUDE__" in check]
+        to_visit += includes[path]
+
+    return paths
+
+
+def get_suite_checks(suite_path):
+    """
+    Return the checks in a YAML suite and the files it includes, without
+    loading the suite into compliance-checker
+    :param suite_path: path to the top-level YAML suite
+    :return:           list of `SuiteCheck` tuples, in the order the checks
+                       appear
+    """
+    import yaml
+
+    checks = OrderedDict()
+    for path in get_suite_files(suite_path):
+        with open(path) as f:
+            suite = yaml.load(f, Loader=yaml.SafeLoader) or {}
+
+        family = get_check_family(os.path.basename(path))
+        for check in suite.get("checks") or []:
+            if "check_id" in check:
+                # cc-yaml treats checks without a level as HIGH
+                check_id = check["check_id"]
+                checks[check_id] = SuiteCheck(check_id,
+                                              check.get("check_level", "HIGH"),
+                                              family)
+    return list(checks.values())
+
+
+def get_check_family(filename):
+    """
+    Return the family of the checks in a YAML file generated by
+    `create-yaml-checks`, or None if it is not one of `CHECK_FAMILIES`
+    """
+    for family, regex in CHECK_FAMILIES.items():
+        if regex and regex.match(filename):
+            return family
+    return None
+
+
+def _is_selected(check, select):
+    return any(check.family == pattern if pattern in CHECK_FAMILIES
+               else fnmatch(check.check_id, pattern)
+               for pattern in select)
+
+
+def write_report(suite, raw_results, output_format="text", output_filename="-",
+                 criteria="normal"):
+    """
+    Write a compliance-checker report in one of compliance-checker's output
+    formats
+    :param suite:           name of the suite that was run
+    :param raw_results:     dict mapping dataset paths to lists of
+                            compliance-checker `Result` objects (see
+                            `run_checks`)
+    :param output_format:   'text', 'html', 'json' or 'json_new'
+    :param output_filename: path to write the report to, or '-' to return it
+                            as a string
+    :param criteria:        see `run_checks`
+    :return:                the report as a string if `output_filename` is
+                            '-', otherwise None
+    """
+    from compliance_checker.suite import CheckSuite
+    from compliance_checker.runner import ComplianceChecker
+
+    limit = CRITERIA_LIMITS[criteria]
+    cs = CheckSuite()
+    score_dict = OrderedDict(
+        (path, {suite: (cs.scores(results), {})})
+        for path, results in raw_results.items()
+    )
+    ds_loc = list(raw_results)
+
+    buf = io.StringIO()
+    with redirect_stdout(buf):
+        if output_format == "text":
+            ComplianceChecker.stdout_output(cs, score_dict, 0, limit)
+        elif output_format == "html":
+            ComplianceChecker.html_output(cs, score_dict, "-", ds_loc, limit)
+        elif output_format in ("json", "json_new"):
+            ComplianceChecker.json_output(cs, score_dict, "-", ds_loc, limit,
+                                          output_format)
+        else:
+            raise ValueError(f"Invalid output format '{output_format}'")
+
+    if output_filename == "-":
+        return buf.getvalue()
+
+    with open(output_filename, "w", encoding="utf-8") as f:
+        f.write(buf.getvalue())
+
+
+def file_result_to_dict(result):
+    """
+    Convert a `FileResult` to a dictionary that can be serialised as JSON
+    """
+    d = result._asdict()
+    d["mode"] = result.mode.value if result.mode else None
+    d["checks"] = [c._asdict() for c in result.checks]
+    return d
+
+
+def _get_check_methods(checker):
+    """
+    Return a list of (check_id, bound method) for the checks in a checker, in
+    the order compliance-checker would run them
+    """
+    return [(name, method) for name, method
+            in inspect.getmembers(checker, inspect.ismethod)
+            if name.startswith("check_")]
+
+
+def _to_check_result(check_id, result):
+    """
+    Convert a compliance-checker `Result` to a `CheckResult`
+    """
+    value = result.value
+    if isinstance(value, tuple):
+        score, out_of = value
+    elif value is None:
+        # Skipped check
+        score, out_of = 0, 0
+    else:
+        score, out_of = int(bool(value)), 1
+
+    return CheckResult(
+        check_id=check_id,
+        name=result.name,
+        level=LEVEL_NAMES.get(result.weight, str(result.weight)),
+        passed=score == out_of,
+        score=score,
+        out_of=out_of,
+        msgs=[str(m) for m in result.msgs]
+    )
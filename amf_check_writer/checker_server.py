@@ -0,0 +1,226 @@
+"""
+Long-running server that loads the AMF check suites and pyessv vocabularies
+once, and checks datasets on request.
+
+Clients POST a JSON object of the form {"files": ["/path/to/file.nc", ...]} to
+'/check' and receive {"results": [...]} with a structured result per file. A
+GET request to '/suites' lists the suites that are loaded.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import argparse
+import traceback
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from amf_check_writer.amf_checker import check_files, get_suite_loader
+from amf_check_writer.check_runner import CRITERIA_LIMITS, file_result_to_dict
+from amf_check_writer.config import get_default_checks_dir
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8642
+
+# pyessv vocabulary used by the generated checks
+VOCABULARY_REF = "ncas:amf"
+
+
+class CheckerService(object):
+    """
+    Hold the loaded check suites and run them against datasets
+    """
+    def __init__(self, yaml_dir, version, criteria="normal", min_level=None,
+                 fail_fast=False, select=None):
+        self.loader = get_suite_loader(yaml_dir, version)
+        self.criteria = criteria
+        self.min_level = min_level
+        self.fail_fast = fail_fast
+        self.select = select
+        self.suites = []
+
+    def load(self, pyessv_root=None):
+        """
+        Load every check suite in the YAML directory and the pyessv archive
+        :param pyessv_root: directory to use as pyessv archive
+        """
+        if pyessv_root:
+            os.environ["PYESSV_ARCHIVE_HOME"] = pyessv_root
+
+        # pyessv reads the archive location from the environment when it is
+        # imported, so this must happen after setting PYESSV_ARCHIVE_HOME
+        import pyessv
+        pyessv.load(VOCABULARY_REF)
+
+        self.suites = self.loader.load_all()
+        print(f"[INFO] Loaded {len(self.suites)} check suites from "
+              f"'{self.loader.yaml_dir}'")
+
+    def check_paths(self, paths):
+        """
+        Run the relevant suites against datasets
+        :param paths: list of paths to datasets
+        :return:      list of dicts describing the result for each file (see
+                      `file_result_to_dict`). Files that could not be checked
+                      have an 'error' message
+        """
+        results = check_files(paths, self.loader.version,
+                              yaml_dir=self.loader.yaml_dir,
+                              criteria=self.criteria, min_level=self.min_level,
+                              fail_fast=self.fail_fast, select=self.select)
+        return [file_result_to_dict(r) for r in results]
+
+    def describe(self):
+        return {
+            "yaml_dir": self.loader.yaml_dir,
+            "version": self.loader.version,
+            "suites": [
+                {"product": product, "mode": mode.value,
+                 "suite": self.loader.get_suite_name(product, mode)}
+                for product, mode in self.suites
+            ]
+        }
+
+
+class CheckerRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP interface to a `CheckerService`, which is available as
+    `self.server.service`
+    """
+    def do_GET(self):
+        if self.path.rstrip("/") == "/suites":
+            self._send_json(200, self.server.service.describe())
+        else:
+            self._send_json(404, {"error": f"Unknown path '{self.path}'"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/check":
+            self._send_json(404, {"error": f"Unknown path '{self.path}'"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            files = request["files"]
+        except (ValueError, KeyError, TypeError):
+            files = None
+        if not _is_path_list(files):
+            self._send_json(400, {"error": "Request body must be a JSON object "
+                                           "with a list of paths in 'files'"})
+            return
+
+        try:
+            results = self.server.service.check_paths(files)
+        except Exception as ex:
+            # Keep serving other requests, and tell the client what happened
+            traceback.print_exc()
+            self._send_json(500, {"error": f"Cannot check files: "
+                                           f"{type(ex).__name__}: {ex}"})
+            return
+        self._send_json(200, {"results": results})
+
+    def log_message(self, fmt, *args):
+        print(f"[INFO] {self.address_string()} {fmt % args}", file=sys.stderr)
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _is_path_list(value):
+    return isinstance(value, list) and all(isinstance(path, str) for path in value)
+
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Serve requests until interrupted. Requests are handled one at a time,
+    since netCDF4/HDF5 cannot safely be used from several threads
+    """
+    server = HTTPServer((host, port), CheckerRequestHandler)
+    server.service = service
+    print(f"[INFO] Listening on http://{host}:{server.server_port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--yaml-dir",
+        help="Directory containing YAML checks for AMF. "
+             "Default: installed in 'site-packages' directory."
+    )
+    parser.add_argument(
+        "-v", "--version",
+        dest="checks_version_number",
+        required=True,
+        help="This should be the version number of the checks you want to "
+             "use. For example, \"2.0\" for v2.0."
+    )
+    parser.add_argument(
+        "--pyessv-dir",
+        help="Directory to use as pyessv archive. Default: use the "
+             "'PYESSV_ARCHIVE_HOME' environment variable."
+    )
+    parser.add_argument(
+        "--criteria",
+        default="normal",
+        choices=sorted(CRITERIA_LIMITS),
+        help="Check levels that cause a file to fail, as for "
+             "compliance-checker. Default: normal."
+    )
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="Stop checking each file at its first HIGH level failure."
+    )
+    parser.add_argument(
+        "--min-level",
+        choices=["HIGH", "MEDIUM", "LOW"],
+        help="Only run checks at this level or above. Default: run all checks."
+    )
+    parser.add_argument(
+        "--checks",
+        action="append",
+        metavar="FAMILY_OR_PATTERN",
+        help="Only run checks in this family or matching this check ID glob "
+             "pattern, as for amf-checker. Can be given several times."
+    )
+    parser.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help=f"Address to listen on. Default: {DEFAULT_HOST}."
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"Port to listen on. Default: {DEFAULT_PORT}."
+    )
+    args = parser.parse_args(sys.argv[1:])
+
+    args.yaml_dir = args.yaml_dir or get_default_checks_dir()
+    if not os.path.isdir(args.yaml_dir):
+        parser.error(f"No such directory '{args.yaml_dir}'")
+
+    service = CheckerService(args.yaml_dir, args.checks_version_number,
+                             criteria=args.criteria, min_level=args.min_level,
+                             fail_fast=args.fail_fast, select=args.checks)
+    service.load(pyessv_root=args.pyessv_dir)
+    serve(service, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
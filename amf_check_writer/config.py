@@ -1,5 +1,5 @@
 import os
-import site
+from functools import lru_cache
 
 # ID of the top level folder in Google Drive
 ROOT_FOLDER_ID = "1TGsJBltDttqs6nsbUwopX5BL_q8AU-5X"
@@ -12,6 +12,20 @@ ALL_VERSIONS = (
 )
 
 
-site_packages_dir = (site.getsitepackages() or ["."])[0]
-DEFAULT_AMF_CHECKS_DIR = os.path.join(site_packages_dir, "amf-checks")
+@lru_cache(maxsize=None)
+def get_default_checks_dir():
+    """
+    Return the directory the YAML checks are installed in by default: 'amf-checks'
+    in the 'site-packages' directory. This is only looked up when needed,
+    since it is not needed by most commands
+    """
+    import site
+    site_packages_dir = (site.getsitepackages() or ["."])[0]
+    return os.path.join(site_packages_dir, "amf-checks")
 
+
+def __getattr__(name):
+    # DEFAULT_AMF_CHECKS_DIR is kept for code that imports it directly
+    if name == "DEFAULT_AMF_CHECKS_DIR":
+        return get_default_checks_dir()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
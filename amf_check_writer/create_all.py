@@ -0,0 +1,52 @@
+"""
+Read AMF spreadsheet TSV files once and produce JSON controlled vocabulary
+files, pyessv vocabularies and YAML checks from them.
+"""
+import os
+import sys
+import argparse
+
+from amf_check_writer.config import ALL_VERSIONS, CURRENT_VERSION
+from amf_check_writer.spreadsheet_model import (add_spreadsheet_arguments,
+                                                get_handler_from_args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-s", "--source-dir", required=True,
+        help="Source directory, as downloaded and produced by "
+             "`download-from-drive` script."
+    )
+
+    parser.add_argument(
+        "-v", "--version", required=True, choices=ALL_VERSIONS,
+        help=f"Version of the spreadsheets to use (e.g. '{CURRENT_VERSION}')."
+    )
+
+    add_spreadsheet_arguments(parser)
+
+    args = parser.parse_args(sys.argv[1:])
+
+    if not os.path.isdir(args.source_dir):
+        parser.error(f"No such directory '{args.source_dir}'")
+
+    version_dir = os.path.join(args.source_dir, args.version)
+    sh = get_handler_from_args(parser, args, version_dir)
+
+    cvs_dir = os.path.join(version_dir, "AMF_CVs")
+    pyessv_dir = os.path.join(version_dir, "amf-pyessv-vocabs")
+    checks_dir = os.path.join(version_dir, "amf-checks")
+
+    for dr in (cvs_dir, pyessv_dir, checks_dir):
+        if not os.path.isdir(dr):
+            os.makedirs(dr)
+
+    # Both steps use the same parsed spreadsheets
+    sh.write_cvs(cvs_dir, write_pyessv=True, pyessv_root=pyessv_dir,
+                 force=args.force)
+    sh.write_yaml(checks_dir, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
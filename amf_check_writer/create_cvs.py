@@ -6,8 +6,9 @@ import os
 import sys
 import argparse
 
-from amf_check_writer.spreadsheet_handler import SpreadsheetHandler
 from amf_check_writer.config import ALL_VERSIONS, CURRENT_VERSION
+from amf_check_writer.spreadsheet_model import (add_spreadsheet_arguments,
+                                                get_handler_from_args)
 
 
 def main():
@@ -23,13 +24,15 @@ def main():
         help=f"Version of the spreadsheets to use (e.g. '{CURRENT_VERSION}')."
     )
 
+    add_spreadsheet_arguments(parser)
+
     args = parser.parse_args(sys.argv[1:])
 
     if not os.path.isdir(args.source_dir):
         parser.error(f"No such directory '{args.source_dir}'")
 
     version_dir = os.path.join(args.source_dir, args.version)
-    sh = SpreadsheetHandler(version_dir)
+    sh = get_handler_from_args(parser, args, version_dir)
 
     cvs_dir = os.path.join(version_dir, "AMF_CVs")
     pyessv_dir = os.path.join(version_dir, "amf-pyessv-vocabs")
@@ -39,7 +42,7 @@ def main():
             os.makedirs(dr)
 
     sh.write_cvs(cvs_dir, write_pyessv=True,
-                 pyessv_root=pyessv_dir)
+                 pyessv_root=pyessv_dir, force=args.force)
 
 
 
@@ -6,8 +6,9 @@ import sys
 import os
 import argparse
 
-from amf_check_writer.spreadsheet_handler import SpreadsheetHandler
 from amf_check_writer.config import ALL_VERSIONS, CURRENT_VERSION
+from amf_check_writer.spreadsheet_model import (add_spreadsheet_arguments,
+                                                get_handler_from_args)
 
 
 def main():
@@ -24,19 +25,21 @@ def main():
         help=f"Version of the spreadsheets to use (e.g. '{CURRENT_VERSION}')."
     )
 
+    add_spreadsheet_arguments(parser)
+
     args = parser.parse_args(sys.argv[1:])
 
     if not os.path.isdir(args.source_dir):
         parser.error(f"No such directory '{args.source_dir}'")
 
     version_dir = os.path.join(args.source_dir, args.version)
-    sh = SpreadsheetHandler(version_dir)
+    sh = get_handler_from_args(parser, args, version_dir)
 
     checks_dir = os.path.join(version_dir, "amf-checks")
     if not os.path.isdir(checks_dir): 
         os.makedirs(checks_dir)
 
-    sh.write_yaml(checks_dir)
+    sh.write_yaml(checks_dir, force=args.force)
 
 
 if __name__ == "__main__":
@@ -16,9 +16,17 @@ class BaseCV(AmfFile):
         """
         super(BaseCV, self).__init__(facets)
         self.tsv_file = tsv_file
+        # Kept for messages after parsing, since the file is not pickled
+        self.tsv_name = getattr(tsv_file, "name", "<unknown>")
         reader = StripWhitespaceReader(self.tsv_file, delimiter="\t")
         self.cv_dict = self.parse_tsv(reader)
 
+    def __getstate__(self):
+        # The TSV file is only needed while parsing, and cannot be pickled
+        state = self.__dict__.copy()
+        state.pop("tsv_file", None)
+        return state
+
     def to_json(self, version):
         """
         Return JSON representation of this CV as a string
@@ -77,5 +77,5 @@ class VariablesCV(BaseCV, YamlCheck):
                 }
             except KeyError as ex:
                 print("WARNING: Missing value {} in '{}"
-                      .format(ex, self.tsv_file.name),
+                      .format(ex, self.tsv_name),
                       file=sys.stderr)
@@ -0,0 +1,117 @@
+"""
+Scan the data in NetCDF variables in fixed-size chunks, collecting the
+statistics needed to check values against `valid_min`, `valid_max` and
+`_FillValue` in a single read of each variable.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+
+# Maximum number of bytes of a variable to read at once
+DEFAULT_CHUNK_BYTES = 64 * 2 ** 20
+
+
+VariableStats = namedtuple("VariableStats", ["count", "fill", "nan", "min",
+                                             "max", "below_min", "above_max"])
+"""
+Statistics for the data in a variable
+:param count:     number of values
+:param fill:      number of values equal to the fill value
+:param nan:       number of NaN values
+:param min:       smallest value that is not fill or NaN, or None if there
+                  are none
+:param max:       largest value that is not fill or NaN, or None if there are
+                  none
+:param below_min: number of values (not fill or NaN) below `valid_min`
+:param above_max: number of values (not fill or NaN) above `valid_max`
+"""
+
+
+def scan_variable(var, valid_min=None, valid_max=None, fill_value=None,
+                  chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Read a numeric variable in chunks and collect statistics about its data.
+    Values are compared as stored in the file, without applying any scaling
+    or masking, so the limits must be in the same units
+    :param var:         netCDF4 `Variable`
+    :param valid_min:   smallest valid value, or None
+    :param valid_max:   largest valid value, or None
+    :param fill_value:  value used for missing data, or None
+    :param chunk_bytes: maximum number of bytes to read at once
+    :return:            `VariableStats` tuple
+    """
+    dtype = np.dtype(var.dtype)
+    count = fill = nan = below = above = 0
+    vmin = vmax = None
+
+    var.set_auto_maskandscale(False)
+    try:
+        for index in iter_chunks(var.shape, dtype.itemsize, chunk_bytes):
+            data = np.asarray(var[index]).ravel()
+            count += data.size
+
+            valid = np.ones(data.shape, dtype=bool)
+            if fill_value is not None:
+                is_fill = data == fill_value
+                fill += int(np.count_nonzero(is_fill))
+                valid &= ~is_fill
+            if dtype.kind == "f":
+                is_nan = np.isnan(data)
+                nan += int(np.count_nonzero(is_nan))
+                valid &= ~is_nan
+
+            values = data[valid]
+            if not values.size:
+                continue
+
+            chunk_min = values.min()
+            chunk_max = values.max()
+            vmin = chunk_min if vmin is None else min(vmin, chunk_min)
+            vmax = chunk_max if vmax is None else max(vmax, chunk_max)
+            if valid_min is not None and chunk_min < valid_min:
+                below += int(np.count_nonzero(values < valid_min))
+            if valid_max is not None and chunk_max > valid_max:
+                above += int(np.count_nonzero(values > valid_max))
+    finally:
+        var.set_auto_maskandscale(True)
+
+    return VariableStats(count, fill, nan, _to_python(vmin), _to_python(vmax),
+                         below, above)
+
+
+def iter_chunks(shape, itemsize, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Split an array into chunks of at most `chunk_bytes` bytes (or a single
+    item, if that is larger). Chunks are contiguous blocks along the first
+    axis that can be split, so they follow the order of the data on disk
+    :param shape:    shape of the array
+    :param itemsize: number of bytes per item
+    :return:         iterator of tuples of slices and integers, for indexing
+                     the array
+    """
+    shape = tuple(shape)
+    if not shape:
+        yield ()
+        return
+    if 0 in shape:
+        return
+
+    # Find the first axis where a block of whole rows fits in a chunk. Axes
+    # before it are read one index at a time
+    row_bytes = itemsize
+    for size in shape[1:]:
+        row_bytes *= size
+    axis = 0
+    while axis < len(shape) - 1 and row_bytes > chunk_bytes:
+        axis += 1
+        row_bytes //= shape[axis]
+
+    step = max(1, chunk_bytes // row_bytes)
+    for outer in np.ndindex(*shape[:axis]):
+        for start in range(0, shape[axis], step):
+            yield outer + (slice(start, min(start + step, shape[axis])),)
+
+
+def _to_python(value):
+    return None if value is None else value.item()
@@ -0,0 +1,145 @@
+"""
+Record which TSV files each generated file depends on, so that only the
+outputs affected by a change to the spreadsheets are regenerated.
+
+Each output directory written by `SpreadsheetHandler` has a manifest,
+`AMF_dependencies.json`, listing for every output the TSV files it was
+generated from with their hashes, and a hash of the output itself. On the next
+run an output is only generated again if one of its TSV files has changed,
+been added or been removed, or if the output is missing; it is only rewritten
+if its contents have changed.
+
+The manifest also records a hash of the code that generates the outputs, so
+that every output (including those that do not depend on any TSV file) is
+generated again after the package is upgraded or edited.
+"""
+from __future__ import print_function
+import os
+import glob
+import json
+import hashlib
+
+
+DEPENDENCIES_FILENAME = "AMF_dependencies.json"
+
+DEPENDENCIES_FORMAT = 1
+
+# Files in the package, relative to its directory, whose contents determine
+# the generated outputs
+GENERATOR_FILES = [
+    "spreadsheet_handler.py", "yaml_check.py", "base_file.py", "rule_pack.py",
+    "suite_manifest.py", "pyessv_writer.py", "workflow_docs.py",
+    "workflow_data.yml", "deployment_modes.py", "cvs/*.py"
+]
+
+_generator_hash = None
+
+
+class DependencyManifest(object):
+    """
+    Dependencies of the files in an output directory
+    """
+    def __init__(self, output_dir, version, sources, force=False):
+        """
+        :param output_dir: directory containing the outputs and the manifest
+        :param version:    version of the spreadsheets
+        :param sources:    dict of the TSV files as they are now (see
+                           `spreadsheet_model.get_sources`)
+        :param force:      if True, treat every output as out of date and
+                           rewrite it
+        """
+        self.path = os.path.join(output_dir, DEPENDENCIES_FILENAME)
+        self.output_dir = output_dir
+        self.version = version
+        self.sources = sources
+        self.force = force
+        self.outputs = {}
+
+        self._previous = {}
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+            if (manifest.get("format"), manifest.get("version"),
+                    manifest.get("generator")) == \
+                    (DEPENDENCIES_FORMAT, version, get_generator_hash()):
+                self._previous = manifest["outputs"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def get_inputs(self, paths):
+        """
+        Return the current hashes of a list of TSV files, as a dict
+        """
+        return {path: self.sources[path].hash for path in sorted(set(paths))
+                if path in self.sources}
+
+    def is_current(self, name, inputs, is_file=True):
+        """
+        Return True if an output does not need to be generated again
+        :param name:    name of the output file, relative to the output
+                        directory
+        :param inputs:  list of paths of the TSV files the output depends on
+        :param is_file: False if the output is not a file in the output
+                        directory, so cannot be missing
+        """
+        previous = self._previous.get(name)
+        current = (
+            not self.force and previous is not None
+            and previous["inputs"] == self.get_inputs(inputs)
+            and (not is_file or os.path.isfile(os.path.join(self.output_dir, name)))
+        )
+        if current:
+            self.outputs[name] = previous
+        return current
+
+    def is_unchanged(self, name, content):
+        """
+        Return True if an output that is being generated again has the same
+        contents as the file already written, so does not need rewriting
+        """
+        previous = self._previous.get(name)
+        return (not self.force and previous is not None
+                and previous["hash"] == hash_content(content)
+                and os.path.isfile(os.path.join(self.output_dir, name)))
+
+    def record(self, name, inputs, content=None):
+        """
+        Record the inputs of an output that has been generated
+        :param content: contents of the output as a string, if it is a file
+        """
+        self.outputs[name] = {
+            "inputs": self.get_inputs(inputs),
+            "hash": hash_content(content) if content is not None else None
+        }
+
+    def save(self):
+        """
+        Write the manifest. Only outputs checked or recorded in this run are
+        kept
+        """
+        manifest = {"format": DEPENDENCIES_FORMAT, "version": self.version,
+                    "generator": get_generator_hash(), "outputs": self.outputs}
+        with open(self.path, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def hash_content(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_generator_hash():
+    """
+    Return a hash of the files in `GENERATOR_FILES`. It is only computed once
+    per process
+    """
+    global _generator_hash
+    if _generator_hash is None:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        sha = hashlib.sha256()
+        for pattern in GENERATOR_FILES:
+            for path in sorted(glob.glob(os.path.join(package_dir, pattern))):
+                sha.update(os.path.relpath(path, package_dir).encode("utf-8"))
+                with open(path, "rb") as f:
+                    sha.update(f.read())
+        _generator_hash = sha.hexdigest()
+    return _generator_hash
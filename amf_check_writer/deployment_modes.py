@@ -0,0 +1,15 @@
+"""
+Deployment modes of AMF datasets. This module has no dependencies so that it
+can be imported by the command line tools without slowing them down.
+"""
+from enum import Enum
+
+
+class DeploymentModes(Enum):
+    """
+    Enumeration of valid deployment modes
+    """
+    LAND = "land"
+    SEA = "sea"
+    AIR = "air"
+    TRAJECTORY = "trajectory"
@@ -0,0 +1,204 @@
+"""
+Find datasets to check in files and directory trees.
+
+Directories are walked with `os.scandir` and paths are yielded as they are
+found, so that checking can start before the whole tree has been walked.
+Archives are read in the same way, without extracting them (see `archives`).
+"""
+from __future__ import print_function
+import os
+import sys
+from fnmatch import fnmatch
+
+from amf_check_writer.archives import is_archive, iter_archive
+
+
+# Patterns for files to include when searching directories
+DEFAULT_INCLUDE = ("*.nc",)
+
+
+def iter_datasets(paths, include=DEFAULT_INCLUDE, exclude=(),
+                  follow_symlinks=False, max_depth=None, read_archives=True):
+    """
+    Yield paths to datasets from a list of files, directories and archives
+    :param paths:           iterable of paths to files, directories or
+                            archives (see `archives.is_archive`), including
+                            '-' to read an archive from stdin. Files are
+                            always yielded, regardless of `include` and
+                            `exclude`. Archive members are matched in the
+                            same way as files in directories, and are
+                            yielded as `archives.ArchiveMember` paths
+    :param include:         glob patterns for files to yield from directories.
+                            If empty, all files are yielded
+    :param exclude:         glob patterns for files and directories to skip
+    :param follow_symlinks: if True, search directories that are symbolic links
+    :param max_depth:       maximum depth of sub-directories to search. 0 means
+                            only files directly inside each directory. None
+                            means no limit
+    :param read_archives:   if False, archive members are listed without
+                            reading their contents (see
+                            `archives.read_members`)
+    :return:                iterator of file paths
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            yield from walk_directory(path, include=include, exclude=exclude,
+                                      follow_symlinks=follow_symlinks,
+                                      max_depth=max_depth)
+        elif is_archive(path):
+            yield from iter_archive(path, accept=lambda name: _is_member_included(
+                name, include, exclude), read=read_archives)
+        else:
+            yield path
+
+
+def add_discovery_arguments(parser):
+    """
+    Add the options for finding datasets to an `argparse.ArgumentParser`. Use
+    `iter_datasets_from_args` to find datasets using the parsed arguments
+    """
+    parser.add_argument(
+        "--files-from",
+        metavar="PATH",
+        help="File listing datasets to check, one per line (e.g. a shard "
+             "manifest from 'amf-checker-shards'), or '-' to read the list "
+             "from stdin. Blank lines and lines starting with '#' are "
+             "ignored."
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="PATTERN",
+        help="Glob pattern for files to check when searching directories. "
+             "Patterns containing '/' are matched against the path relative "
+             "to the directory being searched, others against the file name. "
+             "Can be given several times. Default: '*.nc'."
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        metavar="PATTERN",
+        help="Glob pattern for files and directories to skip when searching "
+             "directories, matched as for --include. Can be given several "
+             "times."
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        help="Maximum depth of sub-directories to search. 0 means only files "
+             "directly inside the given directories. Default: no limit."
+    )
+    parser.add_argument(
+        "--follow-symlinks",
+        action="store_true",
+        help="Search directories that are symbolic links."
+    )
+
+
+def iter_datasets_from_args(args, read_archives=True):
+    """
+    Yield paths to datasets from arguments parsed by a parser set up with
+    `add_discovery_arguments`, plus positional `files`. Paths listed in
+    `--files-from` must be files, not directories
+    :param read_archives: see `iter_datasets`
+    """
+    yield from iter_datasets(args.files, include=args.include or DEFAULT_INCLUDE,
+                             exclude=args.exclude or (),
+                             follow_symlinks=args.follow_symlinks,
+                             max_depth=args.max_depth,
+                             read_archives=read_archives)
+
+    # Listed files are used as they are, without checking whether they are
+    # directories, so that very long lists do not stat every file
+    if args.files_from:
+        yield from read_file_list(args.files_from)
+
+
+def read_file_list(path):
+    """
+    Read a list of paths from a file containing one path per line. Blank lines
+    and lines starting with '#' are ignored
+    :param path: path to the list, or '-' to read from stdin
+    :return:     list of paths
+    """
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        lines = [line.strip() for line in f]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def walk_directory(root, include=DEFAULT_INCLUDE, exclude=(),
+                   follow_symlinks=False, max_depth=None):
+    """
+    Recursively yield files in a directory, in a deterministic order: files in
+    each directory are yielded in name order before its sub-directories are
+    searched. See `iter_datasets` for the meaning of the arguments.
+
+    Patterns containing a '/' are matched against the path relative to
+    `root`; other patterns are matched against the file or directory name.
+    """
+    visited = set()
+    stack = [(root, 0)]
+
+    while stack:
+        dirpath, depth = stack.pop()
+
+        if follow_symlinks:
+            # Avoid walking the same directory twice through symbolic links
+            try:
+                st = os.stat(dirpath)
+            except OSError as ex:
+                print(f"[WARNING] Cannot search '{dirpath}': {ex}", file=sys.stderr)
+                continue
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+
+        try:
+            with os.scandir(dirpath) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as ex:
+            print(f"[WARNING] Cannot search '{dirpath}': {ex}", file=sys.stderr)
+            continue
+
+        subdirs = []
+        for entry in entries:
+            relpath = os.path.relpath(entry.path, root)
+            if _matches_any(entry.name, relpath, exclude):
+                continue
+
+            try:
+                if entry.is_dir(follow_symlinks=follow_symlinks):
+                    if max_depth is None or depth < max_depth:
+                        subdirs.append(entry.path)
+                elif entry.is_file():
+                    if not include or _matches_any(entry.name, relpath, include):
+                        yield entry.path
+            except OSError as ex:
+                print(f"[WARNING] Cannot read '{entry.path}': {ex}", file=sys.stderr)
+
+        # Push in reverse so that sub-directories are searched in name order
+        stack.extend((path, depth + 1) for path in reversed(subdirs))
+
+
+def _is_member_included(name, include, exclude):
+    """
+    Return whether to check a member of an archive, matching its name as for
+    files in directories. Members in excluded directories are skipped
+    """
+    parts = name.split("/")
+    for i, part in enumerate(parts):
+        if _matches_any(part, "/".join(parts[:i + 1]), exclude):
+            return False
+    return not include or _matches_any(parts[-1], name, include)
+
+
+def _matches_any(name, relpath, patterns):
+    for pattern in patterns:
+        if fnmatch(relpath if "/" in pattern else name, pattern):
+            return True
+    return False
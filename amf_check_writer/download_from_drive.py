@@ -10,14 +10,6 @@ import time
 import argparse
 from pathlib import Path
 
-import httplib2
-from pygdrive3 import service
-
-from apiclient import discovery
-from apiclient import http
-
-
-from amf_check_writer.credentials import get_credentials
 from amf_check_writer.workflow_docs import read_workflow_data
 from amf_check_writer.config import (CURRENT_VERSION, ROOT_FOLDER_ID, 
            PRODUCT_COUNT_MINIMUM, ALL_VERSIONS, NROWS_TO_PARSE)
@@ -37,12 +29,20 @@ FOLDERS_TO_SKIP = (
 
 API_CALL_TIMES = []
 
-# Load information about which spreadsheets/worksheets are expected
-workflow_data = {k: v for k,v in read_workflow_data()['google_drive_content'].items()}
-ALLOWED_WORKSHEET_NAMES = {
-    worksheet.strip("*") for section in ["_common.xlsx", "_vocabularies.xlsx", "per-product"]
-    for worksheet in workflow_data[section]
-}
+
+def get_workflow_data():
+    """
+    Return information about which spreadsheets/worksheets are expected
+    """
+    return read_workflow_data()['google_drive_content']
+
+
+def get_allowed_worksheet_names():
+    workflow_data = get_workflow_data()
+    return {
+        worksheet.strip("*") for section in ["_common.xlsx", "_vocabularies.xlsx", "per-product"]
+        for worksheet in workflow_data[section]
+    }
 
 
 
@@ -92,6 +92,12 @@ class SheetDownloader(object):
         self.secrets_file = secrets_file
         self.regenerate = regenerate
 
+        # The Google API client libraries are slow to import, so are only
+        # imported once they are needed
+        import httplib2
+        from apiclient import discovery
+        from amf_check_writer.credentials import get_credentials
+
         # Authenticate and get API handles
         drive_credentials = get_credentials("drive", secrets_file)
         drive_http = drive_credentials.authorize(httplib2.Http())
@@ -139,6 +145,8 @@ class SheetDownloader(object):
         request = self.drive_api.files().export_media(fileId=sheet_id,
               mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
+        from apiclient import http
+
         with open(spreadsheet_file, 'wb') as fh:
             downloader = http.MediaIoBaseDownload(fh, request)
 
@@ -182,7 +190,7 @@ class SheetDownloader(object):
 
         # Check valid content was found
         if len([item for item in fnames if item.endswith(".xlsx")]) > 5:
-            expected_xlsx = {xlsx for xlsx in workflow_data if xlsx.endswith(".xlsx")}
+            expected_xlsx = {xlsx for xlsx in get_workflow_data() if xlsx.endswith(".xlsx")}
             if not expected_xlsx.issubset(set(fnames)):
                 diff = expected_xlsx.difference(fnames)
                 raise ValueError(f"[ERROR] The following expected spreadsheets were not found on "
@@ -237,13 +245,14 @@ class SheetDownloader(object):
 
         print('[INFO] Saving TSV files to: {}...'.format(tsv_dir))
         worksheets = set()
+        allowed_names = get_allowed_worksheet_names()
 
         for sheet in results["sheets"]:
             name = sheet["properties"]["title"]
             worksheets.add(name)
 
             # Check worksheet name is valid
-            if name not in ALLOWED_WORKSHEET_NAMES:
+            if name not in allowed_names:
                 print('[ERROR] Worksheet name not recognised: {}'.format(name))
 
             cell_range = "'{}'!A1:Z{}".format(name, NROWS_TO_PARSE)
@@ -255,6 +264,7 @@ class SheetDownloader(object):
                 self.write_values_to_tsv(self.get_sheet_values(sheet_id, cell_range), out_file)
 
         # Check the expected worksheet files were processed
+        workflow_data = get_workflow_data()
         # For general (relating to all products) spreadsheets
         if sheet_name.startswith("_"):
             if not set(workflow_data[sheet_name]) == worksheets:
@@ -0,0 +1,249 @@
+"""
+Parse AMF dataset filenames, and triage large numbers of filenames against the
+controlled vocabularies without opening any files.
+"""
+from __future__ import print_function
+import os
+import sys
+import re
+import json
+from itertools import islice
+from collections import Counter, OrderedDict
+
+
+# Regex to match filenames and extract product name
+FILENAME_REGEX = re.compile(
+    r"^(?P<instrument>[^\s_]+)_"      # <instrument>_
+    r"(?P<platform>[^\s_]+)_"         # <platform>_
+    r"(\d{4}(\d{2})?(\d{2})?|\d{8}(-\d{2})?(\d{2})?(\d{2})?)_"
+                                      # Valid options:
+                                      # <YYYY>
+                                      # <YYYY><MM>
+                                      # <YYYY><MM><DD>
+                                      # <YYYY><MM><DD>-<HH>
+                                      # <YYYY><MM><DD>-<HH><mm>
+                                      # <YYYY><MM><DD>-<HH><mm><ss>
+    r"(?P<product>[a-zA-Z0-9][^\s_]+)_"  # data product
+    r"([a-zA-Z0-9][^\s_]*_)*"            # optional: <option1>_<option2>_...<optionN>_
+    r"v\d+(\.\d+)?"                   # version: vN[.M]
+    r"\.nc$"                          # .nc extension
+)
+
+
+# The above regex in a human readable form, used in error messages. MAKE SURE
+# IT MATCHES THE REGEX!
+FILENAME_FORMAT_HUMAN_READABLE = (
+    "<instrument_name>_<platform_name>_<YYYY><MM><DD>-<HH><mm><SS>_<data_product>_[<option1>_<option2>_...<optionN>_]v<version>.nc"
+)
+
+# Problems found when triaging filenames, in the order they are reported
+NAME_PROBLEMS = OrderedDict([
+    ("malformed", "Filename does not match expected format"),
+    ("unknown_instrument", "Unknown instrument"),
+    ("old_instrument", "Old instrument name"),
+    ("unknown_platform", "Unknown platform"),
+    ("unknown_product", "Unknown data product"),
+])
+
+DEFAULT_TRIAGE_BATCH_SIZE = 100000
+
+
+def get_product_from_filename(path):
+    """
+    Calculate the product name from a dataset filename
+    :param path: path to dataset
+    :return:     product name as a string
+
+    :raises ValueError: if filename does not match the expected regex
+    """
+    fname = os.path.basename(path)
+    match = FILENAME_REGEX.match(fname)
+    if not match:
+        raise ValueError(
+            "Filename '{}' does not match expected format '{}'"
+            .format(fname, FILENAME_FORMAT_HUMAN_READABLE)
+        )
+    return match.group("product")
+
+
+class NameVocabularies(object):
+    """
+    Sets of the valid values for each part of a filename, for fast lookups
+    """
+    def __init__(self, products=None, instruments=None, old_instruments=None,
+                 platforms=None):
+        """
+        Each argument is a set of values, or None to skip checking that part
+        of the filename
+        :param products:        data product names
+        :param instruments:     current instrument names
+        :param old_instruments: previous instrument names, which are reported
+                                separately to unknown names
+        :param platforms:       platform IDs
+        """
+        self.products = products
+        self.instruments = instruments
+        self.old_instruments = old_instruments or set()
+        self.platforms = platforms
+
+    @classmethod
+    def from_cvs_dir(cls, cvs_dir):
+        """
+        Load the vocabularies from the JSON CVs written by `create-cvs`
+        :param cvs_dir: directory containing the JSON CVs
+        :raises ValueError: if one of the CVs cannot be read, since that part
+                            of the filenames would not be checked
+        """
+        products = set(_load_cv(cvs_dir, "product"))
+
+        instruments = set()
+        old_instruments = set()
+        for name in ("ncas_instrument", "community_instrument"):
+            cv = _load_cv(cvs_dir, name)
+            instruments.update(cv)
+            for instrument in cv.values():
+                old_instruments.update(instrument.get("previous_instrument_ids") or [])
+
+        platforms = set(_load_cv(cvs_dir, "platform"))
+
+        return cls(products=products, instruments=instruments,
+                   old_instruments=old_instruments - instruments,
+                   platforms=platforms)
+
+    def triage(self, fname):
+        """
+        Check a single filename
+        :param fname: filename, without any directory
+        :return:      list of (problem, value) tuples, where problem is a key
+                      in `NAME_PROBLEMS`. Empty if the name is valid
+        """
+        match = FILENAME_REGEX.match(fname)
+        if not match:
+            return [("malformed", fname)]
+
+        problems = []
+        instrument = match.group("instrument")
+        if self.instruments is not None and instrument not in self.instruments:
+            if instrument in self.old_instruments:
+                problems.append(("old_instrument", instrument))
+            else:
+                problems.append(("unknown_instrument", instrument))
+
+        platform = match.group("platform")
+        if self.platforms is not None and platform not in self.platforms:
+            problems.append(("unknown_platform", platform))
+
+        product = match.group("product")
+        if self.products is not None and product not in self.products:
+            problems.append(("unknown_product", product))
+
+        return problems
+
+
+class NameTriage(object):
+    """
+    Summary of the problems found in a large number of filenames
+    """
+    def __init__(self, vocabs, max_examples=5):
+        """
+        :param vocabs:       `NameVocabularies` instance
+        :param max_examples: number of example paths to keep for each problem
+        """
+        self.vocabs = vocabs
+        self.max_examples = max_examples
+        self.total = 0
+        self.valid = 0
+        # Number of files with each problem, the values that caused it and
+        # some example paths
+        self.files = Counter()
+        self.values = {problem: Counter() for problem in NAME_PROBLEMS}
+        self.examples = {problem: [] for problem in NAME_PROBLEMS}
+
+    def add_batch(self, paths):
+        """
+        Triage a batch of paths. Only the names are used: files are never
+        opened or stat'ed
+        """
+        triage = self.vocabs.triage
+        self.total += len(paths)
+
+        for path in paths:
+            problems = triage(path.rpartition(os.sep)[2])
+            if not problems:
+                self.valid += 1
+                continue
+
+            for problem, value in problems:
+                self.files[problem] += 1
+                self.values[problem][value] += 1
+                if len(self.examples[problem]) < self.max_examples:
+                    self.examples[problem].append(path)
+
+    def get_summary(self):
+        return {
+            "files": self.total,
+            "valid": self.valid,
+            "problems": OrderedDict(
+                (problem, {"files": self.files[problem],
+                           "values": dict(self.values[problem].most_common()),
+                           "examples": self.examples[problem]})
+                for problem in NAME_PROBLEMS if self.files[problem]
+            )
+        }
+
+    def format_summary(self, top=10):
+        """
+        Return a human readable summary as a string
+        :param top: number of the most common unknown values to list for
+                    each problem
+        """
+        lines = [f"Checked {self.total} filenames: {self.valid} valid, "
+                 f"{self.total - self.valid} with problems"]
+
+        for problem, description in NAME_PROBLEMS.items():
+            if not self.files[problem]:
+                continue
+
+            lines.append("")
+            lines.append(f"{description}: {self.files[problem]} files")
+            if problem != "malformed":
+                for value, count in self.values[problem].most_common(top):
+                    lines.append(f"    {value} ({count} files)")
+                remaining = len(self.values[problem]) - top
+                if remaining > 0:
+                    lines.append(f"    ... and {remaining} more")
+            lines.append("  e.g.")
+            lines.extend(f"    {path}" for path in self.examples[problem])
+
+        return "\n".join(lines) + "\n"
+
+
+def triage_names(paths, vocabs, batch_size=DEFAULT_TRIAGE_BATCH_SIZE):
+    """
+    Check the names of a large number of datasets against the filename format
+    and controlled vocabularies, without opening the files
+    :param paths:      iterable of paths to datasets
+    :param vocabs:     `NameVocabularies` instance
+    :param batch_size: number of paths to read from `paths` at a time
+    :return:           `NameTriage` instance
+    """
+    result = NameTriage(vocabs)
+    paths = iter(paths)
+
+    while True:
+        batch = list(islice(paths, batch_size))
+        if not batch:
+            break
+        result.add_batch(batch)
+        print(f"[INFO] Checked {result.total} filenames", file=sys.stderr)
+
+    return result
+
+
+def _load_cv(cvs_dir, name):
+    path = os.path.join(cvs_dir, f"AMF_{name}.json")
+    try:
+        with open(path) as f:
+            return json.load(f)[name]
+    except (OSError, ValueError, KeyError) as ex:
+        raise ValueError(f"Cannot read controlled vocabulary '{path}': {ex}")
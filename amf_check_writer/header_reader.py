@@ -0,0 +1,162 @@
+"""
+Read the global attributes that amf-checker needs from NetCDF files, without
+keeping any file handles open, and prefetch the headers of files that are
+about to be checked.
+"""
+import time
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from amf_check_writer.archives import find_member, open_member
+
+
+# Global attributes read from each file before choosing the checks to run
+HEADER_ATTRIBUTES = ("deployment_mode",)
+
+DEFAULT_HEADER_THREADS = 8
+
+# Number of files ahead of the one being checked to prefetch. Off by default:
+# every header has already been read once to group the files, so on local
+# disks prefetching only reads the same bytes again (a few percent slower in
+# a benchmark of 400 files, with a cold or warm page cache). It can help on
+# network filesystems where those pages have been evicted by the time a file
+# is checked
+DEFAULT_PREFETCH_DEPTH = 0
+
+# Number of bytes read from the start of each file before opening it with
+# netCDF4. This covers the superblock and root group attributes of typical
+# AMF files, so the open below is served from the filesystem cache
+PREFETCH_BYTES = 64 * 1024
+
+# The netCDF-C library is not thread-safe, so only one thread may use it at a
+# time. Headers are read in background threads while files are checked, so
+# `check_runner.run_checks` holds this too. The slow part on network
+# filesystems is the first read of each file, which happens outside the lock
+NETCDF_LOCK = threading.Lock()
+
+
+def read_global_attributes(path, names=HEADER_ATTRIBUTES):
+    """
+    Read global attributes from a NetCDF file. The file is always closed
+    before returning
+    :param path:  path to dataset, which may be an archive member (see
+                  `archives`)
+    :param names: names of the attributes to read
+    :return:      dict of attribute values. Attributes not present in the file
+                  are omitted
+
+    :raises OSError: if the file cannot be opened as a NetCDF dataset
+    """
+    from netCDF4 import Dataset
+
+    prefetch_header(path)
+    member = find_member(path)
+
+    with NETCDF_LOCK:
+        with (open_member(member) if member else Dataset(path)) as ds:
+            present = set(ds.ncattrs())
+            return {name: ds.getncattr(name) for name in names if name in present}
+
+
+def read_headers(paths, names=HEADER_ATTRIBUTES, threads=DEFAULT_HEADER_THREADS):
+    """
+    Read global attributes from several files concurrently
+    :param paths:   iterable of paths to datasets
+    :param names:   names of the attributes to read
+    :param threads: number of files to read at once
+    :return:        iterator of (path, attrs) tuples in the same order as
+                    `paths`, where attrs is a dict as returned by
+                    `read_global_attributes`, or the OSError raised if the
+                    file could not be read
+    """
+    # Keep a bounded number of reads in flight so that `paths` can be a
+    # generator over a very large number of files
+    max_pending = threads * 4
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = deque()
+
+        for path in paths:
+            pending.append((path, executor.submit(_read_or_error, path, names)))
+            if len(pending) >= max_pending:
+                path, future = pending.popleft()
+                yield path, future.result()
+
+        while pending:
+            path, future = pending.popleft()
+            yield path, future.result()
+
+
+PrefetchTiming = namedtuple("PrefetchTiming", ["read", "wait"])
+"""
+Time spent prefetching the header of a file
+:param read: seconds taken to read the header in the background
+:param wait: seconds spent waiting for the read to finish when the file was
+             needed. The rest of the read time overlapped with other work
+"""
+
+
+def prefetch_header(path, nbytes=PREFETCH_BYTES):
+    """
+    Read the start of a file so that opening it later is served from the
+    filesystem cache. Archive members are already in memory, so nothing is
+    read for them
+    :return: seconds taken
+    """
+    start = time.perf_counter()
+    if find_member(path):
+        return 0.0
+    with open(path, "rb") as f:
+        f.read(nbytes)
+    return time.perf_counter() - start
+
+
+def prefetch_headers(paths, depth=DEFAULT_PREFETCH_DEPTH):
+    """
+    Prefetch the headers of files in background threads, up to `depth` files
+    ahead of the file being used
+    :param paths: list of paths to datasets
+    :param depth: number of files to prefetch at once. If 0, nothing is
+                  prefetched
+    :return:      iterator of (path, timing) tuples in the same order as
+                  `paths`, where timing is a `PrefetchTiming` tuple, or None
+                  if the file was not prefetched (e.g. it cannot be read, in
+                  which case opening it reports the error)
+    """
+    if depth < 1:
+        for path in paths:
+            yield path, None
+        return
+
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        pending = deque()
+        paths = iter(paths)
+
+        def submit_next():
+            for path in paths:
+                pending.append((path, executor.submit(prefetch_header, path)))
+                return
+
+        for _ in range(depth):
+            submit_next()
+
+        while pending:
+            path, future = pending.popleft()
+            start = time.perf_counter()
+            try:
+                read = future.result()
+            except OSError:
+                timing = None
+            else:
+                timing = PrefetchTiming(read, time.perf_counter() - start)
+            # Keep `depth` files in flight while this one is used
+            submit_next()
+            yield path, timing
+
+
+def _read_or_error(path, names):
+    try:
+        return read_global_attributes(path, names)
+    except OSError as ex:
+        return ex
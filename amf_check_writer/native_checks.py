@@ -0,0 +1,534 @@
+"""
+Run the metadata checks generated by `create-yaml-checks` directly from the
+JSON CVs, without cc-yaml or compliance-check-lib.
+
+Most generated checks only look at global attributes, dimensions and variable
+attributes and types, which can be checked with a few dictionary lookups on a
+file that is already open. `NativeSuiteLoader` builds a checker class for each
+suite with one method per supported check, so the checks run through
+`check_runner.run_checks` and give the same `Result`s, reports and scores as
+the compliance-check-lib checks they replace.
+
+With `scan_data`, a 'data_values' check is also added for each variable with
+`valid_min` or `valid_max` in its CV, which reads the variable's data in
+chunks and counts values outside the valid range (see `data_scan`). If the YAML checks directory
+contains a rule pack (see `rule_pack`), the global attribute checks use its
+precompiled regexes and resolved vocabularies. Checks that are not supported
+(e.g. vocabulary lookups without a rule pack) are listed in a warning and
+reported as errors for every file, so no file passes without them.
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import json
+import hashlib
+
+import yaml
+import numpy as np
+from compliance_checker.base import Result, BaseCheck, BaseNCCheck
+from compliance_checker.suite import CheckSuite
+from netCDF4 import default_fillvals
+
+from amf_check_writer.check_runner import (SuiteLoader, SuiteCheck,
+                                           LEVEL_NAMES, LEVEL_WEIGHTS,
+                                           get_suite_files)
+from amf_check_writer.archives import get_size
+from amf_check_writer.data_scan import scan_variable, DEFAULT_CHUNK_BYTES
+from amf_check_writer.rule_pack import (RulePack, RULE_PACK_FILENAME,
+                                        global_attr_result)
+
+
+NC_CHECKS = "checklib.register.nc_file_checks_register"
+FILE_CHECKS = "checklib.register.file_checks_register"
+
+# Keys in the variables CV that are not variable attributes: 'type' has its
+# own check, and 'dimension' lists the dimensions of the variable
+NON_ATTRIBUTE_KEYS = ("type", "dimension")
+
+# Attributes in the variables CV giving the range of valid data values
+RANGE_ATTRIBUTES = ("valid_min", "valid_max")
+
+
+class ControlledVocabularies(object):
+    """
+    JSON CVs written by `create-cvs`, loaded when first needed
+    """
+    def __init__(self, cvs_dir):
+        """
+        :param cvs_dir: directory containing the JSON CVs
+        """
+        self.cvs_dir = cvs_dir
+        self._cvs = {}
+
+    def get_term(self, namespace, term):
+        """
+        Return the data for a term in a CV
+        :param namespace: CV namespace, e.g. 'product_my-product_variable'
+        :param term:      name of the term, e.g. a variable name
+        :return:          dict of data for the term
+
+        :raises ValueError: if the CV or the term does not exist
+        """
+        if namespace not in self._cvs:
+            path = self.get_path(namespace)
+            try:
+                with open(path) as f:
+                    self._cvs[namespace] = json.load(f)[namespace]
+            except (OSError, ValueError, KeyError) as ex:
+                raise ValueError(f"Cannot read controlled vocabulary '{path}': {ex}")
+
+        try:
+            return self._cvs[namespace][term]
+        except KeyError:
+            raise ValueError(f"Term '{term}' not found in controlled vocabulary "
+                             f"'{namespace}'")
+
+    def get_path(self, namespace):
+        return os.path.join(self.cvs_dir, f"AMF_{namespace}.json")
+
+    def get_hash(self, namespaces):
+        """
+        Return a hash of the current contents of the CV files for a list of
+        namespaces. Missing files are hashed as empty
+        """
+        h = hashlib.sha256()
+        for namespace in sorted(namespaces):
+            h.update(namespace.encode("utf-8"))
+            try:
+                with open(self.get_path(namespace), "rb") as f:
+                    h.update(f.read())
+            except OSError:
+                pass
+        return h.hexdigest()
+
+
+class NativeChecker(BaseNCCheck, BaseCheck):
+    """
+    Base class for checkers built by `build_checker`. Checks are added as
+    `check_<id>` methods, in the same way as cc-yaml's generated checkers
+    """
+    _cc_spec = "amf-native"
+    _rule_pack = None
+    _rule_namespaces = ()
+    # CV namespaces the checks look terms up in
+    _cv_namespaces = ()
+    # `SuiteCheck`s for the checks added with `scan_data`
+    _data_checks = ()
+
+    def setup(self, ds):
+        # Check every global attribute covered by the rule pack in one pass;
+        # the check methods look up their result
+        self._global_attrs = {}
+        if self._rule_pack and self._rule_namespaces:
+            attrs = {name: ds.getncattr(name) for name in ds.ncattrs()}
+            self._global_attrs = {ns: self._rule_pack.check(attrs, ns)
+                                  for ns in self._rule_namespaces}
+
+
+class NativeSuiteLoader(SuiteLoader):
+    """
+    `SuiteLoader` that builds checkers from the YAML checks and JSON CVs
+    instead of loading them into compliance-checker
+    """
+    def __init__(self, yaml_dir, version, cvs_dir, scan_data=False,
+                 chunk_bytes=DEFAULT_CHUNK_BYTES):
+        """
+        :param cvs_dir:     directory containing the JSON CVs written by
+                            `create-cvs` for the same version as the YAML
+                            checks
+        :param scan_data:   if True, add checks of the data values in each
+                            variable against its valid range
+        :param chunk_bytes: maximum number of bytes of data to read at once
+                            when checking data values
+        """
+        super(NativeSuiteLoader, self).__init__(yaml_dir, version)
+        self.cvs = ControlledVocabularies(cvs_dir)
+        self.scan_data = scan_data
+        self.chunk_bytes = chunk_bytes
+        self.rule_pack = None
+        # Hash of the rule pack file, as part of each suite's hash
+        self.rule_pack_hash = ""
+        self._native_hashes = {}
+
+        path = os.path.join(yaml_dir, RULE_PACK_FILENAME)
+        if os.path.isfile(path):
+            try:
+                self.rule_pack = RulePack.load(path)
+                with open(path, "rb") as f:
+                    self.rule_pack_hash = hashlib.sha256(f.read()).hexdigest()
+            except (OSError, ValueError) as ex:
+                print(f"[WARNING] Cannot load rule pack '{path}': {ex}",
+                      file=sys.stderr)
+
+    def get_checker(self, product, mode):
+        """
+        See `SuiteLoader.get_checker`
+        """
+        key = (product, mode)
+
+        if key not in self._checkers:
+            path = self.find_suite(product, mode)
+            name = self.get_suite_name(product, mode)
+            with open(path) as f:
+                suite = yaml.load(f, Loader=yaml.SafeLoader) or {}
+            if suite.get("suite_name") != name:
+                raise ValueError(f"Suite '{name}' not found in '{path}'")
+
+            checker_cls, unsupported = build_checker(
+                path, self.cvs, self.rule_pack,
+                chunk_bytes=self.chunk_bytes if self.scan_data else None
+            )
+            if unsupported:
+                print(f"[WARNING] {len(unsupported)} checks in '{name}' cannot "
+                      f"be run natively and will be reported as errors: "
+                      f"{', '.join(unsupported)}", file=sys.stderr)
+            # compliance-checker looks the suite up by name when writing
+            # reports
+            CheckSuite.checkers.setdefault(name, checker_cls)
+            self._checkers[key] = (name, checker_cls)
+
+        return self._checkers[key]
+
+    def get_suite_hash(self, product, mode):
+        """
+        See `SuiteLoader.get_suite_hash`. The results of the native checks
+        also depend on the rule pack and the JSON CVs, so the hash covers them
+        as well
+
+        :raises ValueError: if the suite cannot be found
+        """
+        key = (product, mode)
+        if key not in self._native_hashes:
+            _, checker_cls = self.get_checker(product, mode)
+            h = hashlib.sha256()
+            for part in (super(NativeSuiteLoader, self).get_suite_hash(product, mode),
+                         self.rule_pack_hash,
+                         self.cvs.get_hash(checker_cls._cv_namespaces)):
+                h.update(part.encode("utf-8"))
+            self._native_hashes[key] = h.hexdigest()
+        return self._native_hashes[key]
+
+    def get_suite_checks(self, product, mode):
+        """
+        See `SuiteLoader.get_suite_checks`. Includes the data value checks
+        """
+        _, checker_cls = self.get_checker(product, mode)
+        return (super(NativeSuiteLoader, self).get_suite_checks(product, mode)
+                + list(checker_cls._data_checks))
+
+
+def build_checker(suite_path, cvs, rule_pack=None, chunk_bytes=None):
+    """
+    Build a checker class for a YAML suite and the files it includes
+    :param suite_path: path to the top-level YAML suite
+    :param cvs:        `ControlledVocabularies` instance
+    :param rule_pack:  if given, a `rule_pack.RulePack` to run the global
+                       attribute checks it covers with
+    :param chunk_bytes: if given, add data value checks for variables with a
+                        valid range, reading this many bytes at a time
+    :return:           tuple (checker class, unsupported) where unsupported is
+                       a list of the IDs of checks that cannot be run
+                       natively. These raise an error when run
+    """
+    methods = {}
+    unsupported = []
+    rule_namespaces = set()
+    cv_namespaces = set()
+    data_checks = []
+
+    for path in get_suite_files(suite_path):
+        with open(path) as f:
+            suite = yaml.load(f, Loader=yaml.SafeLoader) or {}
+        # Namespace of the checks, as used in the rule pack
+        namespace = os.path.splitext(os.path.basename(path))[0][len("AMF_"):]
+
+        for check in suite.get("checks") or []:
+            if "check_id" not in check:
+                continue
+            # cc-yaml treats checks without a level as HIGH
+            weight = LEVEL_WEIGHTS[check.get("check_level", "HIGH")]
+            params = check.get("parameters") or {}
+
+            if (check.get("check_name") in GLOBAL_ATTR_CHECKS and rule_pack
+                    and rule_pack.has_rule(namespace, params.get("attribute"))):
+                rule_namespaces.add(namespace)
+                methods[check["check_id"]] = _make_rule_method(
+                    namespace, params["attribute"], weight
+                )
+                continue
+
+            func = NATIVE_CHECKS.get(check.get("check_name"))
+            if func is None:
+                unsupported.append(check["check_id"])
+                methods[check["check_id"]] = _make_unsupported_method(
+                    check.get("check_name")
+                )
+                continue
+            methods[check["check_id"]] = _make_method(func, weight, params, cvs)
+            if "pyessv_namespace" in params:
+                cv_namespaces.add(params["pyessv_namespace"])
+
+            if chunk_bytes and func is check_variable_attrs:
+                data_params = _get_data_params(params, cvs, chunk_bytes)
+                if data_params:
+                    check_id = f"check_{params['var_id']}_data_values"
+                    methods[check_id] = _make_method(check_data_values, weight,
+                                                     data_params, cvs)
+                    data_checks.append(SuiteCheck(check_id, LEVEL_NAMES[weight],
+                                                  "data_values"))
+
+    methods["_data_checks"] = data_checks
+    methods["_rule_pack"] = rule_pack
+    methods["_rule_namespaces"] = sorted(rule_namespaces)
+    methods["_cv_namespaces"] = sorted(cv_namespaces)
+    return type("NativeChecker", (NativeChecker,), methods), unsupported
+
+
+def _get_data_params(params, cvs, chunk_bytes):
+    """
+    Return the parameters for a data value check for the variable in a
+    variable attributes check, or None if its CV gives no valid range
+    """
+    try:
+        expected = cvs.get_term(params["pyessv_namespace"], params["var_id"])
+    except ValueError:
+        # Reported by the variable attributes check
+        return None
+
+    limits = {attr: expected[attr] for attr in RANGE_ATTRIBUTES if attr in expected}
+    if not limits:
+        return None
+    return dict(limits, var_id=params["var_id"], chunk_bytes=chunk_bytes)
+
+
+def _make_method(func, weight, params, cvs):
+    def method(self, ds):
+        score, out_of, name, msgs = func(ds, params, cvs)
+        return Result(weight, (score, out_of), name, msgs)
+    return method
+
+
+def _make_unsupported_method(check_name):
+    def method(self, ds):
+        raise NotImplementedError(
+            f"'{check_name}' cannot be run natively; write a rule pack with "
+            f"create-yaml-checks to run it"
+        )
+    return method
+
+
+def _make_rule_method(namespace, attr, weight):
+    def method(self, ds):
+        score, out_of, name, msgs = self._global_attrs[namespace][attr]
+        return Result(weight, (score, out_of), name, msgs)
+    return method
+
+
+def check_global_attr_regex(ds, params, cvs):
+    attr = params["attribute"]
+    if attr not in ds.ncattrs():
+        return global_attr_result(attr, None)
+
+    value = ds.getncattr(attr)
+    valid = re.match(f"^(?:{params['regex']})$", str(value), re.DOTALL) is not None
+    return global_attr_result(attr, value, valid)
+
+
+def check_variable_attrs(ds, params, cvs):
+    var_id = params["var_id"]
+    expected = cvs.get_term(params["pyessv_namespace"], var_id)
+    attrs = [(attr, value) for attr, value in expected.items()
+             if attr not in NON_ATTRIBUTE_KEYS]
+    name = f"Variable metadata: {var_id}"
+    out_of = len(attrs) + 1
+
+    if var_id not in ds.variables:
+        return 0, out_of, name, [f"Variable '{var_id}' not found in the file so "
+                                 f"cannot perform other checks."]
+
+    var = ds.variables[var_id]
+    present = set(var.ncattrs())
+    score = 1
+    msgs = []
+
+    for attr, value in attrs:
+        if attr not in present:
+            msgs.append(f"Required variable attribute '{attr}' is not present "
+                        f"for variable '{var_id}'.")
+        elif _matches(var.getncattr(attr), value):
+            score += 1
+        else:
+            msgs.append(f"Required variable attribute '{attr}' has incorrect "
+                        f"value ('{var.getncattr(attr)}' not '{value}') for "
+                        f"variable '{var_id}'.")
+
+    return score, out_of, name, msgs
+
+
+def check_variable_type(ds, params, cvs):
+    var_id = params["var_id"]
+    name = f"Variable type: {var_id}"
+    if var_id not in ds.variables:
+        return 0, 1, name, [f"Variable '{var_id}' not found in the file."]
+
+    expected = _dtype_name(params["dtype"])
+    actual = _dtype_name(ds.variables[var_id].dtype)
+    if actual != expected:
+        return 0, 1, name, [f"Variable '{var_id}' has type '{actual}' not "
+                            f"'{expected}'."]
+    return 1, 1, name, []
+
+
+def check_dimension(ds, params, cvs):
+    dim_id = params["dim_id"]
+    expected = cvs.get_term(params["pyessv_namespace"], dim_id)
+    check_units = not params.get("ignore_coord_var_check", False)
+    name = f"Dimension: {dim_id}"
+    out_of = 3 if check_units else 2
+
+    if dim_id not in ds.dimensions:
+        return 0, out_of, name, [f"Dimension '{dim_id}' not found in the file so "
+                                 f"cannot perform other checks."]
+
+    score = 1
+    msgs = []
+    length = expected["length"]
+    if _is_placeholder(length) or str(len(ds.dimensions[dim_id])) == str(length):
+        score += 1
+    else:
+        msgs.append(f"Dimension '{dim_id}' has length {len(ds.dimensions[dim_id])} "
+                    f"not {length}.")
+
+    if check_units:
+        var = ds.variables.get(dim_id)
+        if var is None or "units" not in var.ncattrs():
+            msgs.append(f"Coordinate variable '{dim_id}' with 'units' attribute "
+                        f"not found in the file.")
+        elif _matches(var.getncattr("units"), expected["units"]):
+            score += 1
+        else:
+            msgs.append(f"Coordinate variable '{dim_id}' has units "
+                        f"'{var.getncattr('units')}' not '{expected['units']}'.")
+
+    return score, out_of, name, msgs
+
+
+def check_data_values(ds, params, cvs):
+    var_id = params["var_id"]
+    name = f"Variable data: {var_id}"
+    # Missing variables and attributes are reported by the variable attributes
+    # check, so there is nothing to check here
+    if var_id not in ds.variables:
+        return 0, 0, name, []
+    var = ds.variables[var_id]
+    if np.dtype(var.dtype).kind not in "iuf":
+        return 0, 0, name, []
+
+    present = set(var.ncattrs())
+    limits = {}
+    for attr in RANGE_ATTRIBUTES:
+        value = params.get(attr)
+        if _is_placeholder(value):
+            # e.g. '<derived from file>': use the value in the file
+            value = _scalar(var.getncattr(attr)) if attr in present else None
+        if isinstance(value, (int, float)):
+            limits[attr] = value
+    if not limits:
+        return 0, 0, name, []
+
+    if "_FillValue" in present:
+        fill_value = _scalar(var.getncattr("_FillValue"))
+    else:
+        fill_value = default_fillvals.get(np.dtype(var.dtype).str[1:])
+
+    stats = scan_variable(var, limits.get("valid_min"), limits.get("valid_max"),
+                          fill_value, chunk_bytes=params["chunk_bytes"])
+    msgs = []
+    if stats.below_min:
+        msgs.append(f"{stats.below_min} values of '{var_id}' are below valid_min "
+                    f"{limits['valid_min']} (minimum {stats.min}).")
+    if stats.above_max:
+        msgs.append(f"{stats.above_max} values of '{var_id}' are above valid_max "
+                    f"{limits['valid_max']} (maximum {stats.max}).")
+    return len(limits) - len(msgs), len(limits), name, msgs
+
+
+def check_netcdf_format(ds, params, cvs):
+    fmt = params["format"]
+    name = f"NetCDF sub-format: {fmt}"
+    if ds.data_model != fmt:
+        return 0, 1, name, [f"The NetCDF sub-format must be: {fmt}."]
+    return 1, 1, name, []
+
+
+def check_file_size(ds, params, cvs):
+    strictness = params["strictness"]
+    threshold = params["threshold"]
+    name = f"File size ({strictness} limit): {threshold} GB"
+    size = get_size(ds.filepath()) / 2 ** 30
+    if size > threshold:
+        return 0, 1, name, [f"The file size must be less than {threshold} GB "
+                            f"({strictness} limit)."]
+    return 1, 1, name, []
+
+
+def check_filename_structure(ds, params, cvs):
+    delimiter = params["delimiter"]
+    extension = params["extension"]
+    name = "File name structure"
+    fname = os.path.basename(ds.filepath())
+    stem = fname[:-len(extension)] if fname.endswith(extension) else None
+    if stem is None or not all(stem.split(delimiter)):
+        return 0, 1, name, [f"The file name must be a list of words separated "
+                            f"by '{delimiter}' with the '{extension}' extension."]
+    return 1, 1, name, []
+
+
+# Global attribute checks that can be run from a rule pack
+GLOBAL_ATTR_CHECKS = (f"{NC_CHECKS}.GlobalAttrRegexCheck",
+                      f"{NC_CHECKS}.GlobalAttrVocabCheck")
+
+# Functions implementing each compliance-check-lib check, by the `check_name`
+# used in the YAML checks. Each is called as func(ds, parameters, cvs) and
+# returns (score, out_of, name, msgs)
+NATIVE_CHECKS = {
+    f"{NC_CHECKS}.GlobalAttrRegexCheck": check_global_attr_regex,
+    f"{NC_CHECKS}.NCVariableMetadataCheck": check_variable_attrs,
+    f"{NC_CHECKS}.VariableTypeCheck": check_variable_type,
+    f"{NC_CHECKS}.NetCDFDimensionCheck": check_dimension,
+    f"{NC_CHECKS}.NetCDFFormatCheck": check_netcdf_format,
+    f"{FILE_CHECKS}.FileSizeCheck": check_file_size,
+    f"{FILE_CHECKS}.FileNameStructureCheck": check_filename_structure,
+}
+
+
+def _is_placeholder(value):
+    # Values such as '<derived from file>' or '<i>' only require the
+    # attribute or dimension to be present
+    return isinstance(value, str) and value.startswith("<")
+
+
+def _matches(actual, expected):
+    if _is_placeholder(expected):
+        return True
+    if isinstance(expected, float):
+        try:
+            return bool(np.all(np.isclose(np.asarray(actual, dtype=float), expected)))
+        except (TypeError, ValueError):
+            return False
+    return str(actual) == str(expected)
+
+
+def _scalar(value):
+    value = np.asarray(value)
+    return value.item() if value.size == 1 else None
+
+
+def _dtype_name(dtype):
+    if dtype is str or dtype in ("str", "string"):
+        return "string"
+    try:
+        return np.dtype(dtype).name
+    except TypeError:
+        return str(dtype)
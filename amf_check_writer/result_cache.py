@@ -0,0 +1,167 @@
+"""
+Persistent cache of amf-checker results, so that files that have not changed
+since they were last checked do not need to be checked again.
+
+Results are keyed on the contents of the file, the resolved YAML check suite
+(the top-level suite and every file it includes), the version of the checks,
+the output format and any options that change which checks are run.
+"""
+import os
+import time
+import json
+import sqlite3
+import hashlib
+from collections import namedtuple
+
+from amf_check_writer.check_runner import get_suite_files
+from amf_check_writer.suite_manifest import hash_suite
+from amf_check_writer.archives import find_member
+
+
+CacheEntry = namedtuple("CacheEntry", ["key", "exit_code", "output", "result"])
+"""
+Cached result for a single file
+:param key:       cache key the result was stored under (see
+                  `ResultCache.get_key`)
+:param exit_code: compliance-checker exit code for the file
+:param output:    compliance-checker output for the file
+:param result:    structured result for the file as a dict (see
+                  `check_runner.file_result_to_dict`), or None
+"""
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class ResultCache(object):
+    """
+    Cache of check results stored in an SQLite database
+    """
+    def __init__(self, path, fast=False):
+        """
+        :param path: path to the cache database. It is created if it does not
+                     exist
+        :param fast: if True, identify file contents by size, modification
+                     time and inode instead of hashing the whole file
+        """
+        self.path = path
+        self.fast = fast
+        self._suite_hashes = {}
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "path TEXT PRIMARY KEY, key TEXT, exit_code INTEGER, "
+            "output TEXT, checked_at REAL, result TEXT)"
+        )
+        # Caches created before structured results were stored
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(results)")]
+        if "result" not in columns:
+            self._conn.execute("ALTER TABLE results ADD COLUMN result TEXT")
+
+    def get_key(self, path, suite_path, version, output_format, options=None,
+                suite_hash=None):
+        """
+        Return the cache key for checking a file with a given suite
+        :param path:          path to the dataset
+        :param suite_path:    path to the top-level YAML suite
+        :param version:       version of the checks
+        :param output_format: compliance-checker output format
+        :param options:       dict of other options that affect the result,
+                              e.g. which checks are run
+        :param suite_hash:    hash of the suite, if already known (see
+                              `check_runner.SuiteLoader.get_suite_hash`).
+                              Otherwise the suite is hashed from `suite_path`
+        :return:              key as a string
+        """
+        parts = [
+            self.get_file_fingerprint(path),
+            suite_hash or self.get_suite_hash(suite_path),
+            version,
+            output_format
+        ]
+        if options:
+            parts.append(json.dumps(options, sort_keys=True))
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def get_file_fingerprint(self, path):
+        """
+        Return a string identifying the contents of a file. Archive members
+        are always hashed, since they are already in memory
+        """
+        member = find_member(path)
+        if member is not None:
+            return hashlib.sha256(member.data).hexdigest()
+
+        if self.fast:
+            st = os.stat(path)
+            return f"{st.st_size}:{st.st_mtime_ns}:{st.st_ino}"
+
+        return hash_file(path)
+
+    def get_suite_hash(self, suite_path):
+        """
+        Return a hash of a YAML suite and all the files it includes. Hashes are
+        computed once per suite for the lifetime of the cache object
+        """
+        if suite_path not in self._suite_hashes:
+            self._suite_hashes[suite_path] = hash_suite(get_suite_files(suite_path))
+
+        return self._suite_hashes[suite_path]
+
+    def get(self, path):
+        """
+        Return the cached result for a file
+        :param path: path to the dataset
+        :return:     `CacheEntry`, or None if the file has not been checked
+                     before
+        """
+        row = self._conn.execute(
+            "SELECT key, exit_code, output, result FROM results WHERE path = ?",
+            (os.path.abspath(path),)
+        ).fetchone()
+        if not row:
+            return None
+
+        key, exit_code, output, result = row
+        return CacheEntry(key, exit_code, output,
+                          json.loads(result) if result else None)
+
+    def put(self, path, key, exit_code, output, result=None):
+        """
+        Store the result for a file
+        :param path:      path to the dataset
+        :param key:       cache key (see `get_key`)
+        :param exit_code: compliance-checker exit code for the file
+        :param output:    compliance-checker output for the file
+        :param result:    structured result as a dict, if available
+        """
+        self._conn.execute(
+            "INSERT OR REPLACE INTO results "
+            "(path, key, exit_code, output, checked_at, result) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(path), key, exit_code, output, time.time(),
+             json.dumps(result) if result is not None else None)
+        )
+
+    def commit(self):
+        """
+        Save results stored so far, so they are not lost if the process is
+        killed
+        """
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+
+def hash_file(path):
+    """
+    Return the SHA-256 hash of a file's contents
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
@@ -0,0 +1,121 @@
+"""
+Destinations for structured amf-checker results, as an alternative to writing
+a compliance-checker report per file.
+"""
+import sys
+import json
+import gzip
+import time
+from collections import Counter
+
+
+class ResultSink(object):
+    """
+    Base class for objects that receive the result for each checked file
+    """
+    def write(self, result, cached=False):
+        """
+        Record the result for a single file. Must be implemented in child
+        classes.
+        :param result: dict describing the result, as returned by
+                       `check_runner.file_result_to_dict`
+        :param cached: True if the result was reused from the result cache
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Make sure results written so far are visible to readers
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink(ResultSink):
+    """
+    Write one JSON object per line for each file (and optionally each check),
+    followed by a summary of the whole run.
+
+    Each record has a 'type' key: 'file' for per-file records, 'check' for
+    per-check records and 'summary' for the final record.
+    """
+    def __init__(self, path, per_check=False):
+        """
+        :param path:      file to write to, or '-' for stdout. The output is
+                          compressed with gzip if the path ends in '.gz'
+        :param per_check: if True, write a record for every check as well as
+                          for every file
+        """
+        self.per_check = per_check
+
+        if path == "-":
+            self._file = sys.stdout
+            self._close_file = False
+        else:
+            opener = gzip.open if path.endswith(".gz") else open
+            self._file = opener(path, "wt", encoding="utf-8")
+            self._close_file = True
+
+        self.start_time = time.time()
+        self.counts = Counter()
+        self.failures = Counter()
+
+    def write(self, result, cached=False):
+        checks = result["checks"]
+        failed = [c for c in checks if not c["passed"]]
+
+        if result["error"] or result["errors"]:
+            self.counts["error"] += 1
+        elif result["passed"]:
+            self.counts["passed"] += 1
+        else:
+            self.counts["failed"] += 1
+        if cached:
+            self.counts["cached"] += 1
+        self.failures.update(c["check_id"] for c in failed)
+
+        record = {"type": "file"}
+        record.update((k, v) for k, v in result.items() if k != "checks")
+        record["cached"] = cached
+        record["checks_run"] = len(checks)
+        record["failed_checks"] = [
+            {"check_id": c["check_id"], "level": c["level"], "msgs": c["msgs"]}
+            for c in failed
+        ]
+        self._write_record(record)
+
+        if self.per_check:
+            for check in checks:
+                record = {"type": "check", "path": result["path"]}
+                record.update(check)
+                self._write_record(record)
+
+    def get_summary(self):
+        elapsed = time.time() - self.start_time
+        files = sum(self.counts[k] for k in ("passed", "failed", "error"))
+        return {
+            "type": "summary",
+            "files": files,
+            "passed": self.counts["passed"],
+            "failed": self.counts["failed"],
+            "errors": self.counts["error"],
+            "cached": self.counts["cached"],
+            "failures_per_check": dict(self.failures.most_common()),
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_second": round(files / elapsed, 3) if elapsed else None
+        }
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._write_record(self.get_summary())
+        if self._close_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def _write_record(self, record):
+        self._file.write(json.dumps(record) + "\n")
@@ -0,0 +1,360 @@
+"""
+Store the history of amf-checker results in an SQLite database, and query it.
+
+`amf-checker --results-db <path>` records each run, the files checked in it
+and the result of every check, so that questions such as "which files failed
+check X since date Y" can be answered with an indexed query instead of
+searching compliance-checker reports. `amf-checker-history` runs these
+queries from the command line.
+
+The database has four tables:
+ - runs:    one row per run of amf-checker
+ - files:   one row per dataset path
+ - results: one row per file checked in a run, with the product, deployment
+            mode, version of the checks and when it was checked
+ - checks:  one row per check run against a file in a run
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+from collections import namedtuple
+
+from amf_check_writer.result_sinks import ResultSink
+
+
+# Number of results to collect before writing them in one transaction
+DEFAULT_WRITE_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    version TEXT,
+    options TEXT,
+    files INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    file_id INTEGER NOT NULL REFERENCES files (id),
+    checked_at REAL NOT NULL,
+    product TEXT,
+    mode TEXT,
+    version TEXT,
+    suite TEXT,
+    passed INTEGER NOT NULL,
+    cached INTEGER NOT NULL,
+    error TEXT,
+    errors TEXT
+);
+CREATE TABLE IF NOT EXISTS checks (
+    result_id INTEGER NOT NULL REFERENCES results (id),
+    check_id TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    level TEXT,
+    passed INTEGER NOT NULL,
+    score INTEGER,
+    out_of INTEGER,
+    msgs TEXT
+);
+CREATE INDEX IF NOT EXISTS results_checked_at ON results (checked_at);
+CREATE INDEX IF NOT EXISTS results_product ON results (product, mode, checked_at);
+CREATE INDEX IF NOT EXISTS results_version ON results (version, checked_at);
+CREATE INDEX IF NOT EXISTS results_file ON results (file_id, checked_at);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+CREATE INDEX IF NOT EXISTS checks_check_id ON checks (check_id, passed, checked_at);
+CREATE INDEX IF NOT EXISTS checks_result ON checks (result_id);
+"""
+
+
+FailureRecord = namedtuple("FailureRecord", ["checked_at", "path", "product",
+                                             "mode", "version", "check_id",
+                                             "msgs"])
+"""
+A failed file or check found in the results database
+:param checked_at: time the file was checked, in seconds since the epoch
+:param path:       path to the dataset
+:param product:    data product name, or None if it could not be determined
+:param mode:       deployment mode, or None if it could not be determined
+:param version:    version of the checks
+:param check_id:   ID of the failed check, or None for a failed file
+:param msgs:       list of messages explaining the failure
+"""
+
+RunRecord = namedtuple("RunRecord", ["id", "started_at", "finished_at",
+                                     "version", "options", "files"])
+"""
+A run of amf-checker recorded in the results database
+:param id:          ID of the run
+:param started_at:  start time in seconds since the epoch
+:param finished_at: end time in seconds since the epoch, or None if the run
+                    did not finish
+:param version:     version of the checks
+:param options:     dict of options that changed which checks were run
+:param files:       number of files recorded
+"""
+
+
+class ResultsDatabase(ResultSink):
+    """
+    History of results stored in an SQLite database. Results are recorded
+    for a run started with `start_run`, and written in batches, each in a
+    single transaction
+    """
+    def __init__(self, path, batch_size=DEFAULT_WRITE_BATCH_SIZE):
+        """
+        :param path:       path to the database. It is created if it does not
+                           exist
+        :param batch_size: number of results to collect before writing them
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.run_id = None
+        self.version = None
+        self._pending = []
+
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+
+    def start_run(self, version, options=None):
+        """
+        Record the start of a run. Results passed to `write` are stored as
+        part of this run
+        :param version: version of the checks
+        :param options: dict of options that change which checks are run
+        """
+        self.version = version
+        with self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO runs (started_at, version, options) VALUES (?, ?, ?)",
+                (time.time(), version, json.dumps(options or {}, sort_keys=True))
+            )
+        self.run_id = cur.lastrowid
+
+    def write(self, result, cached=False):
+        if self.run_id is None:
+            raise ValueError("No run has been started")
+        self._pending.append((time.time(), result, cached))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the results collected so far in a single transaction
+        """
+        if not self._pending:
+            return
+
+        with self._conn:
+            for checked_at, result, cached in self._pending:
+                self._insert_result(checked_at, result, cached)
+            self._conn.execute("UPDATE runs SET files = files + ? WHERE id = ?",
+                               (len(self._pending), self.run_id))
+        self._pending = []
+
+    def close(self):
+        """
+        Write any remaining results and record the end of the run
+        """
+        self.flush()
+        if self.run_id is not None:
+            with self._conn:
+                self._conn.execute("UPDATE runs SET finished_at = ? WHERE id = ?",
+                                   (time.time(), self.run_id))
+        self._conn.close()
+
+    def _insert_result(self, checked_at, result, cached):
+        path = os.path.abspath(result["path"])
+        self._conn.execute("INSERT OR IGNORE INTO files (path) VALUES (?)", (path,))
+        file_id, = self._conn.execute("SELECT id FROM files WHERE path = ?",
+                                      (path,)).fetchone()
+
+        cur = self._conn.execute(
+            "INSERT INTO results (run_id, file_id, checked_at, product, mode, "
+            "version, suite, passed, cached, error, errors) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.run_id, file_id, checked_at, result["product"],
+             result["mode"], self.version, result["suite"],
+             bool(result["passed"]), cached, result["error"],
+             json.dumps(result["errors"]) if result["errors"] else None)
+        )
+        self._conn.executemany(
+            "INSERT INTO checks (result_id, check_id, checked_at, level, "
+            "passed, score, out_of, msgs) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(cur.lastrowid, c["check_id"], checked_at, c["level"],
+              bool(c["passed"]), c["score"], c["out_of"], json.dumps(c["msgs"]))
+             for c in result["checks"]]
+        )
+
+    def find_failures(self, check_id=None, since=None, until=None,
+                      product=None, mode=None, version=None, limit=None):
+        """
+        Find files that failed, or that failed a particular check
+        :param check_id: if given, find failures of this check. Otherwise find
+                         files that failed overall
+        :param since:    if given, only include files checked at or after
+                         this time (seconds since the epoch)
+        :param until:    if given, only include files checked before this time
+        :param product:  if given, only include files for this data product
+        :param mode:     if given, only include files for this deployment mode
+        :param version:  if given, only include files checked with this
+                         version of the checks
+        :param limit:    maximum number of records to return
+        :return:         list of `FailureRecord` tuples, oldest first
+        """
+        if check_id:
+            query = ("SELECT c.checked_at, f.path, r.product, r.mode, "
+                     "r.version, c.check_id, c.msgs FROM checks c "
+                     "JOIN results r ON r.id = c.result_id "
+                     "JOIN files f ON f.id = r.file_id "
+                     "WHERE c.check_id = ? AND c.passed = 0")
+            params = [check_id]
+            time_column = "c.checked_at"
+        else:
+            query = ("SELECT r.checked_at, f.path, r.product, r.mode, "
+                     "r.version, NULL, r.error FROM results r "
+                     "JOIN files f ON f.id = r.file_id WHERE r.passed = 0")
+            params = []
+            time_column = "r.checked_at"
+
+        for column, op, value in ((time_column, ">=", since),
+                                  (time_column, "<", until),
+                                  ("r.product", "=", product),
+                                  ("r.mode", "=", mode),
+                                  ("r.version", "=", version)):
+            if value is not None:
+                query += f" AND {column} {op} ?"
+                params.append(value)
+        query += f" ORDER BY {time_column}, r.id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        records = []
+        for row in self._conn.execute(query, params):
+            msgs = row[6]
+            if check_id:
+                msgs = json.loads(msgs) if msgs else []
+            else:
+                msgs = [msgs] if msgs else []
+            records.append(FailureRecord(*row[:6], msgs=msgs))
+        return records
+
+    def get_runs(self, limit=None):
+        """
+        Return the runs recorded in the database, most recent first
+        :return: list of `RunRecord` tuples
+        """
+        query = ("SELECT id, started_at, finished_at, version, options, files "
+                 "FROM runs ORDER BY id DESC")
+        params = []
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [RunRecord(*row[:4], options=json.loads(row[4] or "{}"), files=row[5])
+                for row in self._conn.execute(query, params)]
+
+
+def parse_time(value):
+    """
+    Parse a date or date and time in ISO format (e.g. '2024-01-31' or
+    '2024-01-31T12:00'), in local time unless a UTC offset is given
+    :return: seconds since the epoch
+    :raises ValueError: if the value is not a valid date
+    """
+    return datetime.fromisoformat(value).timestamp()
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Query the history of results recorded by 'amf-checker "
+                    "--results-db'. By default, list the files that failed, "
+                    "oldest first, as tab-separated time, path, check ID (or "
+                    "'-') and messages."
+    )
+    parser.add_argument(
+        "database",
+        help="Results database written by 'amf-checker --results-db'"
+    )
+    parser.add_argument(
+        "--check",
+        metavar="CHECK_ID",
+        help="List failures of this check instead of failed files"
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_time,
+        metavar="DATE",
+        help="Only include files checked at or after this date/time (ISO "
+             "format, e.g. '2024-01-31' or '2024-01-31T12:00')"
+    )
+    parser.add_argument(
+        "--until",
+        type=parse_time,
+        metavar="DATE",
+        help="Only include files checked before this date/time"
+    )
+    parser.add_argument(
+        "--product",
+        help="Only include files for this data product"
+    )
+    parser.add_argument(
+        "--mode",
+        help="Only include files for this deployment mode, e.g. 'land'"
+    )
+    parser.add_argument(
+        "--version",
+        help="Only include files checked with this version of the checks"
+    )
+    parser.add_argument(
+        "-n", "--limit",
+        type=int,
+        help="Maximum number of lines to print"
+    )
+    parser.add_argument(
+        "--runs",
+        action="store_true",
+        help="List the recorded runs instead, most recent first"
+    )
+    args = parser.parse_args(sys.argv[1:])
+
+    if not os.path.isfile(args.database):
+        parser.error(f"[ERROR] Cannot read results database '{args.database}'")
+
+    db = ResultsDatabase(args.database)
+    try:
+        if args.runs:
+            for run in db.get_runs(limit=args.limit):
+                finished = format_time(run.finished_at) if run.finished_at else "-"
+                print(f"{run.id}\t{format_time(run.started_at)}\t{finished}\t"
+                      f"{run.version}\t{run.files} files\t"
+                      f"{json.dumps(run.options, sort_keys=True)}")
+            return
+
+        failures = db.find_failures(check_id=args.check, since=args.since,
+                                    until=args.until, product=args.product,
+                                    mode=args.mode, version=args.version,
+                                    limit=args.limit)
+        for record in failures:
+            print(f"{format_time(record.checked_at)}\t{record.path}\t"
+                  f"{record.check_id or '-'}\t{'; '.join(record.msgs)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
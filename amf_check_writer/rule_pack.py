@@ -0,0 +1,210 @@
+"""
+Rule pack for the global attribute checks: every attribute regex and
+vocabulary used by the generated global attribute checks, validated when the
+checks are generated and stored in one JSON file alongside the YAML checks.
+
+`create-yaml-checks` writes the pack with `build_rule_pack` and
+`write_rule_pack`. Checkers load it with `RulePack.load`, which compiles each
+distinct regex once, and check all of a file's global attributes in a single
+pass with `RulePack.check`.
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import json
+from collections import OrderedDict
+
+
+RULE_PACK_FILENAME = "AMF_global_attrs_rules.json"
+
+RULE_PACK_FORMAT = 1
+
+
+class RulePack(object):
+    """
+    Compiled global attribute rules, loaded from a rule pack
+    """
+    def __init__(self, pack):
+        """
+        :param pack: rule pack as a dict (see `build_rule_pack`)
+        """
+        if pack.get("format") != RULE_PACK_FORMAT:
+            raise ValueError(f"Unsupported rule pack format '{pack.get('format')}'")
+
+        self.version = pack.get("version")
+        self.patterns = [_compile(regex) for regex in pack["patterns"]]
+        self.vocabularies = [frozenset(values) for values in pack["vocabularies"]]
+        self.rules = pack["rules"]
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a rule pack written by `write_rule_pack`
+        :raises OSError:    if the file cannot be read
+        :raises ValueError: if the file is not a valid rule pack
+        """
+        with open(path) as f:
+            try:
+                return cls(json.load(f))
+            except KeyError as ex:
+                raise ValueError(f"Invalid rule pack '{path}': missing {ex}")
+
+    def has_rule(self, namespace, attr):
+        return attr in self.rules.get(namespace, {})
+
+    def check(self, attrs, namespace):
+        """
+        Check global attributes against all the rules for a set of checks
+        :param attrs:     dict of all global attributes in a file
+        :param namespace: namespace of the YAML checks, e.g. 'global_attrs'
+        :return:          dict mapping attribute name to a tuple
+                          (score, out_of, name, msgs) as for the checks in
+                          `native_checks`
+        """
+        results = {}
+        for attr, rule in self.rules.get(namespace, {}).items():
+            if attr not in attrs:
+                results[attr] = global_attr_result(attr, None)
+                continue
+
+            value = attrs[attr]
+            if "pattern" in rule:
+                valid = self.patterns[rule["pattern"]].match(str(value)) is not None
+            else:
+                valid = str(value) in self.vocabularies[rule["vocabulary"]]
+            results[attr] = global_attr_result(attr, value, valid)
+        return results
+
+
+def global_attr_result(attr, value, valid=False):
+    """
+    Return the result of a global attribute check as a tuple
+    (score, out_of, name, msgs)
+    :param value: value of the attribute, or None if it is not present
+    """
+    name = f"Global attribute: {attr}"
+    if value is None:
+        return 0, 2, name, [f"Required '{attr}' global attribute is not present."]
+    if not valid:
+        return 1, 2, name, [f"Required '{attr}' global attribute value '{value}' "
+                            f"is invalid."]
+    return 2, 2, name, []
+
+
+def build_rule_pack(attr_checks, cvs, version):
+    """
+    Build a rule pack from the global attribute checks. Each regex is compiled
+    to make sure it is valid, identical regexes and vocabularies are stored
+    once, and vocabulary lookups are resolved to the list of allowed values.
+    Rules that cannot be compiled or resolved are left out with a warning:
+    their YAML checks are still written
+    :param attr_checks: iterable of `GlobalAttrCheck` instances
+    :param cvs:         iterable of CVs (`BaseCV` instances) to resolve
+                        vocabulary lookups with
+    :param version:     version of the checks, e.g. 'v2.0'
+    :return:            the rule pack as a dict
+    """
+    cvs = {cv.namespace: cv.cv_dict[cv.namespace] for cv in cvs}
+    patterns = OrderedDict()
+    vocabularies = OrderedDict()
+    rules = OrderedDict()
+
+    for check in sorted(attr_checks, key=lambda c: c.namespace):
+        ns_rules = rules.setdefault(check.namespace, OrderedDict())
+
+        for attr, details in check.all_check_details.items():
+            if details["use_attr_check"] == "regex":
+                regex = details["regex"]
+                try:
+                    _compile(regex)
+                except re.error as ex:
+                    print(f"[WARNING] Invalid regex for global attribute '{attr}' "
+                          f"in '{check.namespace}': {ex}", file=sys.stderr)
+                    continue
+                ns_rules[attr] = {"pattern": patterns.setdefault(regex, len(patterns))}
+
+            elif details["use_attr_check"] == "vocab":
+                try:
+                    values = resolve_vocab_lookup(details["vocab_lookup"], cvs)
+                except ValueError as ex:
+                    print(f"[WARNING] Cannot resolve vocabulary for global "
+                          f"attribute '{attr}' in '{check.namespace}': {ex}",
+                          file=sys.stderr)
+                    continue
+                ns_rules[attr] = {"vocabulary": vocabularies.setdefault(values, len(vocabularies))}
+
+    return {
+        "format": RULE_PACK_FORMAT,
+        "version": version,
+        "patterns": list(patterns),
+        "vocabularies": [list(values) for values in vocabularies],
+        "rules": rules
+    }
+
+
+def get_vocab_namespaces(attr_checks):
+    """
+    Return the set of CV namespaces referred to by the vocabulary lookups in
+    global attribute checks, i.e. the CVs `build_rule_pack` needs
+    :param attr_checks: iterable of `GlobalAttrCheck` instances
+    """
+    namespaces = set()
+    for check in attr_checks:
+        for details in check.all_check_details.values():
+            if details["use_attr_check"] == "vocab":
+                namespaces.update(lookup.split(":")[0]
+                                  for lookup in details["vocab_lookup"].split())
+    return namespaces
+
+
+def resolve_vocab_lookup(vocab_lookup, cvs):
+    """
+    Return the values allowed by a vocabulary lookup from a global attribute
+    check, e.g. 'platform:data:platform_id', which allows the 'platform_id' of
+    every term in the 'platform' CV. Several lookups may be given separated by
+    whitespace
+    :param vocab_lookup: lookup string, as in the YAML checks
+    :param cvs:          dict mapping CV namespace to the CV's terms
+    :return:             sorted tuple of allowed values
+
+    :raises ValueError: if a lookup is invalid or refers to an unknown CV
+    """
+    values = set()
+    for lookup in vocab_lookup.split():
+        try:
+            namespace, _, key = lookup.split(":")
+        except ValueError:
+            raise ValueError(f"Invalid vocabulary lookup '{lookup}'")
+        if namespace not in cvs:
+            raise ValueError(f"Unknown vocabulary '{namespace}'")
+
+        terms = cvs[namespace]
+        if not isinstance(terms, dict):
+            # CVs that are plain lists of terms
+            values.update(terms)
+            continue
+        for term, data in terms.items():
+            value = data.get(key, term) if isinstance(data, dict) else term
+            if isinstance(value, list):
+                values.update(value)
+            else:
+                values.add(value)
+
+    return tuple(sorted(str(value) for value in values))
+
+
+def write_rule_pack(pack, output_dir):
+    """
+    Write a rule pack to `RULE_PACK_FILENAME` in a directory
+    :return: path to the file written
+    """
+    path = os.path.join(output_dir, RULE_PACK_FILENAME)
+    with open(path, "w") as f:
+        json.dump(pack, f, separators=(",", ":"))
+    print(f"[INFO] Wrote: {path}")
+    return path
+
+
+def _compile(regex):
+    return re.compile(f"^(?:{regex})$", re.DOTALL)
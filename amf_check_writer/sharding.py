@@ -0,0 +1,228 @@
+"""
+Split a list of datasets between several nodes (e.g. the tasks of a SLURM job
+array), so that each node checks a similar number of bytes.
+
+The split only depends on the list of files, their sizes and a grouping key,
+so every node computes the same split independently. Files with the same key
+are kept on the same node where possible, so that each node loads fewer check
+suites.
+"""
+from __future__ import print_function
+import os
+import sys
+import argparse
+import heapq
+from collections import namedtuple, OrderedDict
+
+from amf_check_writer.discovery import (add_discovery_arguments,
+                                        iter_datasets_from_args)
+
+
+Shard = namedtuple("Shard", ["index", "count", "paths", "size"])
+"""
+Files assigned to one node
+:param index: number of the shard, starting at 1
+:param count: total number of shards
+:param paths: list of paths to datasets in the shard
+:param size:  total size of the files in bytes
+"""
+
+
+def parse_shard_spec(spec):
+    """
+    Parse a shard specification of the form 'i/N', where 1 <= i <= N
+    :param spec: string to parse
+    :return:     tuple (i, N) of integers
+    :raises ValueError: if `spec` is not valid
+    """
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}': expected 'i/N', e.g. '1/4'")
+
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}': i must be between 1 and N")
+    return index, count
+
+
+def add_shard_argument(parser):
+    """
+    Add the --shard option to an `argparse.ArgumentParser`
+    """
+    def shard_type(spec):
+        try:
+            return parse_shard_spec(spec)
+        except ValueError as ex:
+            raise argparse.ArgumentTypeError(str(ex))
+
+    parser.add_argument(
+        "--shard",
+        type=shard_type,
+        metavar="i/N",
+        help="Only check the i'th of N roughly equal parts of the files, by "
+             "total size, e.g. '--shard $SLURM_ARRAY_TASK_ID/4' in a job "
+             "array with tasks 1-4. All files are found before checking "
+             "starts. Use 'amf-checker-shards' to see how files are split."
+    )
+
+
+def plan_shards(paths, count, key, get_size=os.path.getsize):
+    """
+    Split files into shards of roughly equal total size.
+
+    Files are grouped by `key`. Groups larger than an even share of the total
+    size are split into consecutive runs of files; the groups (or runs) are
+    then assigned, largest first, to the shard with the fewest bytes (then
+    the fewest files) so far
+    :param paths:    list of paths to datasets. Their order does not affect
+                     the result
+    :param count:    number of shards
+    :param key:      function returning the group of a path as a string
+    :param get_size: function returning the size of a path in bytes. Files
+                     whose size cannot be read count as empty
+    :return:         list of `count` `Shard` tuples. Paths in each shard are
+                     sorted by group, then by path
+    """
+    groups = OrderedDict()
+    for path in sorted(set(paths)):
+        try:
+            size = get_size(path)
+        except OSError:
+            size = 0
+        groups.setdefault(key(path), []).append((path, size))
+
+    total = sum(size for files in groups.values() for _, size in files)
+    target = total / count
+
+    pieces = []
+    for group, files in sorted(groups.items()):
+        for piece in _split_group(files, target):
+            pieces.append((sum(size for _, size in piece), group, piece))
+    pieces.sort(key=lambda piece: (-piece[0], piece[1], piece[2][0][0]))
+
+    # Heap of (bytes assigned, files assigned, shard number). Ties in bytes
+    # (e.g. files that could not be sized) go to the shard with the fewest
+    # files, then the lowest shard
+    loads = [(0, 0, i) for i in range(count)]
+    assigned = [[] for _ in range(count)]
+    for size, group, piece in pieces:
+        load, n_files, i = heapq.heappop(loads)
+        assigned[i].extend((group, path, file_size) for path, file_size in piece)
+        heapq.heappush(loads, (load + size, n_files + len(piece), i))
+
+    shards = []
+    for i, files in enumerate(assigned):
+        files.sort()
+        shards.append(Shard(i + 1, count, [path for _, path, _ in files],
+                            sum(size for _, _, size in files)))
+    return shards
+
+
+def get_shard(paths, index, count, key, get_size=os.path.getsize):
+    """
+    Return the paths in one shard (see `plan_shards`)
+    :param index: number of the shard, starting at 1
+    :return:      list of paths
+    """
+    return plan_shards(paths, count, key, get_size=get_size)[index - 1].paths
+
+
+def _split_group(files, target):
+    """
+    Split a sorted list of (path, size) tuples into consecutive runs of at
+    most `target` bytes, unless a single file is larger than that
+    """
+    pieces = []
+    current = []
+    current_size = 0
+
+    for path, size in files:
+        if current and current_size + size > target:
+            pieces.append(current)
+            current = []
+            current_size = 0
+        current.append((path, size))
+        current_size += size
+
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def write_manifest(shard, f):
+    """
+    Write the paths in a shard to a file object, one per line, with a comment
+    describing the shard. The output can be passed to 'amf-checker
+    --files-from'
+    """
+    f.write(f"# shard {shard.index}/{shard.count}: {len(shard.paths)} files, "
+            f"{shard.size} bytes\n")
+    for path in shard.paths:
+        f.write(path + "\n")
+
+
+def main():
+    # Imported here since amf_checker uses this module for --shard
+    from amf_check_writer.amf_checker import get_shard_group
+    from amf_check_writer.archives import is_archive
+
+    parser = argparse.ArgumentParser(
+        description="Print the files in each shard when splitting datasets "
+                    "between nodes with 'amf-checker --shard i/N'. Give the "
+                    "same files and search options as to amf-checker."
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="Dataset(s) to split, or a directory to find datasets in. "
+             "Archives cannot be split into manifests: use 'amf-checker "
+             "--shard i/N' to check part of an archive."
+    )
+    parser.add_argument(
+        "-n", "--shards",
+        type=int,
+        required=True,
+        help="Number of shards to split the files into."
+    )
+    parser.add_argument(
+        "-o", "--output-dir",
+        help="Directory to write a manifest for each shard to, as "
+             "'shard-<i>-of-<N>.txt'. Default: print all manifests to stdout."
+    )
+    add_discovery_arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if not args.files and not args.files_from:
+        parser.error("No files to split: give datasets or directories, or "
+                     "use --files-from")
+    # The manifests list paths for 'amf-checker --files-from', which cannot
+    # refer to files inside archives
+    archives = [path for path in args.files if is_archive(path)]
+    if archives:
+        parser.error(f"Cannot split archive '{archives[0]}' into manifests: "
+                     f"use 'amf-checker --shard i/N' with the archive instead")
+
+    shards = plan_shards(list(iter_datasets_from_args(args)), args.shards,
+                         key=get_shard_group)
+
+    if not args.output_dir:
+        for shard in shards:
+            write_manifest(shard, sys.stdout)
+        return
+
+    if not os.path.isdir(args.output_dir):
+        os.mkdir(args.output_dir)
+    width = len(str(args.shards))
+    for shard in shards:
+        path = os.path.join(args.output_dir,
+                            f"shard-{shard.index:0{width}d}-of-{shard.count}.txt")
+        with open(path, "w") as f:
+            write_manifest(shard, f)
+        print(f"[INFO] Wrote {len(shard.paths)} files ({shard.size} bytes) "
+              f"to '{path}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 from __future__ import print_function
+import io
 import os
 import sys
 import re
-from collections import namedtuple
-
-from enum import Enum
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout, redirect_stderr
 
 from amf_check_writer.cvs import (BaseCV, VariablesCV, ProductsCV, PlatformsCV,
                                   InstrumentsCV, DimensionsCV, ScientistsCV)
@@ -13,21 +14,14 @@ from amf_check_writer.yaml_check import (YamlCheck, WrapperYamlCheck,
                                          GlobalAttrCheck)
 from amf_check_writer.workflow_docs import read_workflow_data
 from amf_check_writer.pyessv_writer import PyessvWriter
+from amf_check_writer.rule_pack import (build_rule_pack, write_rule_pack,
+                                        get_vocab_namespaces, RULE_PACK_FILENAME)
+from amf_check_writer.suite_manifest import (SuiteManifest, build_suite_manifest,
+                                             write_suite_manifest, MANIFEST_FILENAME)
+from amf_check_writer.spreadsheet_model import SpreadsheetModel, get_sources
+from amf_check_writer.dependency_manifest import DependencyManifest
 from amf_check_writer.exceptions import CVParseError, DimensionsSheetNoRowsError
-
-
-# Load information about which spreadsheets/worksheets are expected
-workflow_data = {k: v for k,v in read_workflow_data().items()}
-
-
-class DeploymentModes(Enum):
-    """
-    Enumeration of valid deployment modes
-    """
-    LAND = "land"
-    SEA = "sea"
-    AIR = "air"
-    TRAJECTORY = "trajectory"
+from amf_check_writer.deployment_modes import DeploymentModes
 
 
 SPREADSHEET_NAMES = {
@@ -65,24 +59,43 @@ class SpreadsheetHandler(object):
         "global-attributes": {"name": "global-attributes", "cls": GlobalAttrCheck}
     }
 
-    def __init__(self, version_dir):
+    def __init__(self, version_dir, cache_path=None, jobs=1):
+        """
+        :param version_dir: directory containing the spreadsheets for a version
+        :param cache_path:  if given, path to a file in which to save the
+                            parsed spreadsheets, so that they are only parsed
+                            again when a TSV file changes
+        :param jobs:        number of worker processes to parse the
+                            spreadsheets in
+        """
         self.path = version_dir
+        self.cache_path = cache_path
+        self.jobs = jobs
+        self._model = None
 
-    def write_cvs(self, output_dir, write_pyessv=True, pyessv_root=None):
+    def write_cvs(self, output_dir, write_pyessv=True, pyessv_root=None,
+                  force=False):
         """
-        Write CVs as JSON files
+        Write CVs as JSON files. Only CVs whose spreadsheets have changed since
+        the last run are written (see `dependency_manifest`)
         :param output_dir:   directory in which to write output JSON files
         :param write_pyessv: boolean indicating whether to write CVs to pyessv archive
         :param pyessv_root:  directory to use as pyessv archive
+        :param force:        if True, write every CV
         """
-        cvs = list(self.get_all_cvs())
+        model = self.get_model()
+        cvs = model.cvs
         version_number = self._find_version_number(output_dir)
-        self._write_output_files(cvs, BaseCV.to_json, output_dir, "json", version_number)
+        deps = DependencyManifest(output_dir, version_number, model.sources,
+                                  force=force)
+        self._write_output_files(cvs, BaseCV.to_json, output_dir, "json",
+                                 version_number, deps)
 
         # Check that correct CVs were written
         json_files = {cv.get_filename("json") for cv in cvs}
 
-        cv_wf_data = workflow_data["json-cvs"]
+        # Information about which spreadsheets/worksheets are expected
+        cv_wf_data = read_workflow_data()["json-cvs"]
         expected_common_files = {json for json in cv_wf_data["common"]}
         per_product_templates = cv_wf_data["per-product"]
         optional_product_files = set()
@@ -110,8 +123,12 @@ class SpreadsheetHandler(object):
             raise ValueError(f"[ERROR] The following expected JSON controlled "
                              f"vocabulary JSON files were not created: {diff}.")
 
-        # Write as PYESSV format if required
-        if write_pyessv:
+        # Write as PYESSV format if required. pyessv writes the whole archive
+        # at once, so it is written again if any CV has changed
+        pyessv_output = f"pyessv:{os.path.abspath(pyessv_root or '')}"
+        pyessv_inputs = self._get_inputs(cvs)
+        if write_pyessv and not deps.is_current(pyessv_output, pyessv_inputs,
+                                                is_file=False):
             writer = PyessvWriter(pyessv_root=pyessv_root)
             writer.write_cvs(cvs)
 
@@ -120,14 +137,23 @@ class SpreadsheetHandler(object):
                 diff = set(writer._written).difference({cv.get_identifier() for cv in cvs})
                 raise ValueError(f"[ERROR] The following expected PYESSV controlled "
                                  f"vocabulary JSON files were not created: {diff}.")
+            deps.record(pyessv_output, pyessv_inputs)
+
+        deps.save()
 
-    def write_yaml(self, output_dir):
+    def write_yaml(self, output_dir, force=False):
         """
-        Write YAML checks for each appropriate CV
+        Write YAML checks for each appropriate CV. Only checks whose
+        spreadsheets have changed since the last run are written (see
+        `dependency_manifest`)
         :param output_dir: directory in which to write output YAML files
+        :param force:      if True, write every check
         """
-        # Find CVs that are also YAML checks
-        cvs = list(self.get_all_cvs(base_class=YamlCheck))
+        # Find CVs that are also YAML checks. The other CVs are only needed to
+        # resolve vocabularies in the rule pack
+        model = self.get_model()
+        all_cvs = model.cvs
+        cvs = [cv for cv in all_cvs if YamlCheck in type(cv).__bases__]
         all_checks = []
         all_checks += cvs
 
@@ -136,15 +162,8 @@ class SpreadsheetHandler(object):
             FileInfoCheck(["file_info"]),
             FileStructureCheck(["file_structure"]),
         ]
-
-        global_attrs_path = os.path.join(
-            self.path, 'product-definitions/tsv', SPREADSHEET_NAMES["common_spreadsheet"],
-            SPREADSHEET_NAMES["global_attrs_worksheet"]
-        )
-
-        if self._isfile(global_attrs_path):
-            with open(global_attrs_path) as tsv_file:
-                global_checks.append(GlobalAttrCheck(tsv_file, ["global_attrs"]))
+        if model.global_attrs:
+            global_checks.append(model.global_attrs)
 
         all_checks += global_checks
 
@@ -185,7 +204,7 @@ class SpreadsheetHandler(object):
         # Check that the required checks were created
         all_check_files = {check.get_filename("yml") for check in all_checks}
 
-        yaml_checks_wf_data = workflow_data["yaml_checks"]
+        yaml_checks_wf_data = read_workflow_data()["yaml_checks"]
         expected_product_checks = {check for check in yaml_checks_wf_data["common"]}
         optional_product_checks = set()
 
@@ -208,10 +227,41 @@ class SpreadsheetHandler(object):
                 raise ValueError(f"[ERROR] The following expected checks were not created: "
                                  f"{diff}.")
 
-        self._write_output_files(all_checks, YamlCheck.to_yaml_check,
-                                 output_dir, "yml", version_number)
+        deps = DependencyManifest(output_dir, version_number, model.sources,
+                                  force=force)
+        written = self._write_output_files(all_checks, YamlCheck.to_yaml_check,
+                                           output_dir, "yml", version_number, deps)
+
+        attr_checks = [check for check in all_checks
+                       if isinstance(check, GlobalAttrCheck)]
+        vocab_cvs = [cv for cv in all_cvs if isinstance(cv, BaseCV)]
 
-    def _write_output_files(self, files, callback, output_dir, ext, version):
+        # The rule pack depends on the CVs its vocabulary checks refer to
+        vocab_names = get_vocab_namespaces(attr_checks)
+        rule_pack_inputs = self._get_inputs(
+            attr_checks + [cv for cv in vocab_cvs if cv.namespace in vocab_names]
+        )
+        if not deps.is_current(RULE_PACK_FILENAME, rule_pack_inputs):
+            write_rule_pack(build_rule_pack(attr_checks, vocab_cvs, version_number),
+                            output_dir)
+            deps.record(RULE_PACK_FILENAME, rule_pack_inputs)
+
+        # Only the suites that include a file that was written need hashing
+        # again
+        if (written or force
+                or not os.path.isfile(os.path.join(output_dir, MANIFEST_FILENAME))):
+            try:
+                previous = None if force else SuiteManifest.load(output_dir)
+            except ValueError:
+                previous = None
+            manifest = build_suite_manifest(output_dir, version_number,
+                                            previous=previous, changed=written)
+            write_suite_manifest(manifest, output_dir)
+
+        deps.save()
+
+    def _write_output_files(self, files, callback, output_dir, ext, version,
+                            deps=None):
         """
         Helper method to call a method on a several AmfFile objects and write
         the output to a file
@@ -221,21 +271,109 @@ class SpreadsheetHandler(object):
                            string
         :param output_dir: directory in which to write output files
         :param ext:        file extension to use
+        :param deps:       if given, a `DependencyManifest`. Files whose
+                           spreadsheets have not changed are skipped, and
+                           files whose contents have not changed are not
+                           rewritten
+        :return:           list of the names of the files written
         """
-        count = 0
+        written = []
+        skipped = 0
 
         for f in files:
 
             fname = f.get_filename(ext)
             outpath = os.path.join(output_dir, fname)
 
+            if deps:
+                inputs = self._get_inputs([f])
+                if deps.is_current(fname, inputs):
+                    skipped += 1
+                    continue
+
+            content = callback(f, version)
+            if deps:
+                unchanged = deps.is_unchanged(fname, content)
+                deps.record(fname, inputs, content)
+                if unchanged:
+                    skipped += 1
+                    continue
+
             with open(outpath, "w") as out_file:
-                out_file.write(callback(f,version))
-                count += 1
+                out_file.write(content)
+                written.append(fname)
    
             print(f"[INFO] Wrote: {outpath}")
 
-        print(f"[INFO] {count} files written")
+        print(f"[INFO] {len(written)} files written")
+        if skipped:
+            print(f"[INFO] {skipped} files already up to date")
+        return written
+
+    def _get_inputs(self, files):
+        """
+        Return the paths of the TSV files that a list of CVs or checks were
+        generated from, relative to the TSV directory. Top-level checks depend
+        on the spreadsheets of every check they include
+        """
+        model = self.get_model()
+        inputs = []
+        for f in files:
+            if isinstance(f, WrapperYamlCheck):
+                inputs += self._get_inputs(f.child_checks)
+            elif model.get_source(f):
+                inputs.append(model.get_source(f))
+        return inputs
+
+    def get_model(self):
+        """
+        Parse all the spreadsheets. If there is a cache file, only the TSV
+        files that have changed since it was written are parsed. The
+        spreadsheets are only parsed once for each `SpreadsheetHandler`
+        :return: `SpreadsheetModel` instance
+        """
+        if self._model is None:
+            cached = None
+            if self.cache_path:
+                cached = SpreadsheetModel.load(self.cache_path)
+
+            sources = get_sources(os.path.join(self.path, 'product-definitions/tsv'),
+                                  previous=cached.sources if cached else None)
+            parsed = cached.get_unchanged(sources) if cached else {}
+
+            cvs = []
+            cv_sources = {}
+            for path, cv in self._parse_cvs(parsed=parsed):
+                cvs.append(cv)
+                cv_sources[cv.get_identifier()] = path
+
+            global_attrs = self._get_global_attrs(cvs)
+            if global_attrs:
+                cv_sources[global_attrs.get_identifier()] = os.path.join(
+                    SPREADSHEET_NAMES["common_spreadsheet"],
+                    SPREADSHEET_NAMES["global_attrs_worksheet"]
+                )
+
+            model = SpreadsheetModel(cvs, self.product_names, global_attrs,
+                                     sources, cv_sources)
+            if self.cache_path and (cached is None or cached.sources != sources):
+                model.save(self.cache_path)
+
+            self._model = model
+        return self._model
+
+    def _get_global_attrs(self, cvs):
+        """
+        Return the check for the global attributes common to all products,
+        made from the common global attributes CV without parsing it again
+        :param cvs: list of CVs returned by `get_all_cvs`
+        :return:    `GlobalAttrCheck`, or None if it was not found
+        """
+        for cv in cvs:
+            if (isinstance(cv, GlobalAttrCheck)
+                    and cv.facets[:3] == ["product", "common", "global-attributes"]):
+                return cv.with_facets(["global_attrs"])
+        return None
 
     def get_all_cvs(self, base_class=None):
         """
@@ -245,9 +383,23 @@ class SpreadsheetHandler(object):
                            class
         :return:           an iterator of instances of subclasses of `BaseCV`
         """
+        for _path, cv in self._parse_cvs(base_class=base_class):
+            yield cv
+
+    def _parse_cvs(self, base_class=None, parsed=None):
+        """
+        Parse CV objects from the spreadsheet files, as for `get_all_cvs`
+        :param parsed: if given, a dict of CVs that have already been parsed
+                       and whose TSV files have not changed, indexed by (TSV
+                       path, tuple of facets)
+        :return:       an iterator of (TSV path relative to the TSV
+                       directory, CV) tuples
+        """
+        parsed = parsed or {}
+        tsv_dir = 'product-definitions/tsv'
         # Static CVs
         def static_path(name):
-            return os.path.join('product-definitions/tsv', SPREADSHEET_NAMES["vocabs_spreadsheet"],
+            return os.path.join(tsv_dir, SPREADSHEET_NAMES["vocabs_spreadsheet"],
                                 SPREADSHEET_NAMES[name])
         cv_parse_infos = [
             CVParseInfo(
@@ -286,29 +438,89 @@ class SpreadsheetHandler(object):
                 file=sys.stderr
             )
 
+        # With several jobs, parse the files that need parsing in worker
+        # processes first. Their output is printed below, in the same order
+        # as when parsing in this process
+        results = {}
+        if self.jobs > 1:
+            to_parse = []
+            attr_paths = set()
+            for index, (path, cls, facets) in enumerate(cv_parse_infos):
+                full_path = os.path.join(self.path, path)
+                if ((base_class and base_class not in cls.__bases__)
+                        or (os.path.relpath(path, tsv_dir), tuple(facets)) in parsed
+                        or full_path in attr_paths
+                        or not os.path.isfile(full_path)):
+                    continue
+                if cls is GlobalAttrCheck:
+                    attr_paths.add(full_path)
+                to_parse.append((index, full_path, cls, facets))
+            results = self._parse_in_workers(to_parse)
+
+        # Global attribute checks that have been parsed, by path. The common
+        # global attributes are the same for every deployment mode, so are
+        # only parsed once
+        attr_checks = {}
+
         for count, (path, cls, facets) in enumerate(cv_parse_infos):
             if base_class and base_class not in cls.__bases__:
                 continue
 
             full_path = os.path.join(self.path, path)
+            tsv_path = os.path.relpath(path, tsv_dir)
+
+            if (tsv_path, tuple(facets)) in parsed:
+                yield tsv_path, parsed[(tsv_path, tuple(facets))]
+                continue
+
+            if full_path in attr_checks:
+                yield tsv_path, attr_checks[full_path].with_facets(facets)
+                continue
 
             if not self._isfile(full_path):
                 continue
 
-            print('[INFO] Extracting content from: {}'.format(full_path))
+            if count in results:
+                cv, out, err = results[count]
+                sys.stdout.write(out)
+                sys.stderr.write(err)
+            else:
+                cv = parse_tsv(full_path, cls, facets)
+            if cv is None:
+                continue
 
-            with open(full_path) as tsv_file:
-                try:
-                    yield cls(tsv_file, facets)
-                except DimensionsSheetNoRowsError as ex:
-                    # Ignore if there is no data in the Dimensions worksheet
-                    pass
-                except CVParseError as ex:
-                    print(f"[WARNING] Failed to parse '{full_path}': {ex}",
-                          file=sys.stderr)
+            if isinstance(cv, GlobalAttrCheck):
+                attr_checks[full_path] = cv
+            yield tsv_path, cv
 
         print(f'[INFO] Read input from {count} TSV files')
 
+    def _parse_in_workers(self, to_parse):
+        """
+        Parse TSV files in worker processes, one task per directory (i.e. per
+        product)
+        :param to_parse: list of (index, full path, CV class, facets) tuples
+        :return:         dict mapping each index to the tuple returned for it
+                         by `_parse_tsv_group`. Empty if there are too few
+                         directories to be worth starting workers for
+        """
+        groups = OrderedDict()
+        for index, full_path, cls, facets in to_parse:
+            groups.setdefault(os.path.dirname(full_path), []).append(
+                (index, (full_path, cls, facets))
+            )
+        if len(groups) < 2:
+            return {}
+
+        results = {}
+        with ProcessPoolExecutor(max_workers=min(self.jobs, len(groups))) as executor:
+            tasks = [[info for _, info in group] for group in groups.values()]
+            for group, group_results in zip(groups.values(),
+                                            executor.map(_parse_tsv_group, tasks)):
+                for (index, _), result in zip(group, group_results):
+                    results[index] = result
+        return results
+
     def _get_per_product_parse_info(self):
         """
         Return iterator of CVParseInfo objects for product variable/dimension
@@ -397,3 +609,41 @@ class SpreadsheetHandler(object):
         match_ver = version_regex.search(s)
         match = match_ver.group()
         return match[1:]
+
+
+def parse_tsv(full_path, cls, facets):
+    """
+    Parse a CV from a TSV file, printing a warning if it cannot be parsed
+    :param full_path: path to the TSV file
+    :param cls:       CV class to instantiate
+    :param facets:    list of facets for CV namespace
+    :return:          instance of `cls`, or None if the file was not parsed
+    """
+    print('[INFO] Extracting content from: {}'.format(full_path))
+
+    with open(full_path) as tsv_file:
+        try:
+            return cls(tsv_file, facets)
+        except DimensionsSheetNoRowsError as ex:
+            # Ignore if there is no data in the Dimensions worksheet
+            return None
+        except CVParseError as ex:
+            print(f"[WARNING] Failed to parse '{full_path}': {ex}",
+                  file=sys.stderr)
+            return None
+
+
+def _parse_tsv_group(infos):
+    """
+    Parse several TSV files with `parse_tsv` in a worker process. Output is
+    captured so that the main process can print it in order
+    :param infos: list of (full path, CV class, facets) tuples
+    :return:      list of (CV or None, stdout output, stderr output) tuples
+    """
+    results = []
+    for full_path, cls, facets in infos:
+        out, err = io.StringIO(), io.StringIO()
+        with redirect_stdout(out), redirect_stderr(err):
+            cv = parse_tsv(full_path, cls, facets)
+        results.append((cv, out.getvalue(), err.getvalue()))
+    return results
@@ -0,0 +1,181 @@
+"""
+Parsed contents of a version of the AMF spreadsheets, shared between CV and
+YAML check generation.
+
+`SpreadsheetHandler.get_model` parses every TSV file once into a
+`SpreadsheetModel`. The model can be saved to a binary cache file, which
+records the size, modification time and hash of every TSV file, so that the
+next run only parses the files that have changed.
+
+`add_spreadsheet_arguments` adds the options for caching and parsing the
+spreadsheets shared by the scripts that generate files from them.
+"""
+from __future__ import print_function
+import os
+import sys
+import pickle
+import hashlib
+from collections import namedtuple
+
+
+# Change this when the classes stored in the model change, so that models
+# cached by older versions are parsed again
+MODEL_FORMAT = 2
+
+
+SourceFile = namedtuple("SourceFile", ["size", "mtime", "hash"])
+"""
+A TSV file the spreadsheets are parsed from
+:param size:  size in bytes
+:param mtime: modification time in nanoseconds
+:param hash:  SHA-256 hash of the contents
+"""
+
+
+class SpreadsheetModel(object):
+    """
+    CVs and checks parsed from the TSV files of one version of the spreadsheets
+    """
+    def __init__(self, cvs, product_names, global_attrs, sources, cv_sources):
+        """
+        :param cvs:           list of parsed CVs and checks, as returned by
+                              `SpreadsheetHandler.get_all_cvs`
+        :param product_names: set of names of products with product-specific
+                              spreadsheets
+        :param global_attrs:  `GlobalAttrCheck` for the global attributes
+                              common to all products, or None if there is no
+                              spreadsheet for them
+        :param sources:       dict of the TSV files the model was parsed from
+                              (see `get_sources`)
+        :param cv_sources:    dict mapping the identifier of each CV and check
+                              to the path of the TSV file it was parsed from,
+                              relative to the TSV directory
+        """
+        self.cvs = cvs
+        self.product_names = product_names
+        self.global_attrs = global_attrs
+        self.sources = sources
+        self.cv_sources = cv_sources
+
+    def get_source(self, cv):
+        """
+        Return the path of the TSV file a CV or check was parsed from, or
+        None if it was not parsed from a spreadsheet
+        """
+        return self.cv_sources.get(cv.get_identifier())
+
+    def get_unchanged(self, sources):
+        """
+        Return the CVs whose TSV files have not changed
+        :param sources: dict of the TSV files as they are now
+        :return:        dict mapping (TSV path, tuple of facets) to CV
+        """
+        unchanged = {}
+        for cv in self.cvs:
+            path = self.get_source(cv)
+            if (path in self.sources and path in sources
+                    and self.sources[path].hash == sources[path].hash):
+                unchanged[(path, tuple(cv.facets))] = cv
+        return unchanged
+
+    def save(self, path):
+        """
+        Save the model to a binary cache file
+        """
+        with open(path, "wb") as f:
+            pickle.dump((MODEL_FORMAT, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"[INFO] Wrote: {path}")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a model saved with `save`
+        :param path: path to the cache file
+        :return:     `SpreadsheetModel`, or None if there is no cached model
+                     or it was saved by an incompatible version
+        """
+        try:
+            with open(path, "rb") as f:
+                model_format, model = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            print(f"[WARNING] Ignoring invalid spreadsheet cache '{path}': {ex}",
+                  file=sys.stderr)
+            return None
+
+        if model_format != MODEL_FORMAT:
+            return None
+        print(f"[INFO] Read parsed spreadsheets from {path}")
+        return model
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_sources(tsv_dir, previous=None):
+    """
+    Find the TSV files in a directory and its sub-directories
+    :param tsv_dir:  directory containing the TSV files
+    :param previous: if given, the result of an earlier call. Files whose size
+                     and modification time have not changed since are not
+                     hashed again
+    :return:         dict mapping paths relative to `tsv_dir` to `SourceFile`
+                     tuples
+    """
+    previous = previous or {}
+    sources = {}
+    for dirpath, _dirnames, filenames in os.walk(tsv_dir):
+        for fname in filenames:
+            path = os.path.join(dirpath, fname)
+            rel_path = os.path.relpath(path, tsv_dir)
+            st = os.stat(path)
+
+            source = previous.get(rel_path)
+            if not source or (source.size, source.mtime) != (st.st_size, st.st_mtime_ns):
+                source = SourceFile(st.st_size, st.st_mtime_ns, hash_file(path))
+            sources[rel_path] = source
+    return sources
+
+
+def add_spreadsheet_arguments(parser):
+    """
+    Add the options for parsing the spreadsheets and writing the outputs to an
+    `argparse.ArgumentParser`. Use `get_handler_from_args` to create a
+    `SpreadsheetHandler` using the parsed arguments
+    """
+    parser.add_argument(
+        "--cache", metavar="PATH",
+        help="Save the parsed spreadsheets to this file, and read them from "
+             "it instead of parsing the TSV files again if none of them "
+             "have changed."
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Write every output file, even if the spreadsheets it is "
+             "generated from have not changed since the last run."
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1,
+        help="Number of worker processes to parse the spreadsheets in. "
+             "Each product's spreadsheets are parsed by one worker and the "
+             "results are combined in the same order as a serial run. "
+             "Default: 1 (parse in this process)."
+    )
+
+
+def get_handler_from_args(parser, args, version_dir):
+    """
+    Return a `SpreadsheetHandler` for a version of the spreadsheets from
+    arguments parsed by a parser set up with `add_spreadsheet_arguments`.
+    Invalid arguments are reported with `parser.error`
+    """
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    # Imported here so that '--help' does not need to load the CV classes
+    from amf_check_writer.spreadsheet_handler import SpreadsheetHandler
+    return SpreadsheetHandler(version_dir, cache_path=args.cache,
+                              jobs=args.jobs)
@@ -0,0 +1,168 @@
+"""
+Manifest of the top-level YAML check suites written by `create-yaml-checks`.
+
+The manifest maps each data product, deployment mode and version of the
+checks to the path of its suite, a hash of the suite and every file it
+includes, and the list of included files. `amf-checker` loads it once to find
+suites without looking for files, to reject files for unknown products before
+opening them, and to key its result cache on the suite hashes without reading
+the YAML files.
+
+The manifest is only correct for the YAML files it was written with: re-run
+`create-yaml-checks` (or delete the manifest) after editing them by hand.
+"""
+from __future__ import print_function
+import os
+import json
+import hashlib
+from collections import namedtuple, OrderedDict
+
+from amf_check_writer.check_runner import get_suite_files, SUITE_FILENAME_REGEX
+
+
+MANIFEST_FILENAME = "AMF_suites.json"
+
+MANIFEST_FORMAT = 1
+
+
+SuiteEntry = namedtuple("SuiteEntry", ["product", "mode", "version", "path",
+                                       "hash", "files"])
+"""
+A top-level suite listed in the manifest
+:param product: data product name
+:param mode:    deployment mode, e.g. 'land'
+:param version: version of the checks
+:param path:    path to the suite
+:param hash:    hash of the suite and the files it includes (see `hash_suite`)
+:param files:   paths of the suite and every file it includes
+"""
+
+
+class SuiteManifest(object):
+    """
+    Index of the suites in a directory of YAML checks, loaded from a manifest
+    """
+    def __init__(self, manifest, yaml_dir):
+        """
+        :param manifest: manifest as a dict (see `build_suite_manifest`)
+        :param yaml_dir: directory containing the YAML checks. Paths in the
+                         manifest are relative to it
+        """
+        if manifest.get("format") != MANIFEST_FORMAT:
+            raise ValueError(f"Unsupported suite manifest format "
+                             f"'{manifest.get('format')}'")
+
+        self.version = manifest["version"]
+        self.suites = {}
+        for suite in manifest["suites"]:
+            entry = SuiteEntry(
+                suite["product"], suite["mode"], suite["version"],
+                os.path.join(yaml_dir, suite["path"]), suite["hash"],
+                [os.path.join(yaml_dir, fname) for fname in suite["files"]]
+            )
+            self.suites[(entry.product, entry.mode, entry.version)] = entry
+
+    @classmethod
+    def load(cls, yaml_dir):
+        """
+        Load the manifest written by `write_suite_manifest` in a directory
+        :return: `SuiteManifest`, or None if there is no manifest
+
+        :raises ValueError: if the manifest cannot be read
+        """
+        path = os.path.join(yaml_dir, MANIFEST_FILENAME)
+        try:
+            with open(path) as f:
+                return cls(json.load(f), yaml_dir)
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, ValueError) as ex:
+            raise ValueError(f"Invalid suite manifest '{path}': {ex}")
+
+    def get_suite(self, product, mode, version):
+        """
+        :param mode: deployment mode, e.g. 'land'
+        :return:     `SuiteEntry`, or None if there is no suite
+        """
+        return self.suites.get((product, mode, version))
+
+    def get_products(self, version):
+        """
+        Return the set of data products with suites for a version
+        """
+        return {product for product, _, v in self.suites if v == version}
+
+
+def hash_suite(paths):
+    """
+    Return a hash of the files making up a suite
+    :param paths: paths of the suite and the files it includes, as returned
+                  by `check_runner.get_suite_files`
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def build_suite_manifest(yaml_dir, version, previous=None, changed=None):
+    """
+    Build a manifest of the top-level suites in a directory of YAML checks
+    :param yaml_dir: directory containing the YAML checks
+    :param version:  version of the checks, e.g. 'v2.0'
+    :param previous: if given, the `SuiteManifest` for the directory before
+                     some of the files were written
+    :param changed:  names of the files written since `previous`. Suites in
+                     `previous` that are not in this list include the same
+                     files, so are not read again, and are only hashed again
+                     if they include a changed file
+    :return:         the manifest as a dict
+    """
+    changed = set(changed or [])
+    includes = {}
+    suites = []
+    for fname in sorted(os.listdir(yaml_dir)):
+        match = SUITE_FILENAME_REGEX.match(fname)
+        if not match:
+            continue
+
+        path = os.path.join(yaml_dir, fname)
+        entry = None
+        if previous and fname not in changed:
+            entry = previous.get_suite(match.group("product"), match.group("mode"),
+                                       version)
+
+        if entry and entry.path == path:
+            files = entry.files
+            if changed.isdisjoint(os.path.relpath(f, yaml_dir) for f in files):
+                suite_hash = entry.hash
+            else:
+                suite_hash = hash_suite(files)
+        else:
+            files = get_suite_files(path, includes)
+            suite_hash = hash_suite(files)
+
+        suites.append(OrderedDict([
+            ("product", match.group("product")),
+            ("mode", match.group("mode")),
+            ("version", version),
+            ("path", fname),
+            ("hash", suite_hash),
+            ("files", [os.path.relpath(path, yaml_dir) for path in files])
+        ]))
+
+    return {"format": MANIFEST_FORMAT, "version": version, "suites": suites}
+
+
+def write_suite_manifest(manifest, output_dir):
+    """
+    Write a manifest to `MANIFEST_FILENAME` in a directory
+    :return: path to the file written
+    """
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    print(f"[INFO] Wrote: {path}")
+    return path
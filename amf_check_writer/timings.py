@@ -0,0 +1,249 @@
+"""
+Record how long checks take to run, and summarise the slowest checks across
+one or more runs of amf-checker.
+
+`amf-checker --timings <path>` writes a JSON report with the wall and CPU time
+taken by each file, suite and check, and how much of the time spent
+prefetching file headers overlapped with checking. `amf-checker-timings` reads
+one or more of these reports and prints a table of the slowest checks.
+"""
+from __future__ import print_function
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from amf_check_writer.result_sinks import ResultSink
+
+
+class CheckTimer(object):
+    """
+    Record wall and CPU time taken to check a file and by each check in it.
+    CPU time is measured for the current thread only, so reading headers in
+    other threads does not count towards it.
+
+    This is the place to attach other profiling tools: subclasses can
+    override `measure_file` and `measure` to run code around each file and
+    check
+    """
+    def __init__(self):
+        self.wall = 0
+        self.cpu = 0
+        self.checks = OrderedDict()
+
+    @contextmanager
+    def measure_file(self, path):
+        """
+        Context manager to time checking a whole file, including opening it
+        """
+        with self._measure() as elapsed:
+            yield
+        self.wall, self.cpu = elapsed
+
+    @contextmanager
+    def measure(self, check_id):
+        """
+        Context manager to time a single check. Times for checks measured
+        several times are added together
+        """
+        with self._measure() as elapsed:
+            yield
+        wall, cpu = self.checks.get(check_id, (0, 0))
+        self.checks[check_id] = (wall + elapsed[0], cpu + elapsed[1])
+
+    def to_dict(self):
+        return {
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+            "checks": OrderedDict(
+                (check_id, {"wall": round(wall, 6), "cpu": round(cpu, 6)})
+                for check_id, (wall, cpu) in self.checks.items()
+            )
+        }
+
+    @contextmanager
+    def _measure(self):
+        # The list is filled in with (wall, cpu) once the block has finished
+        elapsed = [0, 0]
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield elapsed
+        finally:
+            elapsed[0] = time.perf_counter() - wall_start
+            elapsed[1] = time.thread_time() - cpu_start
+
+
+class TimingsSink(ResultSink):
+    """
+    Collect the timings from each file's result and write a JSON report with
+    times per file, per suite and per check when closed. Results reused from
+    the cache are ignored, since they were not timed in this run
+    """
+    def __init__(self, path):
+        """
+        :param path: file to write the report to
+        """
+        self.path = path
+        self.files = []
+        self.suites = OrderedDict()
+        self.checks = OrderedDict()
+        self.prefetch = {"files": 0, "read": 0, "wait": 0}
+
+    def write(self, result, cached=False):
+        timings = result.get("timings")
+        if cached or not timings:
+            return
+
+        suite = result["suite"]
+        record = {"path": result["path"], "suite": suite,
+                  "wall": timings["wall"], "cpu": timings["cpu"]}
+        self.files.append(record)
+
+        prefetch = timings.get("prefetch")
+        if prefetch:
+            record["prefetch"] = prefetch
+            self.prefetch["files"] += 1
+            self.prefetch["read"] += prefetch["read"]
+            self.prefetch["wait"] += prefetch["wait"]
+
+        totals = self.suites.setdefault(suite, {"files": 0, "wall": 0, "cpu": 0})
+        totals["files"] += 1
+        totals["wall"] += timings["wall"]
+        totals["cpu"] += timings["cpu"]
+
+        for check_id, times in timings["checks"].items():
+            _add_check_times(self.checks, check_id, 1, times["wall"],
+                             times["cpu"], times["wall"])
+
+    def get_report(self):
+        return {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "files": self.files,
+            "suites": self.suites,
+            "checks": self.checks,
+            "prefetch": dict(self.prefetch,
+                             overlap=max(0, self.prefetch["read"] - self.prefetch["wait"]))
+        }
+
+    def close(self):
+        with open(self.path, "w") as f:
+            json.dump(self.get_report(), f, indent=2)
+        print(f"[INFO] Timings written to '{self.path}'")
+
+
+def aggregate_check_times(reports):
+    """
+    Combine the times per check from several timing reports
+    :param reports: iterable of reports, as dicts (see `TimingsSink`)
+    :return:        dict mapping check_id to a dict with the number of
+                    'calls', the total 'wall' and 'cpu' times and the
+                    longest single call ('max_wall')
+    """
+    checks = OrderedDict()
+    for report in reports:
+        for check_id, times in report["checks"].items():
+            _add_check_times(checks, check_id, times["calls"], times["wall"],
+                             times["cpu"], times["max_wall"])
+    return checks
+
+
+def format_slowest_checks(checks, top=20, sort_key="wall"):
+    """
+    Return a table of the checks that took the most time, as a string
+    :param checks:   dict as returned by `aggregate_check_times`
+    :param top:      maximum number of checks to include
+    :param sort_key: 'wall', 'cpu' or 'mean' (mean wall time per call)
+    """
+    def mean(times):
+        return times["wall"] / times["calls"] if times["calls"] else 0
+
+    key = mean if sort_key == "mean" else (lambda times: times[sort_key])
+    rows = sorted(checks.items(), key=lambda item: (-key(item[1]), item[0]))[:top]
+    total_wall = sum(times["wall"] for times in checks.values()) or 1
+
+    width = max([len("check_id")] + [len(check_id) for check_id, _ in rows])
+    lines = [
+        f"{'check_id':<{width}}  {'calls':>7}  {'wall (s)':>10}  {'% wall':>6}  "
+        f"{'cpu (s)':>10}  {'mean (s)':>9}  {'max (s)':>9}"
+    ]
+    for check_id, times in rows:
+        lines.append(
+            f"{check_id:<{width}}  {times['calls']:>7}  {times['wall']:>10.3f}  "
+            f"{100 * times['wall'] / total_wall:>6.1f}  {times['cpu']:>10.3f}  "
+            f"{mean(times):>9.4f}  {times['max_wall']:>9.4f}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def format_prefetch_summary(reports):
+    """
+    Return a line summarising the time spent prefetching file headers in
+    several timing reports, and how much of it overlapped with checking, or
+    an empty string if nothing was prefetched
+    """
+    files = read = wait = 0
+    for report in reports:
+        prefetch = report.get("prefetch") or {}
+        files += prefetch.get("files", 0)
+        read += prefetch.get("read", 0)
+        wait += prefetch.get("wait", 0)
+    if not files:
+        return ""
+
+    overlap = max(0, read - wait)
+    return (f"Header prefetch: {files} files, {read:.3f} s reading, {wait:.3f} s "
+            f"waiting ({100 * overlap / read if read else 0:.1f}% overlapped "
+            f"with checking)\n")
+
+
+def _add_check_times(checks, check_id, calls, wall, cpu, max_wall):
+    totals = checks.setdefault(check_id, {"calls": 0, "wall": 0, "cpu": 0,
+                                          "max_wall": 0})
+    totals["calls"] += calls
+    totals["wall"] += wall
+    totals["cpu"] += cpu
+    totals["max_wall"] = max(totals["max_wall"], max_wall)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Print the slowest checks from one or more timing "
+                    "reports written by 'amf-checker --timings'."
+    )
+    parser.add_argument(
+        "reports",
+        nargs="+",
+        help="Timing report(s) to combine"
+    )
+    parser.add_argument(
+        "-n", "--top",
+        type=int,
+        default=20,
+        help="Number of checks to show. Default: 20."
+    )
+    parser.add_argument(
+        "--sort",
+        default="wall",
+        choices=["wall", "cpu", "mean"],
+        help="Sort by total wall time, total CPU time or mean wall time per "
+             "call. Default: wall."
+    )
+    args = parser.parse_args(sys.argv[1:])
+
+    reports = []
+    for path in args.reports:
+        with open(path) as f:
+            reports.append(json.load(f))
+
+    checks = aggregate_check_times(reports)
+    sys.stdout.write(format_slowest_checks(checks, top=args.top,
+                                           sort_key=args.sort))
+    sys.stdout.write(format_prefetch_summary(reports))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Watch directories for new datasets, so that files can be checked as soon as
+they have been written.
+
+On Linux, inotify is used to be told when files are closed after writing or
+moved into a watched directory. Elsewhere, or if inotify is not available, the
+directories are scanned periodically instead.
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+
+from amf_check_writer.discovery import walk_directory
+
+
+DEFAULT_SETTLE_SECONDS = 5.0
+DEFAULT_POLL_INTERVAL = 2.0
+
+# Constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+_EVENT_BUFFER_SIZE = 64 * 1024
+
+
+class InotifyWatcher(object):
+    """
+    Report files that are closed after writing or moved into a set of
+    directories (and their sub-directories, including ones created later)
+    using the Linux inotify API
+    """
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, dirs):
+        """
+        :param dirs: list of directories to watch
+        :raises OSError: if inotify is not available
+        """
+        self.dirs = dirs
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        try:
+            self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"Cannot start inotify: {os.strerror(err)}")
+
+        self._watches = {}
+        for path in dirs:
+            self._add_tree(path)
+
+    def read(self, timeout=None):
+        """
+        Wait for files to be written
+        :param timeout: maximum time to wait in seconds, or None to wait until
+                        something happens
+        :return:        list of paths to files that were written. May be
+                        empty if the timeout expired
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+
+        data = os.read(self._fd, _EVENT_BUFFER_SIZE)
+        paths = []
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so report everything
+                print("[WARNING] Too many changes at once: rescanning watched "
+                      "directories", file=sys.stderr)
+                for path in self.dirs:
+                    paths.extend(walk_directory(path, include=()))
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches:
+                continue
+
+            path = os.path.join(self._watches[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may have been added before the new directory was
+                    # watched
+                    self._add_tree(path)
+                    paths.extend(walk_directory(path, include=()))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                paths.append(path)
+
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+    def _add_tree(self, root):
+        self._add_watch(root)
+        for dirpath, dirnames, _ in os.walk(root):
+            for name in sorted(dirnames):
+                self._add_watch(os.path.join(dirpath, name))
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            print(f"[WARNING] Cannot watch '{path}': {os.strerror(err)}",
+                  file=sys.stderr)
+            return
+        self._watches[wd] = path
+
+
+class PollingWatcher(object):
+    """
+    Report files that have been created or modified in a set of directories by
+    scanning them periodically. Files that exist when the watcher is created
+    are not reported
+    """
+    def __init__(self, dirs, interval=DEFAULT_POLL_INTERVAL):
+        """
+        :param dirs:     list of directories to watch
+        :param interval: time between scans in seconds
+        """
+        self.dirs = dirs
+        self.interval = interval
+        self._seen = self._scan()
+
+    def read(self, timeout=None):
+        """
+        See `InotifyWatcher.read`
+        """
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+
+        current = self._scan()
+        paths = [path for path, sig in current.items() if self._seen.get(path) != sig]
+        self._seen = current
+        return paths
+
+    def close(self):
+        pass
+
+    def _scan(self):
+        files = {}
+        for root in self.dirs:
+            for path in walk_directory(root, include=()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (st.st_size, st.st_mtime_ns)
+        return files
+
+
+def get_watcher(dirs, poll_interval=DEFAULT_POLL_INTERVAL, polling=False):
+    """
+    Return an `InotifyWatcher` for a list of directories if possible, or a
+    `PollingWatcher` otherwise
+    :param polling: if True, always use a `PollingWatcher`
+    """
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(dirs)
+        except OSError as ex:
+            print(f"[WARNING] {ex}: falling back to scanning every "
+                  f"{poll_interval} seconds", file=sys.stderr)
+
+    return PollingWatcher(dirs, interval=poll_interval)
+
+
+def watch_directories(watcher, accept=None, settle=DEFAULT_SETTLE_SECONDS):
+    """
+    Yield batches of files as they are written to the watched directories.
+    A file is only yielded once it has not been written to for `settle`
+    seconds, so that files being written in several steps are not checked
+    half-way through. Files written again later are yielded again
+    :param watcher: `InotifyWatcher` or `PollingWatcher`
+    :param accept:  function returning True for paths that should be yielded.
+                    Default: all files
+    :param settle:  time in seconds since a file was last written before it
+                    is yielded
+    :return:        iterator (that never ends) of non-empty lists of paths,
+                    sorted within each list
+    """
+    # Time each file was last written, for files not yet yielded
+    pending = {}
+
+    while True:
+        timeout = None
+        if pending:
+            timeout = max(0, min(pending.values()) + settle - time.monotonic())
+
+        for path in watcher.read(timeout):
+            if accept is None or accept(path):
+                pending[path] = time.monotonic()
+
+        now = time.monotonic()
+        ready = sorted(path for path, written in pending.items()
+                       if now - written >= settle)
+        for path in ready:
+            del pending[path]
+
+        # Skip temporary files that were renamed or removed after writing
+        ready = [path for path in ready if os.path.isfile(path)]
+        if ready:
+            yield ready
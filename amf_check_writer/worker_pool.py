@@ -0,0 +1,194 @@
+"""
+Pool of worker processes that are replaced after checking a number of files
+or bytes, when they run out of memory, or if they crash.
+
+netCDF4/HDF5 and compliance-checker do not give back all the memory they use,
+so workers that check many files keep growing. Each worker runs in its own
+single-process `ProcessPoolExecutor`, so that the files and bytes it checks
+are counted separately and it can be retired on its own when it reaches a
+limit: tasks already submitted to it still run, and new tasks go to a fresh
+worker. The memory limit is enforced inside each worker with `RLIMIT_AS`.
+"""
+from __future__ import print_function
+import sys
+import signal
+import resource
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+DEFAULT_MAX_FILES_PER_WORKER = 1000
+
+
+class WorkerPool(object):
+    """
+    Run functions in worker processes, replacing each worker when it reaches
+    the given limits
+    """
+    def __init__(self, jobs, max_files=None, max_bytes=None, max_memory=None,
+                 retries=1):
+        """
+        :param jobs:       number of worker processes
+        :param max_files:  number of files each worker may check before being
+                           replaced, or None for no limit
+        :param max_bytes:  number of bytes each worker may check before being
+                           replaced, or None for no limit
+        :param max_memory: size in bytes of the address space of each worker,
+                           or None for no limit. A task that needs more fails
+                           with `MemoryError` and is retried in a new worker
+        :param retries:    number of times to re-run a task whose worker
+                           crashed or ran out of memory
+        """
+        self.jobs = jobs
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_memory = max_memory
+        self.retries = retries
+        self.recycled = 0
+
+        self._workers = [_Worker() for _ in range(jobs)]
+
+    def submit(self, fn, *args, files=1, size=0):
+        """
+        Run `fn(*args)` in a worker process
+        :param files: number of files checked by the call
+        :param size:  number of bytes checked by the call
+        :return:      `PoolTask` whose `result()` returns the result of the call
+        """
+        return PoolTask(self, fn, args, files, size)
+
+    def shutdown(self):
+        for worker in self._workers:
+            if worker.executor:
+                worker.executor.shutdown()
+                worker.executor = None
+
+    def _submit(self, fn, args, files, size):
+        # Send the task to the worker with the fewest tasks waiting
+        worker = min(self._workers, key=_Worker.get_pending)
+        if worker.executor is None:
+            worker.executor = ProcessPoolExecutor(max_workers=1,
+                                                  initializer=_init_worker,
+                                                  initargs=(self.max_memory,))
+            worker.files = 0
+            worker.bytes = 0
+
+        executor = worker.executor
+        future = executor.submit(_run_limited, fn, args)
+        worker.futures.append(future)
+        worker.files += files
+        worker.bytes += size
+
+        if self.max_files and worker.files >= self.max_files:
+            self._retire(executor)
+        elif self.max_bytes and worker.bytes >= self.max_bytes:
+            self._retire(executor)
+
+        return future, executor
+
+    def _retire(self, executor):
+        """
+        Stop sending tasks to a worker. It exits once it has finished the
+        tasks already submitted, and is replaced by a new worker
+        """
+        for worker in self._workers:
+            if worker.executor is executor:
+                executor.shutdown(wait=False)
+                worker.executor = None
+                self.recycled += 1
+                return
+        # Already replaced
+
+
+class _Worker(object):
+    """
+    A worker process in a `WorkerPool`, with the files and bytes it has been
+    given to check
+    """
+    def __init__(self):
+        self.executor = None
+        self.files = 0
+        self.bytes = 0
+        self.futures = []
+
+    def get_pending(self):
+        self.futures = [future for future in self.futures if not future.done()]
+        return len(self.futures)
+
+
+class PoolTask(object):
+    """
+    A call submitted to a `WorkerPool`
+    """
+    def __init__(self, pool, fn, args, files, size):
+        self.pool = pool
+        self.fn = fn
+        self.args = args
+        self.files = files
+        self.size = size
+        self.attempts = 0
+        self._submit()
+
+    def result(self):
+        """
+        Wait for the call to finish and return its result. If the worker
+        crashed or ran out of memory, the call is retried in a new worker
+
+        :raises BrokenProcessPool: if the worker crashed on every attempt
+        :raises MemoryError:       if the call needed more than the memory
+                                   limit on every attempt
+        """
+        while True:
+            try:
+                value, out_of_memory = self._future.result()
+            except BrokenProcessPool:
+                self.pool._retire(self._executor)
+                if self.attempts > self.pool.retries:
+                    raise
+                print("[WARNING] A worker process stopped unexpectedly: "
+                      "retrying its files in a new worker", file=sys.stderr)
+                self._submit()
+                continue
+
+            if out_of_memory:
+                # Memory may not be given back after a MemoryError, so the
+                # worker is not used again
+                self.pool._retire(self._executor)
+                limit = self.pool.max_memory // 2 ** 20
+                if self.attempts > self.pool.retries:
+                    raise MemoryError(f"Worker memory use reached the limit "
+                                      f"of {limit} MiB")
+                print(f"[WARNING] A worker process reached the memory limit of "
+                      f"{limit} MiB: retrying its files in a new worker",
+                      file=sys.stderr)
+                self._submit()
+                continue
+
+            return value
+
+    def _submit(self):
+        self.attempts += 1
+        self._future, self._executor = self.pool._submit(self.fn, self.args,
+                                                         self.files, self.size)
+
+
+def _init_worker(max_memory):
+    # Leave the main process to handle Ctrl-C, e.g. to stop --watch cleanly
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if max_memory:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            max_memory = min(max_memory, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, hard))
+
+
+def _run_limited(fn, args):
+    """
+    Call a function in a worker and return a tuple (result, out of memory),
+    where out of memory is True if the call failed with `MemoryError`
+    """
+    try:
+        return fn(*args), False
+    except MemoryError:
+        return None, True
@@ -7,7 +7,7 @@ Writes some documentation (Markdown) about the workflow.
 """
 
 import os
-import yaml
+from functools import lru_cache
 
 
 this_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,8 +15,11 @@ INPUT_DATA = os.path.join(this_dir, 'workflow_data.yml')
 OUTPUT_DIR = '.'
 
 
+@lru_cache(maxsize=None)
 def read_workflow_data():
-    return yaml.load(open(INPUT_DATA), Loader=yaml.SafeLoader)
+    import yaml
+    with open(INPUT_DATA) as f:
+        return yaml.load(f, Loader=yaml.SafeLoader)
 
 
 def _get(seq, indx, default=""):
@@ -1,6 +1,7 @@
 from __future__ import print_function
 import sys
 import re
+import copy
 from operator import attrgetter
 from collections import OrderedDict
 
@@ -149,6 +150,16 @@ class GlobalAttrCheck(YamlCheck):
 
         self.cv_dict = cv
 
+    def with_facets(self, facets):
+        """
+        Return a copy of this check with different facets, without parsing the
+        TSV file again
+        """
+        check = copy.copy(self)
+        super(GlobalAttrCheck, check).__init__(facets)
+        check.cv_dict = {check.namespace: self.cv_dict[self.namespace]}
+        return check
+
     def get_yaml_checks(self):
 
         attr_check_types = {
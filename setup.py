@@ -16,6 +16,11 @@ setup(
     entry_points={
         "console_scripts": [
             "amf-checker=amf_check_writer.amf_checker:main",
+            "amf-checker-history=amf_check_writer.results_db:main",
+            "amf-checker-server=amf_check_writer.checker_server:main",
+            "amf-checker-shards=amf_check_writer.sharding:main",
+            "amf-checker-timings=amf_check_writer.timings:main",
+            "create-all=amf_check_writer.create_all:main",
             "create-cvs=amf_check_writer.create_cvs:main",
             "create-yaml-checks=amf_check_writer.create_yaml_checks:main",
             "download-from-drive=amf_check_writer.download_from_drive:main",
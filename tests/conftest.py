@@ -0,0 +1,252 @@
+"""
+Helpers shared by several test modules, provided as fixtures
+"""
+import io
+
+import pytest
+import numpy as np
+from netCDF4 import Dataset
+from compliance_checker.base import Result, BaseCheck, BaseNCCheck
+
+from amf_check_writer.cvs import VariablesCV, DimensionsCV, InstrumentsCV
+from amf_check_writer.yaml_check import (WrapperYamlCheck, FileInfoCheck,
+                                         FileStructureCheck, GlobalAttrCheck)
+from amf_check_writer.rule_pack import build_rule_pack, write_rule_pack
+
+
+class DummyChecker(BaseNCCheck):
+    """
+    Minimal checker standing in for a suite generated by cc-yaml
+    """
+    _cc_spec = "dummy"
+    _cc_spec_version = "v2.0"
+    _cc_description = "Dummy checks"
+    _cc_url = ""
+    _cc_display_headers = {3: "High Priority", 2: "Medium Priority",
+                           1: "Low Priority"}
+
+    def setup(self, ds):
+        pass
+
+    def check_title_global_attribute(self, ds):
+        return Result(BaseCheck.HIGH, "title" in ds.ncattrs(), "title",
+                      ["No title"])
+
+    def check_soft_file_size_limit(self, ds):
+        return Result(BaseCheck.LOW, False, "soft size", ["Too big"])
+
+
+def _write_dataset(path, **attrs):
+    with Dataset(str(path), "w") as ds:
+        ds.setncatts(attrs)
+    return str(path)
+
+
+def _write_suite(yaml_dir):
+    yaml_dir.join("AMF_product_prod_land.yml").write(
+        "checks:\n"
+        "- __INCLUDE__: AMF_file_info.yml\n"
+        "- __INCLUDE__: AMF_product_prod_variable.yml\n"
+        "- __INCLUDE__: AMF_global_attrs.yml\n"
+    )
+    yaml_dir.join("AMF_file_info.yml").write(
+        "checks:\n"
+        "- check_id: check_soft_file_size_limit\n"
+        "  check_level: LOW\n"
+        "- check_id: check_filename_structure\n"
+        "  check_level: HIGH\n"
+    )
+    yaml_dir.join("AMF_product_prod_variable.yml").write(
+        "checks:\n"
+        "- check_id: check_wind_speed_variable_attrs\n"
+        "  check_level: MEDIUM\n"
+    )
+    yaml_dir.join("AMF_global_attrs.yml").write(
+        "checks:\n"
+        "- check_id: check_title_global_attribute\n"
+    )
+
+
+def _write_spreadsheets(tmpdir):
+    version_dir = tmpdir.mkdir("v2.0")
+    tsv_dir = version_dir.mkdir("product-definitions").mkdir("tsv")
+    tsv_dir.mkdir("_vocabularies").join("data-products.tsv").write(
+        "Data Product\nwind\n"
+    )
+    tsv_dir.mkdir("_common").join("global-attributes.tsv").write(
+        "Name\tDescription\tFixed Value\tCompliance checking rules\t"
+        "Convention Providence\tVocabulary\n"
+        "title\t\t\tString: min 4 characters\t\t\n"
+    )
+    tsv_dir.mkdir("wind").join("variables-specific.tsv").write(
+        "Variable\tAttribute\tValue\nwind_speed\t\t\n\ttype\tfloat32\n"
+    )
+    return version_dir
+
+
+def _result(path, passed=True, error=None, failed_checks=()):
+    checks = [{"check_id": "check_ok", "name": "OK", "level": "HIGH",
+               "passed": True, "score": 1, "out_of": 1, "msgs": []}]
+    for check_id in failed_checks:
+        checks.append({"check_id": check_id, "name": check_id, "level": "HIGH",
+                       "passed": False, "score": 0, "out_of": 1,
+                       "msgs": ["problem"]})
+    return {"path": path, "product": "prod", "mode": "land",
+            "suite": "product_prod_land_checks:v2.0", "passed": passed,
+            "checks": [] if error else checks, "errors": {}, "error": error}
+
+
+def _tsv(*rows):
+    return io.StringIO("\n".join("\t".join(row) for row in rows))
+
+
+def _make_cvs():
+    variables = VariablesCV(_tsv(
+        ("Variable", "Attribute", "Value"),
+        ("time", "", ""),
+        ("", "type", "float64"),
+        ("", "dimension", "time"),
+        ("", "units", "seconds since 1970-01-01 00:00:00"),
+        ("wind_speed", "", ""),
+        ("", "type", "float32"),
+        ("", "units", "m s-1"),
+        ("", "valid_min", "<derived from file>"),
+        ("", "_FillValue", "-1e20"),
+    ), ["product", "prod", "variable"])
+    dimensions = DimensionsCV(_tsv(
+        ("Name", "Length", "units"),
+        ("time", "<i>", "seconds since 1970-01-01 00:00:00"),
+        ("layer_index", "2", "1"),
+    ), ["product", "prod", "dimension"])
+    global_attrs = GlobalAttrCheck(_tsv(
+        ("Name", "Description", "Fixed Value", "Compliance checking rules",
+         "Convention Providence", "Vocabulary"),
+        ("title", "", "", "String: min 4 characters", "", ""),
+        ("product_version", "", "", "Match: vN.M", "", ""),
+        ("source", "", "", "Exact match in vocabulary", "", "ncas_instrument:id"),
+    ), ["global_attrs"])
+    return variables, dimensions, global_attrs
+
+
+def _write_checks(tmpdir):
+    """
+    Generate YAML checks and JSON CVs for product 'prod' in the same way as
+    create-yaml-checks and create-cvs
+    """
+    yaml_dir = tmpdir.mkdir("checks")
+    cvs_dir = tmpdir.mkdir("cvs")
+
+    variables, dimensions, global_attrs = _make_cvs()
+    children = [variables, dimensions, global_attrs,
+                FileInfoCheck(["file_info"]), FileStructureCheck(["file_structure"])]
+    suite = WrapperYamlCheck(children, ["product", "prod", "land"])
+    for check in children + [suite]:
+        yaml_dir.join(check.get_filename("yml")).write(check.to_yaml_check("v2.0"))
+    for cv in (variables, dimensions):
+        cvs_dir.join(cv.get_filename("json")).write(cv.to_json("v2.0"))
+
+    return str(yaml_dir), str(cvs_dir)
+
+
+def _write_native_dataset(path, good=True):
+    with Dataset(str(path), "w", format="NETCDF4_CLASSIC") as ds:
+        ds.title = "My data" if good else "My"
+        ds.product_version = "v1.0" if good else "1.0"
+        ds.source = "some-instrument"
+        ds.createDimension("time", 3)
+        ds.createDimension("layer_index", 2 if good else 5)
+
+        time = ds.createVariable("time", "f8", ("time",))
+        if good:
+            time.units = "seconds since 1970-01-01 00:00:00"
+
+        wind = ds.createVariable("wind_speed", "f4" if good else "f8", ("time",),
+                                 fill_value=-1e20 if good else -999)
+        wind.units = "m s-1"
+        if good:
+            wind.valid_min = np.float32(0)
+    return str(path)
+
+
+def _write_rule_pack(yaml_dir):
+    _, _, global_attrs = _make_cvs()
+    instruments = InstrumentsCV(_tsv(
+        ("New Instrument Name", "Old Instrument Name", "Descriptor"),
+        ("some-instrument", "", ""),
+    ), ["ncas_instrument"])
+    write_rule_pack(build_rule_pack([global_attrs], [instruments], "v2.0"), yaml_dir)
+
+
+@pytest.fixture
+def dummy_checker():
+    """
+    `DummyChecker` class
+    """
+    return DummyChecker
+
+
+@pytest.fixture
+def write_dataset():
+    """
+    Function writing a dataset with the given global attributes to a path
+    """
+    return _write_dataset
+
+
+@pytest.fixture
+def write_suite():
+    """
+    Function writing a land suite for product 'prod' and the files it
+    includes to a directory
+    """
+    return _write_suite
+
+
+@pytest.fixture
+def write_spreadsheets():
+    """
+    Function writing TSV files for a version of the spreadsheets with one
+    product, 'wind', to a directory
+    """
+    return _write_spreadsheets
+
+
+@pytest.fixture
+def make_result():
+    """
+    Function returning a file result dict, as passed to result sinks
+    """
+    return _result
+
+
+@pytest.fixture
+def make_cvs():
+    """
+    Function returning (variables CV, dimensions CV, global attribute check)
+    for product 'prod'
+    """
+    return _make_cvs
+
+
+@pytest.fixture
+def write_native_rule_pack():
+    """
+    Function writing a rule pack for the checks in `native_checks` to a
+    directory
+    """
+    return _write_rule_pack
+
+
+@pytest.fixture
+def native_checks(tmpdir):
+    """
+    YAML checks and JSON CVs for product 'prod', and a dataset that passes
+    them and one that fails
+    :return: tuple (yaml_dir, cvs_dir, good, bad)
+    """
+    yaml_dir, cvs_dir = _write_checks(tmpdir)
+    data = tmpdir.mkdir("data")
+    good = _write_native_dataset(data.join("instr_plat_19990101_prod_v1.nc"))
+    bad = _write_native_dataset(data.join("instr_plat_19990102_prod_v1.nc"),
+                                good=False)
+    return yaml_dir, cvs_dir, good, bad
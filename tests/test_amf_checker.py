@@ -1,5 +1,13 @@
+import sys
+import json
+
+import pytest
+from netCDF4 import Dataset
+
 from amf_check_writer.amf_checker import (FILENAME_REGEX, 
-        get_product_from_filename, get_deployment_mode)
+        get_product_from_filename, get_deployment_mode, _make_tasks,
+        check_files, get_suite_loader, _run_task, main)
+from amf_check_writer.deployment_modes import DeploymentModes
 
 
 def _get_good_filenames():
@@ -64,6 +72,185 @@ def test_get_product_from_filename():
         assert prod == "prod", f"Did not match product in: {fname}"
 
 
-def test_get_deployment_mode():
-    # Not written yet - need to find inside files
-    pass
+def test_get_deployment_mode(tmpdir, write_dataset):
+    for mode in DeploymentModes:
+        path = tmpdir.join(f"{mode.value}.nc")
+        write_dataset(path, deployment_mode=mode.value)
+        assert get_deployment_mode(str(path)) == mode
+
+    missing = tmpdir.join("missing.nc")
+    write_dataset(missing, title="no mode")
+    with pytest.raises(ValueError, match="not found"):
+        get_deployment_mode(str(missing))
+
+    invalid = tmpdir.join("invalid.nc")
+    write_dataset(invalid, deployment_mode="space")
+    with pytest.raises(ValueError, match="Unrecognised deployment mode"):
+        get_deployment_mode(str(invalid))
+
+
+def test_make_tasks_batches():
+    grouped = [("prod1", "land", f"a{i}.nc") for i in range(5)]
+    grouped.insert(1, ("prod2", "sea", "b.nc"))
+
+    assert list(_make_tasks(iter(grouped), batch_size=2)) == [
+        ("prod1", "land", ["a0.nc", "a1.nc"]),
+        ("prod1", "land", ["a2.nc", "a3.nc"]),
+        ("prod1", "land", ["a4.nc"]),
+        ("prod2", "sea", ["b.nc"])
+    ]
+
+
+def test_make_tasks_streams():
+    def grouped():
+        for i in range(4):
+            yield "prod", "land", f"{i}.nc"
+        raise AssertionError("Read too far ahead")
+
+    tasks = _make_tasks(grouped(), batch_size=2)
+    assert next(tasks) == ("prod", "land", ["0.nc", "1.nc"])
+    assert next(tasks) == ("prod", "land", ["2.nc", "3.nc"])
+
+
+def test_check_files(tmpdir, capsys, dummy_checker, write_dataset):
+    data = tmpdir.mkdir("data")
+    good = write_dataset(data.join("instr_plat_19990101_prod_v1.nc"),
+                         deployment_mode="land", title="My data")
+    bad = write_dataset(data.join("instr_plat_19990102_prod_v1.nc"),
+                        deployment_mode="land")
+    no_mode = write_dataset(data.join("instr_plat_19990103_prod_v1.nc"))
+    no_suite = write_dataset(data.join("instr_plat_19990104_other_v1.nc"),
+                             deployment_mode="sea")
+    bad_name = write_dataset(data.join("bad-name.nc"))
+
+    yaml_dir = str(tmpdir.mkdir("checks"))
+    loader = get_suite_loader(yaml_dir, "v2.0")
+    loader._checkers[("prod", DeploymentModes.LAND)] = ("dummy:v2.0", dummy_checker)
+
+    paths = [str(p) for p in (good, bad, no_mode, no_suite, bad_name)]
+    results = {r.path: r for r in check_files(paths, "v2.0", yaml_dir=yaml_dir)}
+    assert set(results) == set(paths)
+
+    assert results[str(good)].passed
+    assert results[str(good)].suite == "dummy:v2.0"
+    assert results[str(good)].mode == DeploymentModes.LAND
+    assert len(results[str(good)].checks) == 2
+    assert results[str(good)].timings is None
+
+    timed, = check_files([str(good)], "v2.0", yaml_dir=yaml_dir, timings=True)
+    assert set(timed.timings["checks"]) == {c.check_id for c in timed.checks}
+
+    assert not results[str(bad)].passed
+    assert results[str(bad)].error is None
+
+    for path, error in ((no_mode, "deployment_mode"), (no_suite, "does not exist"),
+                        (bad_name, "does not match")):
+        assert not results[str(path)].passed
+        assert error in results[str(path)].error
+
+    # Results are only returned, not printed
+    assert capsys.readouterr().out == ""
+
+
+def test_run_task_prefetch(tmpdir, dummy_checker, write_dataset):
+    paths = [str(write_dataset(tmpdir.join(f"instr_plat_1999010{i}_prod_v1.nc"),
+                               deployment_mode="land", title="My data"))
+             for i in range(1, 6)]
+
+    yaml_dir = str(tmpdir.mkdir("checks"))
+    loader = get_suite_loader(yaml_dir, "v2.0")
+    loader._checkers[("prod", DeploymentModes.LAND)] = ("dummy:v2.0", dummy_checker)
+
+    run_options = {"timings": True, "min_level": None, "fail_fast": False,
+                   "select": None}
+    results, report = _run_task(yaml_dir, "v2.0", {}, "prod", DeploymentModes.LAND,
+                                paths, None, [], run_options, 2)
+    assert report == ""
+    assert [r.path for r in results] == paths
+    assert all(r.passed for r in results)
+    assert all(set(r.timings["prefetch"]) == {"read", "wait"} for r in results)
+
+    # Without timings, nothing is added
+    run_options["timings"] = False
+    results, _ = _run_task(yaml_dir, "v2.0", {}, "prod", DeploymentModes.LAND,
+                           paths, None, [], run_options, 2)
+    assert all(r.timings is None for r in results)
+
+
+def _run_main(monkeypatch, argv):
+    monkeypatch.setattr(sys, "argv", ["amf-checker"] + argv)
+    with pytest.raises(SystemExit) as exc_info:
+        main()
+    return exc_info.value.code
+
+
+def test_main(tmpdir, monkeypatch, capsys, native_checks,
+              write_native_rule_pack):
+    yaml_dir, cvs_dir, good, bad = native_checks
+    write_native_rule_pack(yaml_dir)
+    data = tmpdir.join("data")
+    for path in (good, bad):
+        with Dataset(path, "a") as ds:
+            ds.deployment_mode = "land"
+
+    out_dir = tmpdir.join("out")
+    jsonl = tmpdir.join("results.jsonl")
+    cache = tmpdir.join("cache.db")
+    argv = ["--yaml-dir", yaml_dir, "-v", "v2.0", "--engine", "native",
+            "--cvs-dir", cvs_dir, "-o", str(out_dir), "--jsonl", str(jsonl),
+            "--cache", str(cache), str(data)]
+
+    # The bad file fails its checks
+    assert _run_main(monkeypatch, argv) == 1
+    out = capsys.readouterr().out
+    assert "Using cached result" not in out
+    reports = sorted(out_dir.listdir())
+    assert [r.basename for r in reports] == [
+        "instr_plat_19990101_prod_v1.nc.cc-output.txt",
+        "instr_plat_19990102_prod_v1.nc.cc-output.txt",
+    ]
+    assert "product_prod_land_checks:v2.0" in reports[1].read()
+    assert cache.check()
+
+    records = [json.loads(line) for line in jsonl.read().splitlines()]
+    files = {r["path"]: r for r in records if r["type"] == "file"}
+    assert set(files) == {good, bad}
+    assert files[good]["passed"] and not files[bad]["passed"]
+    assert records[-1]["type"] == "summary"
+
+    # Checking in worker processes gives the same reports, results and exit
+    # code
+    jobs_out_dir = tmpdir.join("out-jobs")
+    jobs_jsonl = tmpdir.join("results-jobs.jsonl")
+    jobs_argv = ["--yaml-dir", yaml_dir, "-v", "v2.0", "--engine", "native",
+                 "--cvs-dir", cvs_dir, "-o", str(jobs_out_dir),
+                 "--jsonl", str(jobs_jsonl), "--jobs", "2", str(data)]
+    assert _run_main(monkeypatch, jobs_argv) == 1
+    assert "Running checks in 2 worker processes" in capsys.readouterr().out
+    assert ([(r.basename, r.read()) for r in sorted(jobs_out_dir.listdir())]
+            == [(r.basename, r.read()) for r in reports])
+    jobs_records = [json.loads(line) for line in jobs_jsonl.read().splitlines()]
+    assert ({r["path"]: r for r in jobs_records if r["type"] == "file"}
+            == files)
+
+    # Nothing has changed, so both results come from the cache, and are
+    # still reported
+    for report in reports:
+        report.remove()
+    assert _run_main(monkeypatch, argv) == 1
+    out = capsys.readouterr().out
+    assert out.count("Using cached result") == 2
+    assert sorted(r.basename for r in out_dir.listdir()) == [r.basename for r in reports]
+    records = [json.loads(line) for line in jsonl.read().splitlines()]
+    files = {r["path"]: r for r in records if r["type"] == "file"}
+    assert set(files) == {good, bad}
+    assert all(r["cached"] for r in files.values())
+    assert records[-1]["cached"] == 2
+
+    # Only the file that changed is checked again
+    with Dataset(bad, "a") as ds:
+        ds.title = "My data"
+    assert _run_main(monkeypatch, argv) == 1
+    out = capsys.readouterr().out
+    assert out.count("Using cached result") == 1
+    assert f"Using cached result for unchanged file '{good}'" in out
@@ -0,0 +1,133 @@
+import io
+import sys
+import pickle
+import tarfile
+import zipfile
+
+import pytest
+
+from amf_check_writer.archives import (ArchiveMember, iter_archive, find_member,
+                                       get_size, read_members, STDIN)
+from amf_check_writer.discovery import iter_datasets
+from amf_check_writer.header_reader import read_global_attributes
+from amf_check_writer.check_runner import SuiteLoader, run_checks, run_file
+from amf_check_writer.deployment_modes import DeploymentModes
+from amf_check_writer.result_cache import ResultCache
+from amf_check_writer.sharding import get_shard
+from amf_check_writer.amf_checker import get_shard_group
+
+
+@pytest.fixture
+def members(tmpdir, write_dataset):
+    """
+    List of (name, contents) tuples for the members of a test archive
+    """
+    def dataset_bytes(name, **attrs):
+        with open(write_dataset(tmpdir.join(name), **attrs), "rb") as f:
+            return f.read()
+
+    return [
+        ("./a_plat_20200101_prod_v1.nc", dataset_bytes("a.nc", title="A",
+                                                       deployment_mode="land")),
+        ("sub/b_plat_20200101_prod_v1.nc", dataset_bytes("b.nc")),
+        ("sub/notes.txt", b"not a dataset"),
+        ("skip-me/c_plat_20200101_prod_v1.nc", b""),
+    ]
+
+
+def _write_tar(path, members, mode="w:gz"):
+    with tarfile.open(str(path), mode) as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def _write_zip(path, members):
+    with zipfile.ZipFile(str(path), "w") as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return str(path)
+
+
+@pytest.mark.parametrize("archive_name", ["data.tar.gz", "data.zip"])
+def test_iter_datasets_archive(tmpdir, archive_name, members):
+    write = _write_zip if archive_name.endswith(".zip") else _write_tar
+    archive = write(tmpdir.join(archive_name), members)
+
+    found = list(iter_datasets([archive], exclude=["skip-*"]))
+    assert found == [f"{archive}/a_plat_20200101_prod_v1.nc",
+                     f"{archive}/sub/b_plat_20200101_prod_v1.nc"]
+    assert found[0].data == members[0][1]
+    assert get_size(found[1]) == len(members[1][1])
+    assert len(list(iter_archive(archive))) == 4
+
+
+def test_iter_archive_stdin(tmpdir, monkeypatch, members):
+    members = members[:2]
+    for write in (_write_tar, _write_zip):
+        data = open(write(tmpdir.join("archive"), members), "rb").read()
+        stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)))
+        monkeypatch.setattr(sys, "stdin", stdin)
+        assert list(iter_archive(STDIN)) == ["<stdin>/a_plat_20200101_prod_v1.nc",
+                                             "<stdin>/sub/b_plat_20200101_prod_v1.nc"]
+
+
+def test_iter_archive_invalid(tmpdir, capsys):
+    archive = tmpdir.join("broken.tar.gz")
+    archive.write("not an archive")
+    assert list(iter_archive(str(archive))) == []
+    assert "Cannot read archive" in capsys.readouterr().err
+
+
+def test_archive_member_datasets(tmpdir, members, dummy_checker):
+    archive = _write_tar(tmpdir.join("data.tar"), members[:2], mode="w")
+    good, bad = iter_archive(archive)
+
+    assert read_global_attributes(good) == {"deployment_mode": "land"}
+    assert run_checks(dummy_checker, good)[0]
+    assert not run_checks(dummy_checker, bad)[0]
+
+    # Members keep their contents when sent to worker processes
+    copy = pickle.loads(pickle.dumps(good))
+    assert (copy, copy.data) == (good, good.data)
+    assert isinstance(find_member(str(good)), ArchiveMember)
+
+    # but results only carry the path
+    loader = SuiteLoader(str(tmpdir), "v2.0")
+    loader._checkers[("prod", DeploymentModes.LAND)] = ("dummy:v2.0", dummy_checker)
+    result = run_file(loader, good, "prod", DeploymentModes.LAND)
+    assert type(result.path) is str and result.path == good
+    assert good.data not in pickle.dumps(result)
+
+    cache = ResultCache(str(tmpdir.join("cache.db")), fast=True)
+    assert cache.get_file_fingerprint(good) != cache.get_file_fingerprint(bad)
+    cache.close()
+
+
+def test_shard_archive_members(tmpdir):
+    members = [(f"{name}_plat_20200101_prod_v1.nc", b"x" * size)
+               for name, size in (("a", 100), ("b", 60), ("c", 40))]
+    archive = _write_tar(tmpdir.join("data.tar"), members, mode="w")
+
+    # Members are listed without reading them and sized from the archive
+    # headers, so they are split by size
+    found = list(iter_datasets([archive], read_archives=False))
+    assert all(member.data is None for member in found)
+    assert [get_size(member) for member in found] == [100, 60, 40]
+    shards = [get_shard(found, i, 2, key=lambda path: path, get_size=get_size)
+              for i in (1, 2)]
+    assert shards == [[found[0]], found[1:]]
+    assert get_shard(found, 2, 2, key=get_shard_group, get_size=get_size) == found[1:]
+
+    # Only the members in the shard are read
+    read = list(read_members([str(tmpdir.join("plain.nc"))] + shards[1]))
+    assert read == [str(tmpdir.join("plain.nc"))] + found[1:]
+    assert [member.data for member in read[1:]] == [b"x" * 60, b"x" * 40]
+    assert find_member(found[0]) is None
+
+    zip_archive = _write_zip(tmpdir.join("data.zip"), members)
+    found = list(iter_datasets([zip_archive], read_archives=False))
+    assert [(m.data, get_size(m)) for m in found] == [(None, 100), (None, 60),
+                                                     (None, 40)]
@@ -0,0 +1,176 @@
+import json
+
+import pytest
+from compliance_checker.base import Result
+from compliance_checker.suite import CheckSuite
+
+from amf_check_writer.check_runner import (SuiteLoader, SUITE_FILENAME_REGEX,
+                                           run_checks, write_report,
+                                           get_suite_checks, get_suite_files,
+                                           get_check_family,
+                                           _to_check_result)
+from amf_check_writer.deployment_modes import DeploymentModes
+
+
+def test_SUITE_FILENAME_REGEX():
+    match = SUITE_FILENAME_REGEX.match("AMF_product_mean-winds_land.yml")
+    assert match.group("product") == "mean-winds"
+    assert match.group("mode") == "land"
+
+    for fname in ("AMF_product_mean-winds_variable.yml",
+                  "AMF_product_common_variable_land.yml.bak",
+                  "AMF_global_attrs.yml"):
+        assert not SUITE_FILENAME_REGEX.match(fname), fname
+
+
+def test_SuiteLoader_names(tmpdir):
+    loader = SuiteLoader(str(tmpdir), "v2.0")
+    mode = DeploymentModes.SEA
+    assert loader.get_suite_name("prod", mode) == "product_prod_sea_checks:v2.0"
+    assert loader.get_suite_path("prod", mode) == str(tmpdir.join("AMF_product_prod_sea.yml"))
+
+
+def test_SuiteLoader_missing_suite(tmpdir):
+    tmpdir.join("AMF_product_prod_variable.yml").write("checks: []")
+    loader = SuiteLoader(str(tmpdir), "v2.0")
+
+    with pytest.raises(ValueError):
+        loader.get_checker("prod", DeploymentModes.LAND)
+
+    # Included child checks are not loaded as suites
+    assert loader.load_all() == []
+
+
+def test_get_suite_checks(tmpdir, write_suite):
+    write_suite(tmpdir)
+    checks = get_suite_checks(str(tmpdir.join("AMF_product_prod_land.yml")))
+    assert [tuple(c) for c in checks] == [
+        ("check_soft_file_size_limit", "LOW", "file_info"),
+        ("check_filename_structure", "HIGH", "file_info"),
+        ("check_wind_speed_variable_attrs", "MEDIUM", "variable"),
+        # cc-yaml's default level
+        ("check_title_global_attribute", "HIGH", "global_attrs"),
+    ]
+
+
+def test_get_suite_files(tmpdir, write_suite):
+    write_suite(tmpdir)
+    suite = str(tmpdir.join("AMF_product_prod_land.yml"))
+    expected = [suite] + [str(tmpdir.join(fname)) for fname in (
+        "AMF_file_info.yml", "AMF_product_prod_variable.yml", "AMF_global_attrs.yml"
+    )]
+    assert get_suite_files(suite) == expected
+
+    # Includes are remembered between calls
+    includes = {}
+    assert get_suite_files(suite, includes) == expected
+    tmpdir.join("AMF_file_info.yml").remove()
+    assert get_suite_files(suite, includes) == expected
+
+
+@pytest.mark.parametrize("fname,family", [
+    ("AMF_file_info.yml", "file_info"),
+    ("AMF_file_structure.yml", "file_structure"),
+    ("AMF_global_attrs.yml", "global_attrs"),
+    ("AMF_product_common_global-attributes_land.yml", "global_attrs"),
+    ("AMF_product_mean-winds_global-attributes.yml", "global_attrs"),
+    ("AMF_product_common_dimension_sea.yml", "dimension"),
+    ("AMF_product_mean-winds_dimension.yml", "dimension"),
+    ("AMF_product_common_variable_air.yml", "variable"),
+    ("AMF_product_mean-winds_variable.yml", "variable"),
+    ("AMF_product_mean-winds_land.yml", None),
+])
+def test_get_check_family(fname, family):
+    assert get_check_family(fname) == family
+
+
+def test_SuiteLoader_get_check_ids(tmpdir, write_suite):
+    write_suite(tmpdir)
+    loader = SuiteLoader(str(tmpdir), "v2.0")
+    mode = DeploymentModes.LAND
+    all_ids = ["check_soft_file_size_limit", "check_filename_structure",
+               "check_wind_speed_variable_attrs", "check_title_global_attribute"]
+
+    assert loader.get_check_ids("prod", mode) == all_ids
+    assert loader.get_check_ids("prod", mode, min_level="MEDIUM") == all_ids[1:]
+    assert loader.get_check_ids("prod", mode, fail_fast=True) == [
+        "check_filename_structure", "check_title_global_attribute",
+        "check_wind_speed_variable_attrs", "check_soft_file_size_limit"
+    ]
+    assert loader.get_check_ids("prod", mode, select=["global_attrs"]) == all_ids[3:]
+    assert loader.get_check_ids("prod", mode, select=["variable", "*_file_*"]) == [
+        "check_soft_file_size_limit", "check_wind_speed_variable_attrs"
+    ]
+    assert loader.get_check_ids("prod", mode, select=["file_info"],
+                                min_level="HIGH") == ["check_filename_structure"]
+
+
+@pytest.mark.parametrize("value,passed,score,out_of", [
+    (True, True, 1, 1),
+    (False, False, 0, 1),
+    ((3, 4), False, 3, 4),
+    ((2, 2), True, 2, 2),
+])
+def test_to_check_result(value, passed, score, out_of):
+    result = Result(weight=3, value=value, name="My check", msgs=["problem"])
+    check = _to_check_result("check_my_thing", result)
+
+    assert check.check_id == "check_my_thing"
+    assert check.name == "My check"
+    assert check.level == "HIGH"
+    assert check.passed is passed
+    assert (check.score, check.out_of) == (score, out_of)
+    assert check.msgs == ["problem"]
+
+
+def test_run_checks(tmpdir, dummy_checker, write_dataset):
+    good = write_dataset(tmpdir.join("good.nc"), title="My data")
+    bad = write_dataset(tmpdir.join("bad.nc"))
+
+    raw = []
+    passed, checks, errors = run_checks(dummy_checker, good, raw_results=raw)
+    assert passed and not errors
+    assert [c.check_id for c in checks] == ["check_soft_file_size_limit",
+                                            "check_title_global_attribute"]
+    assert len(raw) == 2
+
+    # LOW failures only fail the file with strict criteria
+    assert not run_checks(dummy_checker, good, criteria="strict")[0]
+    assert not run_checks(dummy_checker, bad)[0]
+
+
+def test_run_checks_selection(tmpdir, dummy_checker, write_dataset):
+    bad = write_dataset(tmpdir.join("bad.nc"))
+    all_ids = ["check_title_global_attribute", "check_soft_file_size_limit"]
+
+    _, checks, _ = run_checks(dummy_checker, bad, check_ids=all_ids[1:])
+    assert [c.check_id for c in checks] == all_ids[1:]
+
+    _, checks, _ = run_checks(dummy_checker, bad, check_ids=all_ids)
+    assert [c.check_id for c in checks] == all_ids
+
+    # Stop after the HIGH failure
+    passed, checks, _ = run_checks(dummy_checker, bad, check_ids=all_ids,
+                                   fail_fast=True)
+    assert not passed
+    assert [c.check_id for c in checks] == all_ids[:1]
+
+    # LOW failures do not stop the checks
+    good = write_dataset(tmpdir.join("good.nc"), title="My data")
+    _, checks, _ = run_checks(dummy_checker, good, check_ids=all_ids[::-1],
+                              fail_fast=True)
+    assert len(checks) == 2
+
+
+def test_write_report(tmpdir, dummy_checker, write_dataset):
+    CheckSuite.checkers["dummy:v2.0"] = dummy_checker
+    path = write_dataset(tmpdir.join("good.nc"), title="My data")
+    raw = []
+    run_checks(dummy_checker, path, raw_results=raw)
+
+    assert "All tests passed" in write_report("dummy:v2.0", {path: raw})
+    assert "Too big" in write_report("dummy:v2.0", {path: raw}, criteria="strict")
+
+    output = tmpdir.join("report.json")
+    assert write_report("dummy:v2.0", {path: raw}, "json_new", str(output)) is None
+    assert path in json.load(output)
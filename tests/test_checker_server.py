@@ -0,0 +1,75 @@
+import json
+import threading
+from http.server import HTTPServer
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+
+import pytest
+
+from amf_check_writer.checker_server import CheckerService, CheckerRequestHandler
+
+
+@pytest.fixture
+def server_url(tmpdir):
+    service = CheckerService(str(tmpdir), "v2.0")
+    server = HTTPServer(("127.0.0.1", 0), CheckerRequestHandler)
+    server.service = service
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _post(url, body):
+    req = Request(url, data=body, headers={"Content-Type": "application/json"})
+    return json.load(urlopen(req))
+
+
+def test_suites(server_url):
+    resp = json.load(urlopen(f"{server_url}/suites"))
+    assert resp["version"] == "v2.0"
+    assert resp["suites"] == []
+
+
+def test_check_bad_filename(server_url):
+    body = json.dumps({"files": ["/data/not-an-amf-file.nc"]}).encode()
+    resp = _post(f"{server_url}/check", body)
+
+    assert len(resp["results"]) == 1
+    result = resp["results"][0]
+    assert result["path"] == "/data/not-an-amf-file.nc"
+    assert "does not match expected format" in result["error"]
+
+
+@pytest.mark.parametrize("body", [
+    b'{"paths": "oops"}',
+    b'{"files": "/data/file.nc"}',
+    b'{"files": ["/data/file.nc", 1]}',
+    b'{"files": [["/data/file.nc"]]}',
+    b'["/data/file.nc"]',
+    b'not json',
+])
+def test_check_invalid_request(server_url, body):
+    with pytest.raises(HTTPError) as exc_info:
+        _post(f"{server_url}/check", body)
+    assert exc_info.value.code == 400
+    assert "list of paths" in json.load(exc_info.value)["error"]
+
+
+def test_check_unexpected_error(server_url, monkeypatch):
+    def check_paths(self, paths):
+        raise RuntimeError("broken")
+    monkeypatch.setattr(CheckerService, "check_paths", check_paths)
+
+    body = json.dumps({"files": ["/data/file.nc"]}).encode()
+    with pytest.raises(HTTPError) as exc_info:
+        _post(f"{server_url}/check", body)
+    assert exc_info.value.code == 500
+    assert json.load(exc_info.value) == {
+        "error": "Cannot check files: RuntimeError: broken"
+    }
+
+    # The server keeps working
+    assert json.load(urlopen(f"{server_url}/suites"))["version"] == "v2.0"
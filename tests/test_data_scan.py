@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from amf_check_writer.data_scan import scan_variable, iter_chunks
+
+
+@pytest.mark.parametrize("shape,itemsize,chunk_bytes", [
+    ((10,), 4, 12),
+    ((5, 7), 8, 8 * 7 * 2),
+    # Rows larger than a chunk are split along the next axis
+    ((3, 4, 5), 4, 4 * 5 * 2),
+    ((3, 4, 5), 4, 1),
+    ((), 4, 1),
+    ((0, 3), 4, 100),
+])
+def test_iter_chunks(shape, itemsize, chunk_bytes):
+    covered = np.zeros(shape, dtype=int)
+    for index in iter_chunks(shape, itemsize, chunk_bytes):
+        assert covered[index].size * itemsize <= max(chunk_bytes, itemsize)
+        covered[index] += 1
+    assert (covered == 1).all()
+
+
+def test_scan_variable(tmpdir):
+    data = np.arange(-50, 150, dtype="f4").reshape(20, 10)
+    data[0, :3] = -999
+    data[5, 5] = np.nan
+
+    with Dataset(str(tmpdir.join("data.nc")), "w") as ds:
+        ds.createDimension("x", 20)
+        ds.createDimension("y", 10)
+        var = ds.createVariable("v", "f4", ("x", "y"), fill_value=-999)
+        var[:] = data
+
+        # Read in many small chunks
+        stats = scan_variable(var, valid_min=-10, valid_max=100,
+                              fill_value=-999, chunk_bytes=24)
+        # Masking is turned back on afterwards
+        assert np.ma.is_masked(var[0, 0])
+
+    valid = data[(data != -999) & ~np.isnan(data)]
+    assert stats.count == 200
+    assert stats.fill == 3
+    assert stats.nan == 1
+    assert stats.min == valid.min()
+    assert stats.max == 149
+    assert stats.below_min == np.count_nonzero(valid < -10)
+    assert stats.above_max == 49
+
+
+def test_scan_variable_all_fill(tmpdir):
+    with Dataset(str(tmpdir.join("data.nc")), "w") as ds:
+        ds.createDimension("x", 4)
+        var = ds.createVariable("v", "i4", ("x",), fill_value=-1)
+        var[:] = [-1, -1, -1, -1]
+        stats = scan_variable(var, valid_min=0, fill_value=-1)
+
+    assert (stats.count, stats.fill, stats.min, stats.max, stats.below_min) == (4, 4, None, None, 0)
@@ -0,0 +1,68 @@
+import json
+
+from amf_check_writer import dependency_manifest
+from amf_check_writer.spreadsheet_handler import SpreadsheetHandler
+from amf_check_writer.dependency_manifest import (DEPENDENCIES_FILENAME,
+                                                  get_generator_hash)
+from amf_check_writer.suite_manifest import SuiteManifest, hash_suite
+
+
+
+def _write_yaml(version_dir, checks_dir, capsys, **kwargs):
+    SpreadsheetHandler(str(version_dir)).write_yaml(str(checks_dir), **kwargs)
+    out = capsys.readouterr().out
+    return sorted(line.rsplit("/", 1)[-1] for line in out.splitlines()
+                  if line.startswith("[INFO] Wrote:"))
+
+
+def test_write_yaml_incremental(tmpdir, capsys, write_spreadsheets):
+    version_dir = write_spreadsheets(tmpdir)
+    checks_dir = version_dir.mkdir("amf-checks")
+    written = _write_yaml(version_dir, checks_dir, capsys)
+    assert "AMF_product_wind_variable.yml" in written
+    assert "AMF_suites.json" in written
+
+    deps = json.loads(checks_dir.join(DEPENDENCIES_FILENAME).read())["outputs"]
+    assert list(deps["AMF_product_wind_variable.yml"]["inputs"]) == ["wind/variables-specific.tsv"]
+    assert list(deps["AMF_product_wind_land.yml"]["inputs"]) == [
+        "_common/global-attributes.tsv", "wind/variables-specific.tsv"
+    ]
+    assert deps["AMF_file_info.yml"]["inputs"] == {}
+
+    # Nothing has changed
+    assert _write_yaml(version_dir, checks_dir, capsys) == []
+
+    # Only the changed check is rewritten: the top-level suites that include
+    # it are generated again but have the same contents
+    version_dir.join("product-definitions", "tsv", "wind", "variables-specific.tsv").write(
+        "Variable\tAttribute\tValue\nwind_speed\t\t\n\ttype\tdouble\n"
+    )
+    assert _write_yaml(version_dir, checks_dir, capsys) == [
+        "AMF_product_wind_variable.yml", "AMF_suites.json"
+    ]
+    assert "double" in checks_dir.join("AMF_product_wind_variable.yml").read()
+    entry = SuiteManifest.load(str(checks_dir)).get_suite("wind", "land", "v2.0")
+    assert entry.hash == hash_suite(entry.files)
+
+    # Missing outputs are written again
+    checks_dir.join("AMF_global_attrs.yml").remove()
+    assert _write_yaml(version_dir, checks_dir, capsys) == ["AMF_global_attrs.yml",
+                                                           "AMF_suites.json"]
+
+    assert len(_write_yaml(version_dir, checks_dir, capsys, force=True)) == len(written)
+
+
+def test_generator_change(tmpdir, capsys, monkeypatch, write_spreadsheets):
+    version_dir = write_spreadsheets(tmpdir)
+    checks_dir = version_dir.mkdir("amf-checks")
+    written = _write_yaml(version_dir, checks_dir, capsys)
+    manifest = json.loads(checks_dir.join(DEPENDENCIES_FILENAME).read())
+    assert manifest["generator"] == get_generator_hash()
+    assert _write_yaml(version_dir, checks_dir, capsys) == []
+
+    # Every output is written again, including those with no TSV inputs
+    monkeypatch.setattr(dependency_manifest, "_generator_hash", "changed")
+    assert _write_yaml(version_dir, checks_dir, capsys) == written
+    manifest = json.loads(checks_dir.join(DEPENDENCIES_FILENAME).read())
+    assert manifest["generator"] == "changed"
+    assert "AMF_file_info.yml" in manifest["outputs"]
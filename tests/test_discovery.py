@@ -0,0 +1,62 @@
+import os
+
+from amf_check_writer.discovery import iter_datasets, walk_directory, read_file_list
+
+
+def _make_tree(tmpdir):
+    for path in ("a.nc", "b.txt", "sub/c.nc", "sub/deeper/d.nc",
+                 "sub/skip-me/e.nc", "other/f.nc"):
+        tmpdir.join(path).write("", ensure=True)
+    return str(tmpdir)
+
+
+def _rel(root, paths):
+    return [os.path.relpath(p, root) for p in paths]
+
+
+def test_walk_directory_order_and_include(tmpdir):
+    root = _make_tree(tmpdir)
+
+    assert _rel(root, walk_directory(root)) == [
+        "a.nc", "other/f.nc", "sub/c.nc", "sub/deeper/d.nc", "sub/skip-me/e.nc"
+    ]
+    assert _rel(root, walk_directory(root, include=())) == [
+        "a.nc", "b.txt", "other/f.nc", "sub/c.nc", "sub/deeper/d.nc",
+        "sub/skip-me/e.nc"
+    ]
+
+
+def test_walk_directory_exclude_and_depth(tmpdir):
+    root = _make_tree(tmpdir)
+
+    assert _rel(root, walk_directory(root, exclude=["skip-*", "other/*"])) == [
+        "a.nc", "sub/c.nc", "sub/deeper/d.nc"
+    ]
+    assert _rel(root, walk_directory(root, max_depth=0)) == ["a.nc"]
+    assert _rel(root, walk_directory(root, max_depth=1)) == [
+        "a.nc", "other/f.nc", "sub/c.nc"
+    ]
+
+
+def test_walk_directory_symlinks(tmpdir):
+    root = _make_tree(tmpdir)
+    # Link that would cause an infinite loop if followed naively
+    os.symlink(root, os.path.join(root, "sub", "loop"))
+
+    assert "sub/loop/a.nc" not in _rel(root, walk_directory(root))
+    followed = _rel(root, walk_directory(root, follow_symlinks=True))
+    assert len(followed) == len(set(followed)) == 5
+
+
+def test_iter_datasets_files_always_included(tmpdir):
+    root = _make_tree(tmpdir)
+    txt = os.path.join(root, "b.txt")
+    sub = os.path.join(root, "sub")
+
+    assert _rel(root, iter_datasets([txt, sub], max_depth=0)) == ["b.txt", "sub/c.nc"]
+
+
+def test_read_file_list(tmpdir):
+    manifest = tmpdir.join("files.txt")
+    manifest.write("# shard 1/2\n/data/a.nc\n\n  /data/b.nc  \n")
+    assert read_file_list(str(manifest)) == ["/data/a.nc", "/data/b.nc"]
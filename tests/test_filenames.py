@@ -0,0 +1,113 @@
+import sys
+import json
+
+import pytest
+
+from amf_check_writer.amf_checker import main
+from amf_check_writer.filenames import (FILENAME_REGEX, NameVocabularies,
+                                        triage_names)
+
+
+def _write_cvs(cvs_dir):
+    cvs = {
+        "product": {"product": ["mean-winds", "surface-met"]},
+        "ncas_instrument": {"ncas_instrument": {
+            "ncas-anemometer-1": {"instrument_id": "ncas-anemometer-1",
+                                  "previous_instrument_ids": ["old-anemometer"]}
+        }},
+        "community_instrument": {"community_instrument": {
+            "ral-lidar": {"instrument_id": "ral-lidar",
+                          "previous_instrument_ids": []}
+        }},
+        "platform": {"platform": {"cao": {"platform_id": "cao"},
+                                  "ral": {"platform_id": "ral"}}},
+    }
+    for name, cv in cvs.items():
+        cvs_dir.join(f"AMF_{name}.json").write(json.dumps(cv))
+    return str(cvs_dir)
+
+
+def test_FILENAME_REGEX_groups():
+    match = FILENAME_REGEX.match("ncas-anemometer-1_ral_20190101_mean-winds_v1.0.nc")
+    assert match.group("instrument") == "ncas-anemometer-1"
+    assert match.group("platform") == "ral"
+    assert match.group("product") == "mean-winds"
+
+
+def test_NameVocabularies_triage(tmpdir):
+    vocabs = NameVocabularies.from_cvs_dir(_write_cvs(tmpdir))
+    assert vocabs.triage("ncas-anemometer-1_ral_20190101_mean-winds_v1.0.nc") == []
+    assert vocabs.triage("ral-lidar_cao_2019_surface-met_opt_v2.nc") == []
+    assert vocabs.triage("not-a-dataset.txt") == [("malformed", "not-a-dataset.txt")]
+    assert vocabs.triage("old-anemometer_xyz_20190101_winds_v1.0.nc") == [
+        ("old_instrument", "old-anemometer"),
+        ("unknown_platform", "xyz"),
+        ("unknown_product", "winds"),
+    ]
+    assert vocabs.triage("new-thing_ral_20190101_mean-winds_v1.0.nc") == [
+        ("unknown_instrument", "new-thing")
+    ]
+
+
+def test_NameVocabularies_missing_cvs(tmpdir):
+    cvs_dir = _write_cvs(tmpdir)
+    tmpdir.join("AMF_platform.json").remove()
+    # A missing CV would leave part of every name unchecked
+    with pytest.raises(ValueError, match="AMF_platform.json"):
+        NameVocabularies.from_cvs_dir(cvs_dir)
+
+    tmpdir.join("AMF_platform.json").write("{}")
+    with pytest.raises(ValueError, match="AMF_platform.json"):
+        NameVocabularies.from_cvs_dir(cvs_dir)
+
+
+def test_triage_names(tmpdir):
+    vocabs = NameVocabularies.from_cvs_dir(_write_cvs(tmpdir))
+    # The files do not exist: only their names are used
+    paths = (
+        [f"/archive/ncas-anemometer-1_ral_2019010{i}_mean-winds_v1.0.nc" for i in range(5)]
+        + [f"/archive/ncas-anemometer-1_ral_2019010{i}_winds_v1.0.nc" for i in range(3)]
+        + ["/archive/ncas-anemometer-1_ral_20190101_gusts_v1.0.nc", "/archive/bad.nc"]
+    )
+    triage = triage_names(iter(paths), vocabs, batch_size=3)
+
+    summary = triage.get_summary()
+    assert (summary["files"], summary["valid"]) == (10, 5)
+    assert list(summary["problems"]) == ["malformed", "unknown_product"]
+    assert summary["problems"]["unknown_product"]["values"] == {"winds": 3, "gusts": 1}
+    assert summary["problems"]["malformed"]["examples"] == ["/archive/bad.nc"]
+
+    text = triage.format_summary(top=1)
+    assert text.startswith("Checked 10 filenames: 5 valid, 5 with problems\n")
+    assert "    winds (3 files)\n    ... and 1 more\n" in text
+
+
+def test_main_triage_names(tmpdir, monkeypatch, capsys):
+    cvs_dir = _write_cvs(tmpdir.mkdir("cvs"))
+    # Directories are not searched and archives are not opened: each argument
+    # is a name
+    data = tmpdir.mkdir("ncas-anemometer-1_ral_20190101_mean-winds_v1.0.nc")
+    data.join("bad.nc").write("")
+    listed = tmpdir.join("list.txt")
+    listed.write("/missing/ral-lidar_cao_2019_surface-met_opt_v2.nc\n"
+                 "/missing/ncas-anemometer-1_ral_20190101_winds_v1.0.nc\n")
+    argv = ["amf-checker", "--triage-names", "--cvs-dir", cvs_dir,
+            "--files-from", str(listed), str(data), "/missing/archive.tar.gz"]
+    monkeypatch.setattr("amf_check_writer.amf_checker.iter_datasets_from_args",
+                        None)
+    monkeypatch.setattr(sys, "argv", argv)
+    with pytest.raises(SystemExit) as exc_info:
+        main()
+    assert exc_info.value.code == 1
+    out = capsys.readouterr().out
+    assert out.startswith("Checked 4 filenames: 2 valid, 2 with problems\n")
+    assert "    /missing/archive.tar.gz\n" in out
+    assert "bad.nc" not in out
+    assert "    winds (1 files)\n" in out
+
+    # All the CVs are needed
+    tmpdir.join("cvs", "AMF_product.json").remove()
+    with pytest.raises(SystemExit) as exc_info:
+        main()
+    assert exc_info.value.code == 2
+    assert "AMF_product.json" in capsys.readouterr().err
@@ -0,0 +1,63 @@
+import pytest
+from netCDF4 import Dataset
+
+from amf_check_writer.header_reader import (read_global_attributes, read_headers,
+                                            prefetch_headers)
+
+
+def _write_dataset(path, **attrs):
+    with Dataset(str(path), "w") as ds:
+        ds.setncatts(attrs)
+    return str(path)
+
+
+def test_read_global_attributes(tmpdir):
+    path = _write_dataset(tmpdir.join("a.nc"), deployment_mode="land",
+                          title="My data")
+
+    assert read_global_attributes(path) == {"deployment_mode": "land"}
+    assert read_global_attributes(path, names=("title", "other")) == {"title": "My data"}
+
+
+def test_read_headers_order_and_errors(tmpdir):
+    paths = []
+    for i in range(50):
+        mode = "sea" if i % 2 else "land"
+        paths.append(_write_dataset(tmpdir.join(f"{i}.nc"), deployment_mode=mode))
+
+    not_netcdf = tmpdir.join("not-netcdf.nc")
+    not_netcdf.write("hello")
+    paths.insert(10, str(not_netcdf))
+    paths.append(str(tmpdir.join("does-not-exist.nc")))
+
+    results = list(read_headers(iter(paths), threads=3))
+
+    assert [path for path, _ in results] == paths
+    assert isinstance(results[10][1], OSError)
+    assert isinstance(results[-1][1], OSError)
+    assert results[0][1] == {"deployment_mode": "land"}
+    assert results[1][1] == {"deployment_mode": "sea"}
+
+
+@pytest.mark.parametrize("depth", [0, 1, 3])
+def test_prefetch_headers(tmpdir, depth):
+    paths = [_write_dataset(tmpdir.join(f"{i}.nc")) for i in range(10)]
+    paths.insert(4, str(tmpdir.join("does-not-exist.nc")))
+
+    results = list(prefetch_headers(paths, depth))
+    assert [path for path, _ in results] == paths
+
+    timings = [timing for _, timing in results]
+    if depth == 0:
+        assert timings == [None] * len(paths)
+        return
+    # Missing files are left for the checks to report
+    assert timings[4] is None
+    for timing in timings[:4] + timings[5:]:
+        assert timing.read >= 0
+        assert timing.wait >= 0
+
+
+def test_prefetch_headers_off_by_default(tmpdir):
+    paths = [_write_dataset(tmpdir.join(f"{i}.nc")) for i in range(3)]
+    assert list(prefetch_headers(paths)) == [(path, None) for path in paths]
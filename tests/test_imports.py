@@ -0,0 +1,46 @@
+"""
+Check that the command line tools start quickly, by importing the packages
+that are slow to import only when they are needed
+"""
+import sys
+import json
+import subprocess
+
+import pytest
+
+
+# Packages that take a noticeable time to import
+HEAVY_MODULES = ("netCDF4", "numpy", "compliance_checker", "yaml", "pyessv",
+                 "googleapiclient", "apiclient", "httplib2", "oauth2client")
+
+
+def _imported_modules(module, argv):
+    """
+    Run an entry point's `main` with `argv` in a new interpreter
+    :return: set of top-level modules in `sys.modules` afterwards
+    """
+    code = (f"import sys, json; sys.argv = {argv!r}; "
+            f"from {module} import main\n"
+            f"try:\n    main()\nexcept SystemExit:\n    pass\n"
+            f"sys.stdout = sys.__stdout__\n"
+            f"print(json.dumps(sorted(sys.modules)))")
+    proc = subprocess.run([sys.executable, "-c", code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+    names = json.loads(proc.stdout.splitlines()[-1])
+    return {name.split(".")[0] for name in names}
+
+
+@pytest.mark.parametrize("module,argv", [
+    ("amf_check_writer.amf_checker", ["amf-checker", "--help"]),
+    ("amf_check_writer.checker_server", ["amf-checker-server", "--help"]),
+    ("amf_check_writer.create_all", ["create-all", "--help"]),
+    ("amf_check_writer.create_cvs", ["create-cvs", "--help"]),
+    ("amf_check_writer.create_yaml_checks", ["create-yaml-checks", "--help"]),
+    ("amf_check_writer.download_from_drive", ["download-from-drive", "--help"]),
+    ("amf_check_writer.results_db", ["amf-checker-history", "--help"]),
+])
+def test_entry_point_imports(module, argv):
+    imported = _imported_modules(module, argv)
+    assert module.split(".")[0] in imported
+    assert not imported.intersection(HEAVY_MODULES)
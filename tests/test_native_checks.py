@@ -0,0 +1,240 @@
+import os
+import json
+
+import pytest
+import numpy as np
+from netCDF4 import Dataset
+
+from amf_check_writer.native_checks import (NativeSuiteLoader,
+                                            ControlledVocabularies,
+                                            build_checker, _matches)
+from amf_check_writer.check_runner import SuiteLoader, run_file
+from amf_check_writer.deployment_modes import DeploymentModes
+from amf_check_writer.pyessv_writer import PyessvWriter
+from amf_check_writer.rule_pack import build_rule_pack, write_rule_pack
+
+
+def _by_id(result):
+    return {c.check_id: c for c in result.checks}
+
+
+# Results of the native checks on the suite in the `native_checks` fixture
+# with a rule pack, for its good and bad datasets, as
+# {check ID: [level, passed, score, out of]}. This is a regression snapshot of
+# the native engine, not a recording of compliance-check-lib:
+# `test_differential` is what compares the two engines, and the snapshot with
+# them
+REFERENCE_PATH = os.path.join(os.path.dirname(__file__), "data",
+                              "native_reference.json")
+
+
+def _require(module):
+    """
+    Import a module needed by `test_differential`, skipping the test if it is
+    not installed, or failing if AMF_CHECK_DIFFERENTIAL is set
+    """
+    if os.environ.get("AMF_CHECK_DIFFERENTIAL"):
+        return __import__(module)
+    return pytest.importorskip(module)
+
+
+def _summarise(checks):
+    return {check_id: [c.level, c.passed, c.score, c.out_of]
+            for check_id, c in checks.items()}
+
+
+def test_native_good_file(native_checks):
+    yaml_dir, cvs_dir, good, _ = native_checks
+    loader = NativeSuiteLoader(yaml_dir, "v2.0", cvs_dir)
+    result = run_file(loader, good, "prod", DeploymentModes.LAND)
+
+    assert result.suite == "product_prod_land_checks:v2.0"
+    # The vocabulary check cannot be run without a rule pack, so the file
+    # does not pass
+    assert not result.passed
+    assert list(result.errors) == ["check_source_global_attribute"]
+    assert "rule pack" in result.errors["check_source_global_attribute"]
+    checks = _by_id(result)
+    assert "check_source_global_attribute" not in checks
+    assert all(c.passed for c in checks.values())
+    assert (checks["check_wind_speed_variable_attrs"].score,
+            checks["check_wind_speed_variable_attrs"].out_of) == (4, 4)
+    # Index dimensions have no coordinate variable to check
+    assert checks["check_layer_index_dimension_attrs"].out_of == 2
+    assert checks["check_time_dimension_attrs"].out_of == 3
+
+
+def test_native_bad_file(native_checks):
+    yaml_dir, cvs_dir, _, bad = native_checks
+    loader = NativeSuiteLoader(yaml_dir, "v2.0", cvs_dir)
+    result = run_file(loader, bad, "prod", DeploymentModes.LAND)
+
+    assert not result.passed
+    checks = _by_id(result)
+    failed = {check_id for check_id, c in checks.items() if not c.passed}
+    assert failed == {
+        "check_title_global_attribute",
+        "check_product_version_global_attribute",
+        "check_time_variable_attrs",
+        "check_wind_speed_variable_attrs",
+        "check_wind_speed_variable_type",
+        "check_layer_index_dimension_attrs",
+        "check_time_dimension_attrs",
+    }
+    assert checks["check_title_global_attribute"].score == 1
+    wind = checks["check_wind_speed_variable_attrs"]
+    assert (wind.score, wind.out_of) == (2, 4)
+    assert len(wind.msgs) == 2
+
+
+def test_native_selection(native_checks):
+    yaml_dir, cvs_dir, _, bad = native_checks
+    loader = NativeSuiteLoader(yaml_dir, "v2.0", cvs_dir)
+    result = run_file(loader, bad, "prod", DeploymentModes.LAND,
+                      select=["dimension"])
+    assert set(_by_id(result)) == {"check_layer_index_dimension_attrs",
+                                   "check_time_dimension_attrs"}
+
+
+def test_build_checker_missing_cv(native_checks, tmpdir):
+    yaml_dir, _, good, _ = native_checks
+    loader = NativeSuiteLoader(yaml_dir, "v2.0", str(tmpdir.mkdir("empty")))
+    result = run_file(loader, good, "prod", DeploymentModes.LAND)
+    assert not result.passed
+    assert "Cannot read controlled vocabulary" in result.errors["check_time_variable_attrs"]
+
+
+def test_build_checker_unsupported(native_checks):
+    yaml_dir, cvs_dir, _, _ = native_checks
+    _, unsupported = build_checker(f"{yaml_dir}/AMF_product_prod_land.yml",
+                                   ControlledVocabularies(cvs_dir))
+    assert unsupported == ["check_source_global_attribute"]
+
+
+@pytest.mark.parametrize("actual,expected,matches", [
+    ("m s-1", "m s-1", True),
+    ("m/s", "m s-1", False),
+    ("anything", "<derived from file>", True),
+    (np.float32(-1e20), -1e20, True),
+    (np.array([1.0, 1.0]), 1.0, True),
+    ("not a number", 1.0, False),
+])
+def test_matches(actual, expected, matches):
+    assert _matches(actual, expected) == matches
+
+
+def test_differential(native_checks, tmpdir, monkeypatch, make_cvs,
+                      write_native_rule_pack):
+    """
+    The native checks give the same results as compliance-check-lib.
+
+    This is skipped unless cc-yaml and compliance-check-lib are installed,
+    and fails instead with AMF_CHECK_DIFFERENTIAL set, as in the CI job that
+    runs it
+    """
+    _require("cc_yaml")
+    _require("pyessv")
+    yaml_dir, cvs_dir, good, bad = native_checks
+
+    # compliance-check-lib reads the CVs from a pyessv archive
+    monkeypatch.setenv("PYESSV_ARCHIVE_HOME", str(tmpdir.mkdir("pyessv")))
+    variables, dimensions, _ = make_cvs()
+    PyessvWriter().write_cvs([variables, dimensions])
+    _require("checklib")
+
+    write_native_rule_pack(yaml_dir)
+    native = NativeSuiteLoader(yaml_dir, "v2.0", cvs_dir)
+    reference = SuiteLoader(yaml_dir, "v2.0")
+    with open(REFERENCE_PATH) as f:
+        recorded = json.load(f)
+
+    for name, path in (("good", good), ("bad", bad)):
+        expected = _summarise(_by_id(run_file(reference, path, "prod",
+                                              DeploymentModes.LAND)))
+        actual = _summarise(_by_id(run_file(native, path, "prod",
+                                            DeploymentModes.LAND)))
+        assert actual == expected
+        assert recorded[name] == expected
+
+
+def test_native_rule_pack(native_checks, capsys, write_native_rule_pack):
+    yaml_dir, cvs_dir, good, bad = native_checks
+    write_native_rule_pack(yaml_dir)
+
+    loader = NativeSuiteLoader(yaml_dir, "v2.0", cvs_dir)
+    assert loader.rule_pack is not None
+    good_checks = _by_id(run_file(loader, good, "prod", DeploymentModes.LAND))
+    bad_checks = _by_id(run_file(loader, bad, "prod", DeploymentModes.LAND))
+
+    # Vocabulary checks are run from the rule pack
+    assert "cannot be run natively" not in capsys.readouterr().err
+    assert good_checks["check_source_global_attribute"].passed
+    assert good_checks["check_title_global_attribute"].passed
+    assert (bad_checks["check_title_global_attribute"].score,
+            bad_checks["check_title_global_attribute"].out_of) == (1, 2)
+
+
+def test_native_scan_data(native_checks, tmpdir):
+    yaml_dir, cvs_dir, good, _ = native_checks
+    with Dataset(good, "a") as ds:
+        ds.variables["wind_speed"][:] = np.ma.masked_values([-1, 5, -1e20], -1e20)
+
+    loader = NativeSuiteLoader(yaml_dir, "v2.0", cvs_dir, scan_data=True,
+                               chunk_bytes=4)
+    result = run_file(loader, good, "prod", DeploymentModes.LAND,
+                      select=["data_values"])
+
+    # Only wind_speed has a valid range, taken from the file's valid_min
+    [check] = result.checks
+    assert check.check_id == "check_wind_speed_data_values"
+    assert (check.score, check.out_of) == (0, 1)
+    assert check.msgs == ["1 values of 'wind_speed' are below valid_min 0.0 "
+                          "(minimum -1.0)."]
+    assert not result.passed
+
+
+def test_native_suite_hash(native_checks, make_cvs, write_native_rule_pack):
+    yaml_dir, cvs_dir, _, _ = native_checks
+
+    def get_hash():
+        loader = NativeSuiteLoader(yaml_dir, "v2.0", cvs_dir)
+        return loader.get_suite_hash("prod", DeploymentModes.LAND)
+
+    original = get_hash()
+    assert original == get_hash()
+    assert original != SuiteLoader(yaml_dir, "v2.0").get_suite_hash(
+        "prod", DeploymentModes.LAND
+    )
+
+    # Changing a CV the checks read changes the hash
+    cv_path = f"{cvs_dir}/AMF_product_prod_variable.json"
+    with open(cv_path) as f:
+        content = f.read()
+    with open(cv_path, "w") as f:
+        f.write(content.replace("m s-1", "km h-1"))
+    changed_cv = get_hash()
+    assert changed_cv != original
+
+    # As does adding or changing the rule pack
+    _, _, global_attrs = make_cvs()
+    write_rule_pack(build_rule_pack([global_attrs], [], "v2.0"), yaml_dir)
+    with_pack = get_hash()
+    assert with_pack != changed_cv
+    write_native_rule_pack(yaml_dir)
+    assert get_hash() not in (with_pack, changed_cv, original)
+
+
+def test_native_reference(native_checks, write_native_rule_pack):
+    """
+    The native checks give the results in the snapshot
+    """
+    yaml_dir, cvs_dir, good, bad = native_checks
+    write_native_rule_pack(yaml_dir)
+    loader = NativeSuiteLoader(yaml_dir, "v2.0", cvs_dir)
+    with open(REFERENCE_PATH) as f:
+        recorded = json.load(f)
+
+    for name, path in (("good", good), ("bad", bad)):
+        result = run_file(loader, path, "prod", DeploymentModes.LAND)
+        assert not result.errors
+        assert _summarise(_by_id(result)) == recorded[name], name
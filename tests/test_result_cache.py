@@ -0,0 +1,72 @@
+from amf_check_writer.result_cache import ResultCache
+
+
+def _write_suite(yaml_dir):
+    yaml_dir.join("AMF_product_prod_land.yml").write(
+        "suite_name: product_prod_land_checks:v2.0\n"
+        "checks:\n"
+        "- __INCLUDE__: AMF_file_info.yml\n"
+        "- __INCLUDE__: AMF_product_prod_variable.yml\n"
+    )
+    yaml_dir.join("AMF_file_info.yml").write("checks:\n- check_id: check_a\n")
+    yaml_dir.join("AMF_product_prod_variable.yml").write("checks:\n- check_id: check_b\n")
+    return str(yaml_dir.join("AMF_product_prod_land.yml"))
+
+
+def test_key_changes(tmpdir):
+    suite = _write_suite(tmpdir.mkdir("checks"))
+    data = tmpdir.join("data.nc")
+    data.write("original")
+
+    cache = ResultCache(str(tmpdir.join("cache.db")))
+    key = cache.get_key(str(data), suite, "v2.0", "text")
+
+    assert cache.get_key(str(data), suite, "v2.0", "text") == key
+    assert cache.get_key(str(data), suite, "v1.0", "text") != key
+    assert cache.get_key(str(data), suite, "v2.0", "html") != key
+
+    data.write("modified")
+    assert cache.get_key(str(data), suite, "v2.0", "text") != key
+
+    # Suite hashes include included files, but are only computed once per
+    # cache object
+    data.write("original")
+    tmpdir.join("checks", "AMF_file_info.yml").write("checks: []\n")
+    assert cache.get_key(str(data), suite, "v2.0", "text") == key
+    new_cache = ResultCache(str(tmpdir.join("cache2.db")))
+    assert new_cache.get_key(str(data), suite, "v2.0", "text") != key
+
+
+def test_fast_fingerprint(tmpdir):
+    data = tmpdir.join("data.nc")
+    data.write("original")
+    cache = ResultCache(str(tmpdir.join("cache.db")), fast=True)
+
+    fingerprint = cache.get_file_fingerprint(str(data))
+    assert fingerprint.startswith("8:")
+    data.write("much longer contents")
+    assert cache.get_file_fingerprint(str(data)) != fingerprint
+
+
+def test_put_and_get(tmpdir):
+    path = str(tmpdir.join("cache.db"))
+    cache = ResultCache(path)
+    assert cache.get("data.nc") is None
+    cache.put("data.nc", "abc", 1, "Some failures")
+    cache.close()
+
+    entry = ResultCache(path).get("data.nc")
+    assert entry.key == "abc"
+    assert entry.exit_code == 1
+    assert entry.output == "Some failures"
+    assert entry.result is None
+
+
+def test_put_structured_result(tmpdir):
+    path = str(tmpdir.join("cache.db"))
+    cache = ResultCache(path)
+    cache.put("data.nc", "abc", 0, "All passed", {"path": "data.nc", "passed": True})
+    cache.close()
+
+    entry = ResultCache(path).get("data.nc")
+    assert entry.result == {"path": "data.nc", "passed": True}
@@ -0,0 +1,49 @@
+import gzip
+import json
+
+from amf_check_writer.result_sinks import JsonLinesSink
+
+
+def _read_records(path, opener=open):
+    with opener(path, "rt") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_JsonLinesSink(tmpdir, make_result):
+    path = str(tmpdir.join("results.jsonl"))
+    sink = JsonLinesSink(path)
+    sink.write(make_result("a.nc"))
+    sink.write(make_result("b.nc", passed=False, failed_checks=["check_x", "check_y"]))
+    sink.write(make_result("c.nc", passed=False, failed_checks=["check_x"]), cached=True)
+    sink.write(make_result("d.nc", passed=False, error="Cannot read 'd.nc'"))
+    sink.close()
+
+    records = _read_records(path)
+    assert [r["type"] for r in records] == ["file"] * 4 + ["summary"]
+
+    assert records[0]["path"] == "a.nc"
+    assert records[0]["checks_run"] == 1
+    assert records[0]["failed_checks"] == []
+    assert not records[0]["cached"]
+    assert [c["check_id"] for c in records[1]["failed_checks"]] == ["check_x", "check_y"]
+    assert records[2]["cached"]
+    assert records[3]["error"] == "Cannot read 'd.nc'"
+
+    summary = records[-1]
+    assert (summary["files"], summary["passed"], summary["failed"],
+            summary["errors"], summary["cached"]) == (4, 1, 2, 1, 1)
+    assert summary["failures_per_check"] == {"check_x": 2, "check_y": 1}
+    assert list(summary["failures_per_check"]) == ["check_x", "check_y"]
+
+
+def test_JsonLinesSink_per_check_gzip(tmpdir, make_result):
+    path = str(tmpdir.join("results.jsonl.gz"))
+    sink = JsonLinesSink(path, per_check=True)
+    sink.write(make_result("a.nc", passed=False, failed_checks=["check_x"]))
+    sink.close()
+
+    records = _read_records(path, opener=gzip.open)
+    assert [r["type"] for r in records] == ["file", "check", "check", "summary"]
+    assert records[2]["path"] == "a.nc"
+    assert records[2]["check_id"] == "check_x"
+    assert not records[2]["passed"]
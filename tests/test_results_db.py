@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+from amf_check_writer.results_db import ResultsDatabase, main, parse_time
+
+
+
+@pytest.fixture
+def db_path(tmpdir, monkeypatch, make_result):
+    times = iter([100, 200, 300, 400, 500, 600, 700])
+    monkeypatch.setattr("amf_check_writer.results_db.time.time", lambda: next(times))
+
+    path = str(tmpdir.join("results.db"))
+    db = ResultsDatabase(path, batch_size=2)
+    db.start_run("v2.0", options={"select": ["global_attrs"]})  # t=100
+    db.write(make_result("a.nc"))                                # t=200
+    db.write(make_result("b.nc", passed=False, failed_checks=["check_x"]))
+    db.write(make_result("c.nc", passed=False, failed_checks=["check_x", "check_y"]),
+             cached=True)                                        # t=400
+    db.write(make_result("d.nc", passed=False, error="Cannot read 'd.nc'"))
+    db.close()                                                   # t=600
+    return path
+
+
+def test_ResultsDatabase_find_failures(db_path):
+    db = ResultsDatabase(db_path)
+
+    failures = db.find_failures(check_id="check_x")
+    assert [(os.path.basename(f.path), f.checked_at, f.msgs) for f in failures] == [
+        ("b.nc", 300, ["problem"]), ("c.nc", 400, ["problem"])
+    ]
+    assert failures[0].version == "v2.0"
+    assert [os.path.basename(f.path) for f in db.find_failures(check_id="check_x",
+                                                               since=350)] == ["c.nc"]
+    assert db.find_failures(check_id="check_x", until=300) == []
+    assert db.find_failures(check_id="check_x", product="other") == []
+    assert db.find_failures(check_id="check_ok") == []
+
+    files = db.find_failures(mode="land")
+    assert [(os.path.basename(f.path), f.check_id) for f in files] == [
+        ("b.nc", None), ("c.nc", None), ("d.nc", None)
+    ]
+    assert files[-1].msgs == ["Cannot read 'd.nc'"]
+    assert len(db.find_failures(limit=1)) == 1
+
+    run, = db.get_runs()
+    assert (run.started_at, run.finished_at, run.files) == (100, 600, 4)
+    assert run.options == {"select": ["global_attrs"]}
+    db.close()
+
+
+def test_ResultsDatabase_indexes(db_path, make_result):
+    db = ResultsDatabase(db_path)
+    plan = db._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM checks WHERE check_id = ? AND "
+        "passed = 0 AND checked_at >= ?", ("check_x", 0)
+    ).fetchall()
+    assert "checks_check_id" in str(plan)
+    db.close()
+
+    with pytest.raises(ValueError):
+        ResultsDatabase(db_path).write(make_result("e.nc"))
+
+
+def test_main(db_path, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["amf-checker-history", db_path,
+                                      "--check", "check_y"])
+    main()
+    line, = capsys.readouterr().out.splitlines()
+    assert line.split("\t")[1:] == [os.path.abspath("c.nc"), "check_y", "problem"]
+
+    assert parse_time("1970-01-02T00:00+00:00") == 86400
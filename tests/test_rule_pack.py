@@ -0,0 +1,106 @@
+import io
+
+import pytest
+
+from amf_check_writer.cvs import InstrumentsCV, ProductsCV
+from amf_check_writer.yaml_check import GlobalAttrCheck
+from amf_check_writer.rule_pack import (RulePack, build_rule_pack,
+                                        write_rule_pack, resolve_vocab_lookup)
+
+
+def _tsv(*rows):
+    return io.StringIO("\n".join("\t".join(row) for row in rows))
+
+
+def _attr_check(namespace, *rows):
+    return GlobalAttrCheck(_tsv(
+        ("Name", "Description", "Fixed Value", "Compliance checking rules",
+         "Convention Providence", "Vocabulary"),
+        *rows
+    ), [namespace])
+
+
+def _cvs():
+    instruments = InstrumentsCV(_tsv(
+        ("New Instrument Name", "Old Instrument Name", "Descriptor"),
+        ("ncas-lidar-1", "old-lidar", "A lidar"),
+        ("ncas-radar-1", "", "A radar"),
+    ), ["ncas_instrument"])
+    products = ProductsCV(_tsv(("Data Product",), ("wind",), ("rain",)),
+                          ["product"])
+    return [instruments, products]
+
+
+def _pack():
+    common = _attr_check(
+        "global_attrs",
+        ("title", "", "", "String: min 4 characters", "", ""),
+        ("product_version", "", "", "Match: vN.M", "", ""),
+        ("source", "", "", "Exact match in vocabulary", "", "ncas_instrument:instrument_id"),
+        ("bad_regex", "", "", "One of: a, (b", "", ""),
+    )
+    product = _attr_check(
+        "product_wind_global-attributes",
+        ("title", "", "", "String: min 4 characters", "", ""),
+        ("product", "", "", "Exact match in vocabulary", "", "product:id"),
+    )
+    return build_rule_pack([product, common], _cvs(), "v2.0")
+
+
+def test_build_rule_pack(capsys):
+    pack = _pack()
+    assert pack["version"] == "v2.0"
+    assert list(pack["rules"]) == ["global_attrs", "product_wind_global-attributes"]
+
+    # Identical regexes are stored once
+    assert len(pack["patterns"]) == 2
+    assert (pack["rules"]["global_attrs"]["title"]
+            == pack["rules"]["product_wind_global-attributes"]["title"])
+
+    # Vocabularies are resolved to the allowed values
+    source = pack["rules"]["global_attrs"]["source"]
+    assert pack["vocabularies"][source["vocabulary"]] == ["ncas-lidar-1", "ncas-radar-1"]
+    product = pack["rules"]["product_wind_global-attributes"]["product"]
+    assert pack["vocabularies"][product["vocabulary"]] == ["rain", "wind"]
+
+    # Invalid regexes are left out with a warning
+    assert "bad_regex" not in pack["rules"]["global_attrs"]
+    assert "Invalid regex for global attribute 'bad_regex'" in capsys.readouterr().err
+
+
+def test_RulePack_check(tmpdir):
+    path = write_rule_pack(_pack(), str(tmpdir))
+    pack = RulePack.load(path)
+
+    results = pack.check({"title": "My data", "product_version": "1.0",
+                          "source": "ncas-lidar-1"}, "global_attrs")
+    assert {attr: result[:2] for attr, result in results.items()} == {
+        "title": (2, 2),
+        "product_version": (1, 2),
+        "source": (2, 2),
+    }
+    assert pack.check({}, "global_attrs")["title"][0] == 0
+    assert pack.check({}, "unknown") == {}
+    assert pack.has_rule("product_wind_global-attributes", "product")
+    assert not pack.has_rule("global_attrs", "product")
+
+
+def test_RulePack_invalid(tmpdir):
+    path = tmpdir.join("pack.json")
+    path.write('{"format": 1}')
+    with pytest.raises(ValueError):
+        RulePack.load(str(path))
+
+    path.write('{"format": 99}')
+    with pytest.raises(ValueError):
+        RulePack.load(str(path))
+
+
+def test_resolve_vocab_lookup():
+    cvs = {cv.namespace: cv.cv_dict[cv.namespace] for cv in _cvs()}
+    assert resolve_vocab_lookup("ncas_instrument:data:previous_instrument_ids "
+                                "product:data:id", cvs) == ("old-lidar", "rain", "wind")
+
+    for lookup in ("platform:data:platform_id", "ncas_instrument"):
+        with pytest.raises(ValueError):
+            resolve_vocab_lookup(lookup, cvs)
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import tarfile
+
+import pytest
+from netCDF4 import Dataset
+
+from amf_check_writer import sharding, amf_checker
+from amf_check_writer.sharding import (plan_shards, get_shard,
+                                       parse_shard_spec, write_manifest)
+
+
+SIZES = {
+    "a/p1_1.nc": 40, "a/p1_2.nc": 40,
+    "b/p2_1.nc": 30, "b/p2_2.nc": 20,
+    "c/p3_1.nc": 10, "c/p3_2.nc": 10, "c/p3_3.nc": 10,
+    "d/big_1.nc": 100, "d/big_2.nc": 100,
+}
+
+
+def _group(path):
+    return os.path.basename(path).split("_")[0]
+
+
+def _plan(paths, count):
+    return plan_shards(paths, count, key=_group, get_size=SIZES.__getitem__)
+
+
+@pytest.mark.parametrize("spec,expected", [("1/4", (1, 4)), ("4/4", (4, 4))])
+def test_parse_shard_spec(spec, expected):
+    assert parse_shard_spec(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["0/4", "5/4", "1/0", "1", "a/b", "1/2/3"])
+def test_parse_shard_spec_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_shard_spec(spec)
+
+
+def test_plan_shards_balances_bytes_and_keeps_groups():
+    shards = _plan(list(SIZES), 3)
+
+    # Every file is in exactly one shard
+    assert sorted(p for s in shards for p in s.paths) == sorted(SIZES)
+    assert [s.index for s in shards] == [1, 2, 3]
+    assert sum(s.size for s in shards) == sum(SIZES.values())
+
+    # 'big' is larger than a third of the total, so is split; the other
+    # groups are not
+    assert [s.size for s in shards] == [130, 100, 130]
+    for group in ("p1", "p2", "p3"):
+        assert len([s for s in shards if any(_group(p) == group for p in s.paths)]) == 1
+
+
+def test_plan_shards_deterministic():
+    paths = list(SIZES)
+    shards = _plan(paths, 4)
+    assert _plan(list(reversed(paths)), 4) == shards
+    assert _plan(paths, 4) == shards
+
+
+def test_plan_shards_zero_size():
+    sizes = {f"{group}_{i}.nc": 0 for group in "abcdef" for i in range(2)}
+    shards = plan_shards(list(sizes), 3, key=_group, get_size=sizes.__getitem__)
+    assert [len(s.paths) for s in shards] == [4, 4, 4]
+
+    # Files that cannot be sized count as empty
+    def get_size(path):
+        raise OSError("No such file")
+    shards = plan_shards(list(sizes), 3, key=_group, get_size=get_size)
+    assert [len(s.paths) for s in shards] == [4, 4, 4]
+
+
+def test_plan_shards_more_shards_than_files():
+    shards = _plan(["a/p1_1.nc"], 3)
+    assert [s.paths for s in shards] == [["a/p1_1.nc"], [], []]
+
+
+def test_get_shard_and_manifest(tmpdir):
+    tmpdir.join("x_1.nc").write("12345")
+    tmpdir.join("y_1.nc").write("1")
+    paths = [str(tmpdir.join("x_1.nc")), str(tmpdir.join("y_1.nc"))]
+
+    assert get_shard(paths, 1, 2, key=_group) == [paths[0]]
+    assert get_shard(paths, 2, 2, key=_group) == [paths[1]]
+
+    manifest = tmpdir.join("manifest.txt")
+    with open(str(manifest), "w") as f:
+        write_manifest(plan_shards(paths, 1, key=_group)[0], f)
+    assert manifest.read().splitlines() == [
+        "# shard 1/1: 2 files, 6 bytes", paths[0], paths[1]
+    ]
+
+
+def _run(monkeypatch, module, argv):
+    monkeypatch.setattr(sys, "argv", argv)
+    with pytest.raises(SystemExit) as exc_info:
+        module.main()
+        sys.exit(0)
+    return exc_info.value.code
+
+
+def test_manifests_through_amf_checker(tmpdir, monkeypatch, capsys,
+                                       native_checks, write_native_rule_pack):
+    yaml_dir, cvs_dir, good, bad = native_checks
+    write_native_rule_pack(yaml_dir)
+    for path in (good, bad):
+        with Dataset(path, "a") as ds:
+            ds.deployment_mode = "land"
+
+    shards_dir = tmpdir.join("shards")
+    assert _run(monkeypatch, sharding, ["amf-checker-shards", "-n", "2", "-o",
+                                        str(shards_dir), str(tmpdir.join("data"))]) == 0
+
+    # Checking every shard checks every file once
+    checked = []
+    for i, manifest in enumerate(sorted(shards_dir.listdir())):
+        listed = [line for line in manifest.read().splitlines()
+                  if not line.startswith("#")]
+        jsonl = tmpdir.join(f"results-{i}.jsonl")
+        code = _run(monkeypatch, amf_checker, [
+            "amf-checker", "--yaml-dir", yaml_dir, "-v", "v2.0",
+            "--engine", "native", "--cvs-dir", cvs_dir, "--jsonl", str(jsonl),
+            "--files-from", str(manifest)
+        ])
+        assert "Cannot read" not in capsys.readouterr().err
+        records = [json.loads(line) for line in jsonl.read().splitlines()]
+        paths = [r["path"] for r in records if r["type"] == "file"]
+        assert sorted(paths) == sorted(listed)
+        assert code == (1 if bad in paths else 0)
+        checked.extend(paths)
+    assert sorted(checked) == [good, bad]
+
+
+def test_main_rejects_archives(tmpdir, monkeypatch, capsys):
+    archive = str(tmpdir.join("data.tar.gz"))
+    with tarfile.open(archive, "w:gz"):
+        pass
+    assert _run(monkeypatch, sharding, ["amf-checker-shards", "-n", "2",
+                                        archive]) == 2
+    assert "amf-checker --shard" in capsys.readouterr().err
@@ -0,0 +1,125 @@
+import os
+import argparse
+
+import pytest
+
+from amf_check_writer.spreadsheet_handler import SpreadsheetHandler
+from amf_check_writer.spreadsheet_model import (SpreadsheetModel, get_sources,
+                                                add_spreadsheet_arguments,
+                                                get_handler_from_args)
+from amf_check_writer.yaml_check import GlobalAttrCheck
+
+
+def test_get_model(tmpdir, capsys, write_spreadsheets):
+    version_dir = write_spreadsheets(tmpdir)
+    sh = SpreadsheetHandler(str(version_dir))
+    model = sh.get_model()
+    assert sh.get_model() is model
+    assert model.product_names == sh.product_names == {"wind"}
+
+    # The common global attributes are parsed once for all deployment modes
+    assert capsys.readouterr().out.count("global-attributes.tsv") == 1
+    attr_checks = [cv for cv in model.cvs if isinstance(cv, GlobalAttrCheck)]
+    assert [cv.namespace for cv in attr_checks] == [
+        "product_common_global-attributes_land",
+        "product_common_global-attributes_sea",
+        "product_common_global-attributes_air",
+        "product_common_global-attributes_trajectory",
+    ]
+    assert list(attr_checks[1].cv_dict) == ["product_common_global-attributes_sea"]
+    assert model.global_attrs.get_identifier() == "AMF_global_attrs"
+    assert list(model.global_attrs.all_check_details) == ["title"]
+
+
+def test_get_model_cache(tmpdir, capsys, write_spreadsheets):
+    version_dir = write_spreadsheets(tmpdir)
+    cache_path = str(tmpdir.join("model.pickle"))
+    model = SpreadsheetHandler(str(version_dir), cache_path=cache_path).get_model()
+    assert os.path.isfile(cache_path)
+    capsys.readouterr()
+
+    sh = SpreadsheetHandler(str(version_dir), cache_path=cache_path)
+    cached = sh.get_model()
+    assert "Extracting content" not in capsys.readouterr().out
+    assert [cv.cv_dict for cv in cached.cvs] == [cv.cv_dict for cv in model.cvs]
+    assert sh.product_names == {"wind"}
+    assert {cv.tsv_name for cv in cached.cvs if hasattr(cv, "tsv_name")} == {
+        str(version_dir.join("product-definitions", "tsv", path))
+        for path in ("_vocabularies/data-products.tsv", "wind/variables-specific.tsv")
+    }
+
+    # Only spreadsheets that have changed are parsed again
+    tsv_dir = version_dir.join("product-definitions", "tsv")
+    tsv_dir.join("wind", "variables-specific.tsv").write(
+        "Variable\tAttribute\tValue\nwind_speed\t\t\n\ttype\tdouble\n"
+    )
+    updated = SpreadsheetHandler(str(version_dir), cache_path=cache_path).get_model()
+    extracted = [line for line in capsys.readouterr().out.splitlines()
+                 if "Extracting content" in line]
+    assert len(extracted) == 1 and extracted[0].endswith("variables-specific.tsv")
+    assert updated.sources["wind/variables-specific.tsv"].hash != \
+        model.sources["wind/variables-specific.tsv"].hash
+    wind, = [cv for cv in updated.cvs if updated.get_source(cv) == "wind/variables-specific.tsv"]
+    assert wind.cv_dict["product_wind_variable"]["wind_speed"] == {"type": "double"}
+
+    # Unchanged files are not hashed again
+    sources = get_sources(str(tsv_dir), previous={
+        path: source._replace(hash="old") for path, source in updated.sources.items()
+    })
+    assert {source.hash for source in sources.values()} == {"old"}
+
+    tmpdir.join("invalid.pickle").write("not a model")
+    assert SpreadsheetModel.load(str(tmpdir.join("invalid.pickle"))) is None
+    assert "Ignoring invalid spreadsheet cache" in capsys.readouterr().err
+
+
+def test_write_yaml_from_model(tmpdir, write_spreadsheets):
+    version_dir = write_spreadsheets(tmpdir)
+    checks_dir = version_dir.mkdir("amf-checks")
+    SpreadsheetHandler(str(version_dir)).write_yaml(str(checks_dir))
+
+    global_attrs = checks_dir.join("AMF_global_attrs.yml").read()
+    assert "suite_name: global_attrs_checks:v2.0" in global_attrs
+    assert "check_title_global_attribute" in global_attrs
+    assert checks_dir.join("AMF_product_wind_land.yml").check()
+
+
+def test_get_model_jobs(tmpdir, capsys, write_spreadsheets):
+    version_dir = write_spreadsheets(tmpdir)
+    tsv_dir = version_dir.join("product-definitions", "tsv")
+    tsv_dir.mkdir("rain").join("variables-specific.tsv").write(
+        "Variable\tAttribute\tValue\nrain_rate\t\t\n\ttype\tfloat32\n"
+    )
+    tsv_dir.mkdir("broken").join("variables-specific.tsv").write(
+        "Variable\tAttribute\tValue\nbad?name\t\t\n"
+    )
+
+    outputs = []
+    models = []
+    for jobs in (1, 3):
+        models.append(SpreadsheetHandler(str(version_dir), jobs=jobs).get_model())
+        outputs.append(capsys.readouterr())
+
+    serial, parallel = models
+    assert [cv.get_identifier() for cv in parallel.cvs] == \
+        [cv.get_identifier() for cv in serial.cvs]
+    assert [cv.cv_dict for cv in parallel.cvs] == [cv.cv_dict for cv in serial.cvs]
+    assert parallel.product_names == {"wind", "rain", "broken"}
+
+    # Output is printed in the same order, including parse errors
+    assert outputs[0] == outputs[1]
+    assert "Failed to parse" in outputs[1].err
+
+
+def test_get_handler_from_args(tmpdir):
+    parser = argparse.ArgumentParser()
+    add_spreadsheet_arguments(parser)
+    cache = str(tmpdir.join("cache"))
+    args = parser.parse_args(["--cache", cache, "-j", "2", "--force"])
+    sh = get_handler_from_args(parser, args, str(tmpdir))
+    assert isinstance(sh, SpreadsheetHandler)
+    assert (sh.cache_path, sh.jobs, args.force) == (cache, 2, True)
+
+    args = parser.parse_args(["--jobs", "0"])
+    with pytest.raises(SystemExit):
+        get_handler_from_args(parser, args, str(tmpdir))
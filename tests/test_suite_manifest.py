@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from amf_check_writer.suite_manifest import (SuiteManifest, MANIFEST_FILENAME,
+                                             build_suite_manifest,
+                                             write_suite_manifest, hash_suite)
+from amf_check_writer.check_runner import SuiteLoader, get_suite_files
+from amf_check_writer.amf_checker import identify_datasets
+from amf_check_writer.deployment_modes import DeploymentModes
+
+
+
+def test_build_suite_manifest(tmpdir, write_suite):
+    write_suite(tmpdir)
+    manifest = build_suite_manifest(str(tmpdir), "v2.0")
+
+    suite, = manifest["suites"]
+    assert (suite["product"], suite["mode"], suite["path"]) == \
+        ("prod", "land", "AMF_product_prod_land.yml")
+    assert suite["files"] == ["AMF_product_prod_land.yml", "AMF_file_info.yml",
+                              "AMF_product_prod_variable.yml",
+                              "AMF_global_attrs.yml"]
+
+    path = write_suite_manifest(manifest, str(tmpdir))
+    assert path == str(tmpdir.join(MANIFEST_FILENAME))
+    loaded = SuiteManifest.load(str(tmpdir))
+    entry = loaded.get_suite("prod", "land", "v2.0")
+    assert entry.path == str(tmpdir.join("AMF_product_prod_land.yml"))
+    assert entry.hash == hash_suite(get_suite_files(entry.path))
+    assert loaded.get_suite("prod", "sea", "v2.0") is None
+    assert loaded.get_products("v2.0") == {"prod"}
+
+
+def test_SuiteManifest_load_invalid(tmpdir):
+    assert SuiteManifest.load(str(tmpdir)) is None
+
+    tmpdir.join(MANIFEST_FILENAME).write(json.dumps({"format": 99}))
+    with pytest.raises(ValueError, match="Unsupported"):
+        SuiteManifest.load(str(tmpdir))
+
+    tmpdir.join(MANIFEST_FILENAME).write("{")
+    with pytest.raises(ValueError, match="Invalid suite manifest"):
+        SuiteManifest.load(str(tmpdir))
+
+
+def test_SuiteLoader_manifest(tmpdir, capsys, write_suite):
+    write_suite(tmpdir)
+    land, sea = DeploymentModes.LAND, DeploymentModes.SEA
+
+    # Without a manifest, suites are found by looking for files
+    loader = SuiteLoader(str(tmpdir), "v2.0")
+    assert loader.get_products() is None
+    suite_hash = loader.get_suite_hash("prod", land)
+
+    write_suite_manifest(build_suite_manifest(str(tmpdir), "v2.0"), str(tmpdir))
+    loader = SuiteLoader(str(tmpdir), "v2.0")
+    assert loader.get_products() == {"prod"}
+    assert loader.get_suite_hash("prod", land) == suite_hash
+    assert loader.find_suite("prod", land) == str(tmpdir.join("AMF_product_prod_land.yml"))
+
+    # A suite missing from the manifest is not found even if the file exists
+    tmpdir.join("AMF_product_prod_sea.yml").write("checks: []")
+    with pytest.raises(ValueError, match="suite manifest"):
+        loader.find_suite("prod", sea)
+
+    # Manifests for other versions are ignored
+    loader = SuiteLoader(str(tmpdir), "v1.1")
+    assert loader.manifest is None
+    assert "Ignoring the suite manifest" in capsys.readouterr().err
+    assert loader.find_suite("prod", sea)
+
+
+def test_identify_datasets_unknown_product(tmpdir):
+    path = str(tmpdir.join("instr_plat_19990101_other_v1.nc"))
+    # The file does not exist, so this fails if it is opened
+    (result,) = identify_datasets([path], products={"prod"})
+    assert result[:3] == (path, "other", None)
+    assert "Unknown data product 'other'" in result[3]
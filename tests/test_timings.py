@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from amf_check_writer.check_runner import run_checks
+from amf_check_writer.timings import (CheckTimer, TimingsSink,
+                                      aggregate_check_times,
+                                      format_slowest_checks,
+                                      format_prefetch_summary)
+
+
+def test_CheckTimer(tmpdir, dummy_checker, write_dataset):
+    timer = CheckTimer()
+    path = write_dataset(tmpdir.join("data.nc"), title="My data")
+    run_checks(dummy_checker, path, timer=timer)
+
+    timings = timer.to_dict()
+    assert list(timings["checks"]) == ["check_soft_file_size_limit",
+                                       "check_title_global_attribute"]
+    check_total = sum(t["wall"] for t in timings["checks"].values())
+    assert 0 <= check_total <= timings["wall"]
+
+    # Repeated measurements of a check are added together
+    with timer.measure("check_soft_file_size_limit"):
+        pass
+    assert timer.checks["check_soft_file_size_limit"][0] >= \
+        timings["checks"]["check_soft_file_size_limit"]["wall"]
+
+
+def _result(path, suite, **check_times):
+    checks = {check_id: {"wall": wall, "cpu": wall / 2}
+              for check_id, wall in check_times.items()}
+    return {"path": path, "suite": suite,
+            "timings": {"wall": sum(check_times.values()) + 1,
+                        "cpu": 1, "checks": checks}}
+
+
+def test_TimingsSink_and_slowest_checks(tmpdir):
+    path = str(tmpdir.join("timings.json"))
+    sink = TimingsSink(path)
+    sink.write(_result("a.nc", "suite_a", check_x=2, check_y=1))
+    sink.write(_result("b.nc", "suite_a", check_x=4, check_y=0.5))
+    sink.write(_result("c.nc", "suite_b", check_y=0.5))
+    # Results without timings, or reused from the cache, are ignored
+    sink.write(_result("d.nc", "suite_b", check_x=100), cached=True)
+    sink.write({"path": "e.nc", "suite": "suite_b", "timings": None})
+    sink.close()
+
+    with open(path) as f:
+        report = json.load(f)
+    assert [f["path"] for f in report["files"]] == ["a.nc", "b.nc", "c.nc"]
+    assert report["suites"]["suite_a"] == {"files": 2, "wall": 9.5, "cpu": 2}
+    assert report["checks"]["check_x"] == {"calls": 2, "wall": 6, "cpu": 3,
+                                           "max_wall": 4}
+
+    # Aggregate across two runs
+    checks = aggregate_check_times([report, report])
+    assert checks["check_y"] == {"calls": 6, "wall": 4, "cpu": 2,
+                                 "max_wall": 1}
+
+    lines = format_slowest_checks(checks).splitlines()
+    assert lines[0].split()[0] == "check_id"
+    assert [line.split()[0] for line in lines[1:]] == ["check_x", "check_y"]
+    assert format_slowest_checks(checks, top=1, sort_key="mean").count("\n") == 2
+
+
+def test_TimingsSink_prefetch(tmpdir):
+    path = str(tmpdir.join("timings.json"))
+    sink = TimingsSink(path)
+    for read, wait in ((0.5, 0.1), (0.3, 0)):
+        result = _result("a.nc", "suite_a", check_x=1)
+        result["timings"]["prefetch"] = {"read": read, "wait": wait}
+        sink.write(result)
+    sink.write(_result("b.nc", "suite_a", check_x=1))
+    sink.close()
+
+    with open(path) as f:
+        report = json.load(f)
+    assert report["files"][0]["prefetch"] == {"read": 0.5, "wait": 0.1}
+    assert "prefetch" not in report["files"][2]
+    assert report["prefetch"]["files"] == 2
+    assert report["prefetch"]["overlap"] == pytest.approx(0.7)
+
+    summary = format_prefetch_summary([report])
+    assert summary.startswith("Header prefetch: 2 files")
+    assert "87.5% overlapped" in summary
+    assert format_prefetch_summary([{"checks": {}}]) == ""
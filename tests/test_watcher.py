@@ -0,0 +1,72 @@
+import os
+import threading
+
+import pytest
+
+from amf_check_writer.watcher import (InotifyWatcher, PollingWatcher,
+                                      watch_directories)
+
+
+def _get_watchers(dirs):
+    watchers = [PollingWatcher(dirs, interval=0.05)]
+    try:
+        watchers.append(InotifyWatcher(dirs))
+    except OSError:
+        pass
+    return watchers
+
+
+def _write_later(path, delay, contents="data"):
+    def write():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(contents)
+    timer = threading.Timer(delay, write)
+    timer.start()
+    return timer
+
+
+@pytest.mark.parametrize("index", [0, 1])
+def test_watch_directories(tmpdir, index):
+    tmpdir.join("existing.nc").write("old")
+    watchers = _get_watchers([str(tmpdir)])
+    if index >= len(watchers):
+        pytest.skip("inotify not available")
+    watcher = watchers[index]
+
+    batches = watch_directories(watcher, settle=0.2,
+                                accept=lambda path: path.endswith(".nc"))
+    timers = [
+        _write_later(str(tmpdir.join("new.nc")), 0.05),
+        _write_later(str(tmpdir.join("ignored.txt")), 0.05),
+        _write_later(str(tmpdir.join("sub", "nested.nc")), 0.1),
+    ]
+    try:
+        found = []
+        while len(found) < 2:
+            found.extend(next(batches))
+    finally:
+        for timer in timers:
+            timer.join()
+        for w in watchers:
+            w.close()
+
+    assert sorted(found) == [str(tmpdir.join("new.nc")),
+                             str(tmpdir.join("sub", "nested.nc"))]
+
+
+def test_watch_directories_debounces_writes(tmpdir):
+    watcher = PollingWatcher([str(tmpdir)], interval=0.05)
+    path = str(tmpdir.join("growing.nc"))
+    # Keep writing to the file for longer than the settle time
+    timers = [_write_later(path, 0.1 * i, "x" * i) for i in range(1, 6)]
+
+    try:
+        batch = next(watch_directories(watcher, settle=0.3))
+    finally:
+        for timer in timers:
+            timer.join()
+
+    assert batch == [path]
+    with open(path) as f:
+        assert f.read() == "xxxxx"
@@ -0,0 +1,109 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from amf_check_writer.worker_pool import WorkerPool
+
+
+def _pid(value):
+    return os.getpid(), value
+
+
+def _exit_once(marker, value):
+    # Crash the first time, then succeed once the marker exists
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return value
+
+
+def _slow_pid(value):
+    time.sleep(0.2)
+    return _pid(value)
+
+
+def _allocate(size):
+    return len(bytearray(size))
+
+
+def _always_exit():
+    os._exit(1)
+
+
+def test_recycle_after_max_files():
+    pool = WorkerPool(1, max_files=2)
+    try:
+        results = [pool.submit(_pid, i).result() for i in range(5)]
+    finally:
+        pool.shutdown()
+
+    assert [value for _, value in results] == list(range(5))
+    pids = [pid for pid, _ in results]
+    assert pids[0] == pids[1]
+    assert pids[1] != pids[2]
+    assert pool.recycled == 2
+
+
+def test_recycle_after_max_bytes():
+    pool = WorkerPool(1, max_bytes=100)
+    try:
+        tasks = [pool.submit(_pid, i, size=60) for i in range(4)]
+        [task.result() for task in tasks]
+    finally:
+        pool.shutdown()
+    assert pool.recycled == 2
+
+
+def test_per_worker_limits():
+    # Each worker counts its own files: the four slow tasks are shared
+    # between the two workers, which are each replaced after two files
+    pool = WorkerPool(2, max_files=2)
+    try:
+        tasks = [pool.submit(_slow_pid, i) for i in range(4)]
+        pids = [task.result()[0] for task in tasks]
+        assert len(set(pids)) == 2
+        assert pool.recycled == 2
+        pids.append(pool.submit(_pid, 4).result()[0])
+    finally:
+        pool.shutdown()
+    assert len(set(pids)) == 3
+
+
+def test_max_memory():
+    pool = WorkerPool(1, max_memory=512 * 2 ** 20)
+    try:
+        assert pool.submit(_allocate, 2 ** 20).result() == 2 ** 20
+        # Enforced inside the worker, while the task runs
+        task = pool.submit(_allocate, 2 ** 30)
+        with pytest.raises(MemoryError, match="512 MiB"):
+            task.result()
+        assert task.attempts == 2
+        assert pool.recycled == 2
+        # Later tasks get a new worker
+        assert pool.submit(_allocate, 2 ** 20).result() == 2 ** 20
+    finally:
+        pool.shutdown()
+
+
+def test_retry_after_crash(tmpdir):
+    marker = str(tmpdir.join("marker"))
+    pool = WorkerPool(2)
+    try:
+        assert pool.submit(_exit_once, marker, "ok").result() == "ok"
+        # The pool keeps working afterwards
+        assert pool.submit(_pid, 1).result()[1] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_crash_after_retries():
+    pool = WorkerPool(1, retries=1)
+    try:
+        task = pool.submit(_always_exit)
+        with pytest.raises(BrokenProcessPool):
+            task.result()
+        assert task.attempts == 2
+    finally:
+        pool.shutdown()